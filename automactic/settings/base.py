@@ -60,10 +60,16 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'automactic.wsgi.application'
 
+# Serve the async variants of views that wait on ClearPass. Enabled by asgi.py, for uvicorn workers.
+ASYNC_VIEWS = os.environ.get('AMAC_ASYNC_VIEWS', 'false').lower() == 'true'
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 AUTH_USER_MODEL = 'login.User'
 
+# ModelBackend, reusing the user the login form already loaded (see login/context.py)
+AUTHENTICATION_BACKENDS = ['login.backends.UserContextBackend']
+
 PASSWORD_HASHERS = [
     'django.contrib.auth.hashers.PBKDF2PasswordHasher',
     'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
@@ -185,3 +191,67 @@ LOGGING = {
 }
 
 MACADDRESS_DEFAULT_DIALECT = 'netaddr.mac_unix_expanded'
+
+# Login rate limit counters (login/ratelimit.py) are kept this long. Must exceed every rateLimit/uniqueMacIntervalByHours.
+RATE_LIMIT_RETENTION = float(os.environ.get('AMAC_RATE_LIMIT_RETENTION_HOURS', 48)) * 3600
+
+# Permissions are loaded once per process (see PermissionTree). Changes made in another process are picked up at the
+# first lookup this many seconds after the last check for changes.
+PERMISSIONS_CHECK_INTERVAL = float(os.environ.get('AMAC_PERMISSIONS_CHECK_INTERVAL', 1))
+
+# dnsmasq lease file, used to find the MAC address of a client IP. It is indexed per process and only re-read when it
+# changes. With DNSMASQ_WATCH_LEASES (needs inotify_simple), changes are noticed with inotify instead of stat().
+DNSMASQ_LEASE_FILE = os.environ.get('AMAC_DNSMASQ_LEASE_FILE', '/var/lib/misc/dnsmasq.leases')
+DNSMASQ_WATCH_LEASES = os.environ.get('AMAC_DNSMASQ_WATCH_LEASES', 'false').lower() == 'true'
+# Lease store written by dnsmasq's --dhcp-script (login/dhcp_script.py). If set, it is used instead of the lease file,
+# which is only read while the store is missing or locked.
+DNSMASQ_LEASE_STORE = os.environ.get('AMAC_DNSMASQ_LEASE_STORE', '')
+
+# ClearPass API
+# One pooled client is kept per worker process. Timeouts are in seconds, per operation.
+# https://www.python-httpx.org/advanced/#pool-limit-configuration
+
+CLEARPASS_API = {
+    'MAX_CONNECTIONS': int(os.environ.get('CPPM_MAX_CONNECTIONS', 20)),
+    'MAX_KEEPALIVE_CONNECTIONS': int(os.environ.get('CPPM_MAX_KEEPALIVE_CONNECTIONS', 10)),
+    'KEEPALIVE_EXPIRY': float(os.environ.get('CPPM_KEEPALIVE_EXPIRY', 60)),
+    'HTTP2': os.environ.get('CPPM_HTTP2', 'false').lower() == 'true',
+    'CONNECT_TIMEOUT': float(os.environ.get('CPPM_CONNECT_TIMEOUT', 3)),
+    # Renew the OAuth token in the background once it is this close (seconds) to expiring
+    'TOKEN_REFRESH_MARGIN': float(os.environ.get('CPPM_TOKEN_REFRESH_MARGIN', 300)),
+    # File holding the current OAuth token, shared by all workers on the host. Set to an empty string to disable.
+    # Its directory is created private to the service user, keep it out of shared directories such as /tmp.
+    'TOKEN_CACHE': os.environ.get('CPPM_TOKEN_CACHE', str(BASE_DIR / 'var' / 'cppm-token.json')),
+    # Device lookups are cached per process. "Not found" answers are kept for less time.
+    'DEVICE_CACHE_SIZE': int(os.environ.get('CPPM_DEVICE_CACHE_SIZE', 4096)),
+    'DEVICE_CACHE_TTL': float(os.environ.get('CPPM_DEVICE_CACHE_TTL', 60)),
+    'DEVICE_CACHE_NEGATIVE_TTL': float(os.environ.get('CPPM_DEVICE_CACHE_NEGATIVE_TTL', 10)),
+    # Admin bulk actions: parallel ClearPass calls, and the requests per second they may make in total
+    'BULK_CONCURRENCY': int(os.environ.get('CPPM_BULK_CONCURRENCY', 8)),
+    'BULK_RATE': float(os.environ.get('CPPM_BULK_RATE', 20)),
+    # Lookups (GET) are retried on connection errors and 502/503/504, with jittered exponential backoff
+    'RETRIES': int(os.environ.get('CPPM_RETRIES', 2)),
+    'RETRY_BACKOFF': float(os.environ.get('CPPM_RETRY_BACKOFF', 0.2)),
+    # Fail fast once this share of the last BREAKER_WINDOW calls failed, then probe again after the cooldown (seconds)
+    'BREAKER_WINDOW': int(os.environ.get('CPPM_BREAKER_WINDOW', 20)),
+    'BREAKER_MIN_CALLS': int(os.environ.get('CPPM_BREAKER_MIN_CALLS', 10)),
+    'BREAKER_FAILURE_RATE': float(os.environ.get('CPPM_BREAKER_FAILURE_RATE', 0.5)),
+    'BREAKER_COOLDOWN': float(os.environ.get('CPPM_BREAKER_COOLDOWN', 30)),
+    # Total seconds a login request may spend waiting on ClearPass, retries included
+    'REQUEST_BUDGET': float(os.environ.get('CPPM_REQUEST_BUDGET', 10)),
+    # Each process writes its ClearPass call metrics here, so the metrics view can sum all workers. Like the token
+    # cache, it must be private to the service user. Set to an empty string to only report the process serving the view.
+    'METRICS_DIR': os.environ.get('CPPM_METRICS_DIR', str(BASE_DIR / 'var' / 'metrics')),
+    # Logins queue device registrations for `manage.py devicequeue` instead of waiting on ClearPass.
+    # Only enable this where the devicequeue worker runs, otherwise queued registrations are never written.
+    'WRITE_BEHIND': os.environ.get('CPPM_WRITE_BEHIND', 'false').lower() == 'true',
+    'QUEUE_BATCH': int(os.environ.get('CPPM_QUEUE_BATCH', 50)),
+    'QUEUE_MAX_ATTEMPTS': int(os.environ.get('CPPM_QUEUE_MAX_ATTEMPTS', 8)),
+    # Seconds before the first retry of a failed registration, doubled on every further attempt
+    'QUEUE_BACKOFF': float(os.environ.get('CPPM_QUEUE_BACKOFF', 2)),
+    'TIMEOUTS': {
+        'oauth': float(os.environ.get('CPPM_OAUTH_TIMEOUT', 5)),
+        'read': float(os.environ.get('CPPM_READ_TIMEOUT', 5)),
+        'write': float(os.environ.get('CPPM_WRITE_TIMEOUT', 10)),
+    },
+}
@@ -0,0 +1,4 @@
+"""
+Microbenchmarks for hot paths. Run from the project root, e.g. `python -m benchmarks.response_data`.
+They are not part of the test suite, and report timings instead of asserting them.
+"""
@@ -0,0 +1,21 @@
+"""Django against a throwaway SQLite database, for benchmarks that need the ORM"""
+import logging
+import os
+from pathlib import Path
+
+import django
+
+
+def setup(directory: os.PathLike):
+    """Sets Django up on a new, migrated database in `directory`. Call before importing models."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'automactic.settings')
+    from django.conf import settings
+
+    settings.DATABASES['default'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': Path(directory) / 'db.sqlite3'}
+    # Every query is logged in debug mode, which would be most of what is measured
+    settings.DEBUG = False
+    logging.disable(logging.CRITICAL)
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
@@ -0,0 +1,437 @@
+"""
+A stand-in for the part of the ClearPass REST API that interface/api.py uses, for load tests and benchmarks that must
+not touch the real server: /oauth, /device (with filter, sort and _embedded paging), /device/mac/{mac} and
+/device/{id}. Latency, error rates, token expiry and rate limiting are configurable.
+
+    $ python -m benchmarks.fake_clearpass --port 8089 --devices 5000 --read-latency lognormal:-3.5,0.6
+    $ BASE_URL=http://127.0.0.1:8089/api python manage.py runserver
+
+Latency specs are `fixed:S`, `uniform:LOW,HIGH`, `exp:MEAN` or `lognormal:MU,SIGMA` (seconds, as in
+random.lognormvariate). GET /_fake/stats returns request counts per route, POST /_fake/reset zeroes them.
+Tests and benchmarks can run the server in-process with `FakeClearPass(...).running()`, see interface/tests.
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator, Optional
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from netaddr import EUI, AddrFormatError
+
+
+def latency(spec: str) -> Callable[[], float]:
+    """Parses a latency spec (see the module docstring) into a function returning one delay in seconds"""
+    kind, _, args = spec.partition(':')
+    values = [float(arg) for arg in args.split(',') if arg]
+    distributions = {
+        'fixed': lambda s: lambda: s,
+        'uniform': lambda low, high: lambda: random.uniform(low, high),
+        'exp': lambda mean: lambda: random.expovariate(1 / mean),
+        'lognormal': lambda mu, sigma: lambda: random.lognormvariate(mu, sigma),
+    }
+    if kind not in distributions:
+        raise argparse.ArgumentTypeError(f'Unknown latency distribution {kind!r}')
+    try:
+        return distributions[kind](*values)
+    except TypeError:
+        raise argparse.ArgumentTypeError(f'Wrong number of arguments in latency spec {spec!r}')
+
+
+@dataclass
+class Faults:
+    read_latency: Callable[[], float] = latency('fixed:0')
+    write_latency: Callable[[], float] = latency('fixed:0')
+    # Share of device requests answered with one of `error_codes`
+    error_rate: float = 0.0
+    error_codes: tuple[int, ...] = (500, 502, 503)
+    # Share of device requests whose connection is closed without an answer
+    drop_rate: float = 0.0
+    # Seconds a token stays valid. Expired tokens get a 401, like ClearPass.
+    token_ttl: float = 28800
+    # Requests per second across all clients, answered with 429 above that. 0 disables the limit.
+    rate_limit: float = 0.0
+
+
+@dataclass
+class DeviceStore:
+    """The fake's device table. Every method is called with `lock` held."""
+    devices: dict[int, dict] = field(default_factory=dict)
+    by_mac: dict[str, int] = field(default_factory=dict)
+    ids: Iterator[int] = field(default_factory=lambda: itertools.count(3000))
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def add(self, body: dict) -> dict:
+        device = {
+            'id': next(self.ids),
+            'mac': '',
+            'notes': None,
+            'enabled': True,
+            'role_id': 2,
+            'start_time': int(time.time()),
+            'expire_time': None,
+            'sponsor_name': 'fake',
+            'visitor_name': None,
+            'do_expire': 4,
+            **body,
+        }
+        device['mac'] = normalize_mac(device['mac'])
+        self.devices[device['id']] = device
+        self.by_mac[device['mac']] = device['id']
+        return device
+
+    def update(self, device: dict, body: dict) -> dict:
+        del self.by_mac[device['mac']]
+        device.update(body, id=device['id'])
+        device['mac'] = normalize_mac(device['mac'])
+        self.by_mac[device['mac']] = device['id']
+        return device
+
+    def delete(self, device: dict):
+        del self.devices[device['id']]
+        del self.by_mac[device['mac']]
+
+    def find(self, mac: Optional[str] = None, device_id: Optional[int] = None) -> Optional[dict]:
+        if mac is not None:
+            device_id = self.by_mac.get(normalize_mac(mac))
+        return self.devices.get(device_id)
+
+    def query(self, filters: dict, sort: str) -> list[dict]:
+        devices = [device for device in self.devices.values() if matches(device, filters)]
+        key = sort.lstrip('+-') or 'id'
+        devices.sort(key=lambda device: sort_key(device.get(key)), reverse=sort.startswith('-'))
+        return devices
+
+    def seed(self, count: int, users: int):
+        start = int(time.time()) - count
+        for i in range(count):
+            self.add({
+                'mac': f'00-16-3e-{i >> 16 & 0xff:02x}-{i >> 8 & 0xff:02x}-{i & 0xff:02x}',
+                'notes': f'Device {i}',
+                'start_time': start + i,
+                'expire_time': start + i + 86400 * 365,
+                'visitor_name': f'S:{200000000 + i % users}',
+            })
+
+
+def normalize_mac(mac) -> str:
+    try:
+        return str(EUI(mac))
+    except (AddrFormatError, TypeError, ValueError):
+        return str(mac)
+
+
+def sort_key(value):
+    # ClearPass times are UNIX timestamps, sent as numbers or numeric strings
+    try:
+        return 0, float(value)
+    except (TypeError, ValueError):
+        return 1, str(value)
+
+
+_operators = {
+    '$eq': lambda a, b: a == b,
+    '$ne': lambda a, b: a != b,
+    '$gt': lambda a, b: sort_key(a) > sort_key(b),
+    '$gte': lambda a, b: sort_key(a) >= sort_key(b),
+    '$lt': lambda a, b: sort_key(a) < sort_key(b),
+    '$lte': lambda a, b: sort_key(a) <= sort_key(b),
+    '$in': lambda a, b: a in b,
+    '$contains': lambda a, b: b in str(a or ''),
+}
+
+
+def matches(device: dict, filters: dict) -> bool:
+    """The subset of ClearPass' filter language the client uses: exact values, and {"$op": value} per field"""
+    for name, condition in filters.items():
+        value = device.get(name)
+        if isinstance(condition, dict):
+            if not all(_operators[op](value, operand) for op, operand in condition.items()):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeClearPass(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int] = ('127.0.0.1', 0), faults: Optional[Faults] = None,
+                 client_id: Optional[str] = None, client_secret: Optional[str] = None, prefix: str = '/api'):
+        super().__init__(address, FakeClearPassHandler)
+        self.faults = faults or Faults()
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.prefix = prefix.rstrip('/')
+        self.store = DeviceStore()
+        self.tokens: dict[str, float] = {}
+        self.stats: Counter = Counter()
+        self._allowance = self.faults.rate_limit
+        self._last_check = time.monotonic()
+        self._state_lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}{self.prefix}'
+
+    @contextmanager
+    def running(self):
+        """Serves from a background thread for the duration of the block"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True, name='FakeClearPass')
+        thread.start()
+        try:
+            yield self
+        finally:
+            self.shutdown()
+            self.server_close()
+
+    def issue_token(self) -> str:
+        token = uuid.uuid4().hex
+        with self._state_lock:
+            self.tokens[token] = time.time() + self.faults.token_ttl
+        return token
+
+    def token_valid(self, token: str) -> bool:
+        with self._state_lock:
+            return self.tokens.get(token, 0) > time.time()
+
+    def rate_limited(self) -> bool:
+        """Token bucket with a one second burst"""
+        if not self.faults.rate_limit:
+            return False
+        with self._state_lock:
+            now = time.monotonic()
+            rate = self.faults.rate_limit
+            self._allowance = min(rate, self._allowance + (now - self._last_check) * rate)
+            self._last_check = now
+            if self._allowance < 1:
+                return True
+            self._allowance -= 1
+            return False
+
+    def count(self, route: str):
+        with self._state_lock:
+            self.stats[route] += 1
+
+
+class FakeClearPassHandler(BaseHTTPRequestHandler):
+    server: FakeClearPass
+    protocol_version = 'HTTP/1.1'
+
+    routes = [
+        ('POST', re.compile(r'/oauth'), 'oauth'),
+        ('GET', re.compile(r'/device'), 'list_devices'),
+        ('POST', re.compile(r'/device'), 'add_device'),
+        ('GET', re.compile(r'/device/mac/(?P<mac>[^/]+)'), 'get_device'),
+        ('GET', re.compile(r'/device/(?P<device_id>\d+)'), 'get_device'),
+        ('PATCH', re.compile(r'/device/mac/(?P<mac>[^/]+)'), 'update_device'),
+        ('PATCH', re.compile(r'/device/(?P<device_id>\d+)'), 'update_device'),
+        ('DELETE', re.compile(r'/device/mac/(?P<mac>[^/]+)'), 'delete_device'),
+        ('DELETE', re.compile(r'/device/(?P<device_id>\d+)'), 'delete_device'),
+    ]
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PATCH(self):
+        self.dispatch('PATCH')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def log_message(self, format, *args):
+        # One line per request would drown out the benchmark's own output
+        pass
+
+    def dispatch(self, method: str):
+        url = urlsplit(self.path)
+        self.query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        if url.path.startswith('/_fake/'):
+            return self.control(method, url.path)
+
+        path = url.path[len(self.server.prefix):] if url.path.startswith(self.server.prefix) else None
+        for route_method, pattern, name in self.routes:
+            if path is not None and route_method == method and (match := pattern.fullmatch(path)):
+                break
+        else:
+            return self.problem(404, 'Not Found', f'No route for {method} {url.path}')
+
+        self.server.count(f'{method} {name}')
+        faults = self.server.faults
+        time.sleep(max(0.0, (faults.read_latency if method == 'GET' else faults.write_latency)()))
+
+        if self.server.rate_limited():
+            return self.problem(429, 'Too Many Requests', 'Rate limit exceeded', {'Retry-After': '1'})
+        if name != 'oauth':
+            if random.random() < faults.drop_rate:
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+            if random.random() < faults.error_rate:
+                return self.problem(random.choice(faults.error_codes), 'Injected Error', 'Fault injection')
+            token = self.headers.get('Authorization', '').removeprefix('Bearer ')
+            if not self.server.token_valid(token):
+                return self.problem(401, 'Unauthorized', 'The access token is invalid or has expired')
+
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            return self.problem(400, 'Bad Request', 'Body is not JSON')
+
+        getattr(self, name)(data, **match.groupdict())
+
+    # Routes
+
+    def oauth(self, data: dict):
+        server = self.server
+        if data.get('grant_type') != 'client_credentials':
+            return self.problem(400, 'Bad Request', 'Unsupported grant_type')
+        if (server.client_id is not None and data.get('client_id') != server.client_id) or \
+                (server.client_secret is not None and data.get('client_secret') != server.client_secret):
+            return self.problem(400, 'Bad Request', 'Invalid client credentials')
+        self.send_json(200, {
+            'access_token': server.issue_token(),
+            'expires_in': int(server.faults.token_ttl),
+            'token_type': 'Bearer',
+            'scope': None,
+        })
+
+    def list_devices(self, data: dict):
+        try:
+            filters = json.loads(self.query.get('filter', '{}'))
+            offset = int(self.query.get('offset', 0))
+            limit = int(self.query.get('limit', 25))
+        except ValueError:
+            return self.problem(400, 'Bad Request', 'Invalid filter, offset or limit')
+        if not 1 <= limit <= 1000:
+            return self.problem(422, 'Unprocessable Entity', 'limit must be between 1 and 1000')
+
+        sort = self.query.get('sort', '+id')
+        with self.server.store.lock:
+            devices = self.server.store.query(filters, sort)
+            items = [dict(device) for device in devices[offset:offset + limit]]
+
+        links = {'self': {'href': self.link(offset, limit)}, 'first': {'href': self.link(0, limit)}}
+        if offset + limit < len(devices):
+            links['next'] = {'href': self.link(offset + limit, limit)}
+        if offset > 0:
+            links['previous'] = {'href': self.link(max(0, offset - limit), limit)}
+        response = {'_links': links, '_embedded': {'items': items}}
+        if self.query.get('calculate_count') == 'true':
+            response['count'] = len(devices)
+        self.send_json(200, response)
+
+    def add_device(self, data: dict):
+        if not data.get('mac'):
+            return self.problem(422, 'Unprocessable Entity', 'mac is required')
+        with self.server.store.lock:
+            if self.server.store.find(mac=data['mac']) is not None:
+                return self.problem(422, 'Unprocessable Entity', f'A device with MAC {data["mac"]} already exists')
+            device = dict(self.server.store.add(data))
+        self.send_json(201, device)
+
+    def get_device(self, data: dict, mac: Optional[str] = None, device_id: Optional[str] = None):
+        with self.server.store.lock:
+            device = self.server.store.find(mac, device_id and int(device_id))
+            device = dict(device) if device is not None else None
+        if device is None:
+            return self.problem(404, 'Not Found', 'Device not found')
+        self.send_json(200, device)
+
+    def update_device(self, data: dict, mac: Optional[str] = None, device_id: Optional[str] = None):
+        with self.server.store.lock:
+            store = self.server.store
+            if (device := store.find(mac, device_id and int(device_id))) is None:
+                return self.problem(404, 'Not Found', 'Device not found')
+            if 'mac' in data and (other := store.find(mac=data['mac'])) is not None and other is not device:
+                return self.problem(422, 'Unprocessable Entity', f'A device with MAC {data["mac"]} already exists')
+            device = dict(store.update(device, data))
+        self.send_json(200, device)
+
+    def delete_device(self, data: dict, mac: Optional[str] = None, device_id: Optional[str] = None):
+        with self.server.store.lock:
+            if (device := self.server.store.find(mac, device_id and int(device_id))) is None:
+                return self.problem(404, 'Not Found', 'Device not found')
+            self.server.store.delete(device)
+        self.send_json(204, None)
+
+    def control(self, method: str, path: str):
+        if method == 'GET' and path == '/_fake/stats':
+            with self.server.store.lock:
+                devices = len(self.server.store.devices)
+            return self.send_json(200, {'devices': devices, 'requests': dict(self.server.stats)})
+        if method == 'POST' and path == '/_fake/reset':
+            self.server.stats.clear()
+            return self.send_json(204, None)
+        self.problem(404, 'Not Found', f'No route for {method} {path}')
+
+    # Responses
+
+    def link(self, offset: int, limit: int) -> str:
+        query = {**self.query, 'offset': offset, 'limit': limit}
+        return f'{self.server.base_url}/device?{urlencode(query)}'
+
+    def problem(self, status: int, title: str, detail: str, headers: Optional[dict] = None):
+        """Errors are RFC 7807 problem documents, as ClearPass sends them"""
+        self.send_json(status, {'type': 'http://www.w3.org/Protocols/rfc2616/rfc2616-sec10.html',
+                                'title': title, 'status': status, 'detail': detail}, headers)
+
+    def send_json(self, status: int, body, headers: Optional[dict] = None):
+        content = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/problem+json' if status >= 400 else 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--prefix', default='/api', help='Path the API is served under (BASE_URL = host + prefix)')
+    parser.add_argument('--devices', type=int, default=0, help='Devices to create on startup')
+    parser.add_argument('--users', type=int, default=1000, help='Visitor names the seeded devices are spread over')
+    parser.add_argument('--client-id', help='Only accept this client_id (default: any)')
+    parser.add_argument('--client-secret', help='Only accept this client_secret (default: any)')
+    parser.add_argument('--read-latency', type=latency, default=latency('fixed:0'))
+    parser.add_argument('--write-latency', type=latency, default=latency('fixed:0'))
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-codes', type=lambda codes: tuple(int(code) for code in codes.split(',')),
+                        default=(500, 502, 503))
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    parser.add_argument('--token-ttl', type=float, default=28800)
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='Requests per second, 0 for no limit')
+    args = parser.parse_args()
+
+    faults = Faults(read_latency=args.read_latency, write_latency=args.write_latency, error_rate=args.error_rate,
+                    error_codes=args.error_codes, drop_rate=args.drop_rate, token_ttl=args.token_ttl,
+                    rate_limit=args.rate_limit)
+    server = FakeClearPass((args.host, args.port), faults, args.client_id, args.client_secret, args.prefix)
+    server.store.seed(args.devices, args.users)
+    print(f'Fake ClearPass with {args.devices} devices at {server.base_url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
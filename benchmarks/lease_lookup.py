@@ -0,0 +1,68 @@
+"""
+Finding the MAC address of a client IP in the dnsmasq lease file: the old line-by-line scan against LeaseIndex, on a
+synthetic lease file filling most of the /16 DHCP range.
+
+    $ python -m benchmarks.lease_lookup [--leases 60000] [--lookups 2000]
+"""
+import argparse
+import random
+import tempfile
+import time
+import timeit
+from pathlib import Path
+
+from login.leases import LeaseIndex
+
+
+def write_leases(path: Path, count: int) -> list[str]:
+    expiry = int(time.time()) + 3600
+    ips = []
+    with open(path, 'w') as fp:
+        for i in range(count):
+            ip = f'172.16.{5 + i // 250}.{5 + i % 250}'
+            hostname = f'device-{i}' if i % 3 else '*'
+            fp.write(f'{expiry + i % 3600} 00:16:3e:{i >> 16 & 0xff:02x}:{i >> 8 & 0xff:02x}:{i & 0xff:02x} '
+                     f'{ip} {hostname} 01:00:16:3e:{i >> 16 & 0xff:02x}:{i >> 8 & 0xff:02x}:{i & 0xff:02x}\n')
+            ips.append(ip)
+    return ips
+
+
+def scan(path: Path, ip: str):
+    """attach_mac_to_session's lookup as it was"""
+    with open(path) as fp:
+        for line in fp:
+            line = line.strip().split(maxsplit=4)
+            if line[2] == ip:
+                return line[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leases', type=int, default=60000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'dnsmasq.leases'
+        ips = write_leases(path, args.leases)
+        sample = random.choices(ips, k=args.lookups)
+        index = LeaseIndex(path)
+
+        def rebuild():
+            index._signature = None
+            index.refresh()
+
+        build = min(timeit.repeat(rebuild, number=1, repeat=5))
+        scan_lookups = max(1, args.lookups // 100)
+        scanned = min(timeit.repeat(lambda: [scan(path, ip) for ip in sample[:scan_lookups]], number=1, repeat=3))
+        indexed = min(timeit.repeat(lambda: [index.get(ip) for ip in sample], number=1, repeat=5))
+
+        assert index.get(ips[-1]).mac == scan(path, ips[-1])
+        print(f'{args.leases} leases, {path.stat().st_size / 1024:.0f} KiB')
+        print(f'{"scan, per lookup":<40} {scanned / scan_lookups * 1e6:>10.1f} us')
+        print(f'{"index build (file changed)":<40} {build * 1e6:>10.1f} us')
+        print(f'{"index, per lookup (stat + dict)":<40} {indexed / args.lookups * 1e6:>10.1f} us')
+
+
+if __name__ == '__main__':
+    main()
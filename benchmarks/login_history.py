@@ -0,0 +1,119 @@
+"""
+Query plans and timings of the LoginHistory queries in the tree, before and after migration 0008's indexes, on a
+throwaway SQLite database seeded with millions of rows. Login rate limits no longer read LoginHistory (see
+login/ratelimit.py), so these are the admin's queries and the 0007 backfill.
+
+    $ set -a; . ./debug.env; set +a
+    $ python -m benchmarks.login_history [--rows 2000000] [--users 5000] [--output plans.json]
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+import timeit
+from datetime import datetime, timedelta, timezone
+
+from benchmarks import django_db
+
+
+def seed(rows: int, users: int) -> list[int]:
+    from django.db import connection, transaction
+    from login.models import User, UserType
+
+    usertype = UserType.objects.create(name='Student')
+    User.objects.bulk_create([User(username=f'user{n}', type=usertype, password='!') for n in range(users)],
+                             batch_size=1000)
+    user_ids = list(User.objects.values_list('pk', flat=True))
+
+    rng = random.Random(0)
+    macs = [f'00:16:3e:{i >> 16 & 0xff:02x}:{i >> 8 & 0xff:02x}:{i & 0xff:02x}' for i in range(users * 2)]
+    start = datetime.now(timezone.utc) - timedelta(days=365)
+    with transaction.atomic(), connection.cursor() as cursor:
+        for offset in range(0, rows, 50000):
+            batch = []
+            for i in range(offset, min(rows, offset + 50000)):
+                logged_in = rng.random() > 0.1
+                # Spread over the year, in order, as rows are written in production
+                batch.append((start + timedelta(seconds=i * 365 * 86400 / rows), rng.choice(user_ids),
+                              rng.choice(macs), '172.19.0.1', '', logged_in, logged_in and rng.random() < 0.3))
+            cursor.executemany('INSERT INTO login_loginhistory (time, user_id, mac_address, ip, host, logged_in, '
+                               'mac_updated) VALUES (%s, %s, %s, %s, %s, %s, %s)', batch)
+    return user_ids
+
+
+def hot_queries(user_id: int) -> dict:
+    from django.conf import settings
+    from login.models import LoginHistory
+
+    now = datetime.now(timezone.utc)
+    history = LoginHistory.objects
+    return {
+        # LoginHistoryAdmin: ordering = ('time',), the changelist adds -pk
+        'admin changelist': history.order_by('time', '-pk')[:100],
+        # Its list_filter on time, "past 7 days"
+        'admin changelist, past 7 days': (history.filter(time__gte=now - timedelta(days=7))
+                                          .order_by('time', '-pk')[:100]),
+        # UserAdmin.get_login_history
+        "a user's history": history.filter(user_id=user_id).order_by('time'),
+        # Migration 0007's backfill of the rate limit counters
+        '0007 backfill': history.filter(time__gte=now - timedelta(seconds=settings.RATE_LIMIT_RETENTION)).values_list(
+            'user_id', 'mac_address', 'time', 'logged_in', 'mac_updated'),
+    }
+
+
+def measure(label: str, repeat: int) -> dict:
+    from login.models import LoginHistory
+
+    sample = LoginHistory.objects.order_by('-pk').values_list('user_id', flat=True).first()
+    results = {}
+    print(f'\n== {label}')
+    for name, queryset in hot_queries(sample).items():
+        seconds = min(timeit.repeat(lambda: list(queryset.all()), number=1, repeat=repeat))
+        plan = queryset.explain()
+        results[name] = {'ms': round(seconds * 1000, 3), 'plan': plan}
+        print(f'{name:<35} {seconds * 1000:>10.2f} ms')
+        for line in plan.splitlines():
+            print(f'    {line}')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Also write the plans and timings to this JSON file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        django_db.setup(tmp)
+        from django.core.management import call_command
+        from django.db import connection
+
+        call_command('migrate', 'login', '0007', verbosity=0)
+        start = time.perf_counter()
+        seed(args.rows, args.users)
+        print(f'Seeded {args.rows} rows for {args.users} users in {time.perf_counter() - start:.1f} s')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        before = measure('Before 0008_loginhistory_indexes', args.repeat)
+        start = time.perf_counter()
+        call_command('migrate', 'login', verbosity=0)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        print(f'\nBuilt the indexes in {time.perf_counter() - start:.1f} s')
+        after = measure('After', args.repeat)
+
+        print(f'\n{"":<35} {"before":>10} {"after":>10}')
+        for name in before:
+            print(f'{name:<35} {before[name]["ms"]:>8.2f}ms {after[name]["ms"]:>8.2f}ms')
+
+        if args.output:
+            with open(args.output, 'w') as fp:
+                json.dump({'rows': args.rows, 'users': args.users, 'before': before, 'after': after}, fp, indent=2)
+
+
+if __name__ == '__main__':
+    main()
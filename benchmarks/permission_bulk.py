@@ -0,0 +1,110 @@
+"""
+Resolving every effective permission of a user (PermissionsManager.get_bulk): the old N+1 resolution, with two
+queries per overridden node, against the single statement. Runs on a throwaway SQLite database seeded with
+thousands of nodes.
+
+    $ set -a; . ./debug.env; set +a
+    $ python -m benchmarks.permission_bulk [--users 500] [--nodes 200] [--repeat 20]
+"""
+import argparse
+import tempfile
+import timeit
+
+from benchmarks import django_db
+
+
+def get_bulk_as_it_was(manager, user):
+    """get_bulk as it was, for a user, with user type and global nodes"""
+    from django.db.models import Case, Count, Min, Q, When
+    from django.db.models.functions import Substr
+
+    user_prefix = f'user/{user.username.lower()}/'
+    group_prefix = f'userType/{user.type.name.lower()}/'
+    global_prefix = 'global/'
+    all_related_perms = (
+        manager.filter(
+            Q(permission__startswith=group_prefix)
+            | Q(permission__startswith=user_prefix)
+            | Q(permission__startswith=global_prefix))
+        .annotate(suffix=Case(
+            When(permission__startswith=user_prefix, then=Substr('permission', len(user_prefix) + 1)),
+            When(permission__startswith=group_prefix, then=Substr('permission', len(group_prefix) + 1)),
+            When(permission__startswith=global_prefix, then=Substr('permission', len(global_prefix) + 1)),
+        ), priority=Case(
+            When(permission__startswith=user_prefix, then=1),
+            When(permission__startswith=group_prefix, then=2),
+            When(permission__startswith=global_prefix, then=3),
+        ))
+    )
+    unique_perm_nodes = (all_related_perms
+                         .values('suffix')
+                         .annotate(dcount=Count('suffix'))
+                         .filter(dcount__gt=1)
+                         .values_list('suffix', flat=True))
+    lowest_priority = lambda s: all_related_perms.filter(suffix=s).aggregate(Min('priority'))['priority__min']
+    exclusion_list = [
+        pk
+        for node in unique_perm_nodes
+        for pk in
+        all_related_perms.filter(
+            Q(suffix=node) & ~Q(priority=lowest_priority(node))
+        ).values_list('id', flat=True)
+    ]
+    return all_related_perms.exclude(id__in=exclusion_list)
+
+
+def seed(users: int, nodes: int):
+    """`nodes` global nodes, half of them set again per user type, a tenth of them again per user"""
+    from login.models import Permissions, User, UserType
+
+    types = [UserType.objects.create(name=name) for name in ('Student', 'Faculty', 'Guest')]
+    rows = [Permissions(permission=f'global/bench/node{i}', raw_value=str(i), type=2) for i in range(nodes)]
+    for usertype in types:
+        rows += [Permissions(permission=f'userType/{usertype.name.lower()}/bench/node{i}', raw_value=str(i), type=2)
+                 for i in range(0, nodes, 2)]
+    for n in range(users):
+        user = User.objects.create(username=f'user{n}', type=types[n % len(types)])
+        rows += [Permissions(permission=f'user/{user.username}/bench/node{i}', raw_value=str(i), type=2)
+                 for i in range(n % 10, nodes, 10)]
+    # bulk_create skips save(), and with it the PermissionsVersion bump: nothing is cached yet
+    Permissions.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--nodes', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        django_db.setup(tmp)
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from login.models import Permissions, User
+
+        total = seed(args.users, args.nodes)
+        user = User.objects.get(username='user1')
+
+        with CaptureQueriesContext(connection) as old_queries:
+            old = {(p.pk, p.suffix) for p in get_bulk_as_it_was(Permissions.objects, user)}
+        with CaptureQueriesContext(connection) as new_queries:
+            new = {(p.pk, p.suffix) for p in Permissions.objects.get_bulk(user)}
+        assert old == new, 'Results differ'
+        assert len(new_queries) == 1, f'get_bulk ran {len(new_queries)} queries'
+
+        old_time = min(timeit.repeat(lambda: list(get_bulk_as_it_was(Permissions.objects, user)),
+                                     number=1, repeat=max(1, args.repeat // 10)))
+        new_time = min(timeit.repeat(lambda: list(Permissions.objects.get_bulk(user)),
+                                     number=1, repeat=args.repeat))
+
+        print(f'{total} nodes, {len(new)} effective for {user} ({user.type})')
+        print(f'{"as it was":<20} {len(old_queries):>6} queries {old_time * 1000:>10.1f} ms')
+        print(f'{"single statement":<20} {len(new_queries):>6} queries {new_time * 1000:>10.1f} ms')
+        print('\nQuery plan:')
+        print(Permissions.objects.get_bulk(user).explain())
+
+
+if __name__ == '__main__':
+    main()
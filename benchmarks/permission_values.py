@@ -0,0 +1,82 @@
+"""
+Evaluating expireTime/disableTime permissions: decoding Permissions.value and WhenType.as_datetime as they were
+(a fresh decoder map and decode on every access, eval() and a ZoneInfo lookup per part) against the decoded-once
+value and the compiled WhenType.
+
+    $ set -a; . ./debug.env; set +a
+    $ python -m benchmarks.permission_values [--number 100000]
+"""
+import argparse
+import json
+import tempfile
+import timeit
+import zoneinfo
+from datetime import datetime, timezone
+
+from benchmarks import django_db
+
+
+class WhenTypeAsItWas:
+    def __init__(self, offset_str: str):
+        from login.models.permissions import WhenType
+        self._matched = WhenType._validator.match(offset_str)
+
+    def as_datetime(self, reftime: datetime = None) -> datetime:
+        m, d, y = tuple(map(lambda ofst, ref: ref + eval(ofst) if ofst[0] in '+-' else int(ofst),
+                            self._matched.groups(),
+                            (reftime.month, reftime.day, reftime.year)
+                            ))
+        return datetime(y, m, d, tzinfo=zoneinfo.ZoneInfo("America/New_York"))
+
+
+def to_python_as_it_was(datatype: int):
+    from netaddr import IPNetwork
+    _map = {
+        0: lambda x: None,
+        1: lambda x: bool(json.loads(x.lower())),
+        2: lambda x: int(json.loads(x)),
+        3: lambda x: x,
+        4: lambda x: float(json.loads(x)),
+        5: lambda x: WhenTypeAsItWas(x),
+        6: lambda x: IPNetwork(x)
+    }
+    return _map[datatype]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        django_db.setup(tmp)
+        from login.models import Permissions
+
+        reftime = datetime(2026, 10, 18, 12, tzinfo=timezone.utc)
+        nodes = {
+            'expireTime': Permissions(permission='global/expireTime', raw_value='09/01/+4', type=5),
+            'disableTime': Permissions(permission='global/disableTime', raw_value='+0/+7/+0', type=5),
+            'loginIPRestriction': Permissions(permission='global/loginIPRestriction', raw_value='172.19.0.0/16',
+                                              type=6),
+        }
+        for node in ('expireTime', 'disableTime'):
+            perm = nodes[node]
+            old = to_python_as_it_was(perm.type)(perm.raw_value).as_datetime(reftime)
+            assert perm.value.as_datetime(reftime) == old, f'{node} differs'
+
+        def time_it(label, statement):
+            seconds = min(timeit.repeat(statement, number=args.number, repeat=5))
+            print(f'{label:<45} {seconds / args.number * 1e6:>8.2f} us')
+
+        for node, perm in nodes.items():
+            print(f'{node} = {perm.raw_value}')
+            time_it('  decode on access, as it was', lambda: to_python_as_it_was(perm.type)(perm.raw_value))
+            time_it('  Permissions.value, decoded once', lambda: perm.value)
+            if perm.type == 5:
+                old, new = to_python_as_it_was(perm.type)(perm.raw_value), perm.value
+                time_it('  as_datetime with eval(), as it was', lambda: old.as_datetime(reftime))
+                time_it('  as_datetime, compiled', lambda: new.as_datetime(reftime))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Decoding ClearPass device lists: the old eager ResponseData (json + one dict copy per device) against the lazy one.
+
+    $ python -m benchmarks.response_data [--devices 1000] [--repeat 200]
+"""
+import argparse
+import json
+import timeit
+import tracemalloc
+
+import httpx
+
+from interface import wrapper
+from interface.wrapper import ResponseData
+
+
+class EagerResponseData:
+    """ResponseData as it was: decode everything, copy every item into a fresh dict"""
+
+    def __init__(self, status, res):
+        self.status_code = status
+        self.device = []
+        response = res.json()
+        for data in response['_embedded']['items']:
+            self.device.append({
+                'id': int(data['id']),
+                'mac': data['mac'],
+                'notes': data['notes'],
+                'start_time': data['start_time'],
+                'expire_name': data['expire_time'],
+                'sponosor_name': data['sponsor_name'],
+                'device_name': data['visitor_name']
+            })
+
+
+def make_response(count: int) -> httpx.Response:
+    items = [{
+        'id': 3000 + i,
+        'mac': f'00-16-3e-{i >> 16 & 0xff:02x}-{i >> 8 & 0xff:02x}-{i & 0xff:02x}',
+        'notes': f'Device {i}',
+        'enabled': True,
+        'role_id': 2,
+        'start_time': 1660000000 + i,
+        'expire_time': 1690000000 + i,
+        'sponsor_name': 'admin',
+        'visitor_name': f'S:{200000000 + i}',
+        'do_expire': 4,
+    } for i in range(count)]
+    body = json.dumps({'_embedded': {'items': items}, '_links': {'self': {'href': '/api/device'}}})
+    return httpx.Response(200, content=body.encode())
+
+
+def peak_memory(func) -> int:
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    res = make_response(args.devices)
+    cases = {
+        'eager: parse + count': lambda: len(EagerResponseData(200, res).device),
+        'lazy:  parse + count': lambda: ResponseData(200, res).count,
+        'eager: parse + read every mac': lambda: [d['mac'] for d in EagerResponseData(200, res).device],
+        'lazy:  parse + read every mac': lambda: [d.mac for d in ResponseData(200, res)],
+        'lazy:  construct only (status check)': lambda: ResponseData(200, res).status_code,
+    }
+
+    print(f'{args.devices} devices, {len(res.content) / 1024:.0f} KiB body, '
+          f'JSON decoder: {wrapper._loads.__module__}')
+    for name, case in cases.items():
+        per_call = min(timeit.repeat(case, number=args.repeat, repeat=3)) / args.repeat
+        print(f'{name:<40} {per_call * 1e6:>10.1f} us/call {peak_memory(case) / 1024:>10.0f} KiB peak')
+
+
+if __name__ == '__main__':
+    main()
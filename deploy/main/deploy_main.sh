@@ -45,9 +45,28 @@ systemctl enable systemd-networkd
 # dnsmasq setup, dnsmasq clobbers the local resolver, disable it from listening on loopback iface
 echo "DNSMASQ_EXCEPT=lo" >> /etc/default/dnsmasq
 envsubst < "${SCRIPT_DIR}/dnsmasq.conf" >> /etc/dnsmasq.conf
+# dnsmasq pushes lease events to the lease store the workers read (login/dhcp_script.py)
+mkdir -p "$(dirname "${AMAC_LEASE_STORE}")"
+envsubst '${AMAC_LEASE_STORE} ${AMAC_DIR} ${AMAC_PYTHON}' < "${SCRIPT_DIR}/amac-dhcp-script" > /usr/local/bin/amac-dhcp-script
+chmod 755 /usr/local/bin/amac-dhcp-script
 systemctl enable dnsmasq
 
+# The web workers read the same store. Every automactic service loads its environment from AMAC_ENV_FILE.
+mkdir -p "$(dirname "${AMAC_ENV_FILE}")"
+[ -f "${AMAC_ENV_FILE}" ] || install -m 600 /dev/null "${AMAC_ENV_FILE}"
+sed -i '/^AMAC_DNSMASQ_LEASE_STORE=/d' "${AMAC_ENV_FILE}"
+echo "AMAC_DNSMASQ_LEASE_STORE=${AMAC_LEASE_STORE}" >> "${AMAC_ENV_FILE}"
+
+# ClearPass device mirror (login/management/commands/syncdevices.py). The incremental run only picks up devices whose
+# start_time moved, so a nightly --full run catches edits and removes devices deleted in ClearPass.
+# amac-failstalejobs marks bulk admin jobs whose worker stopped as failed.
+for i in "${SCRIPT_DIR}"/amac-{syncdevices,failstalejobs}*.{service,timer}; do
+    envsubst '${AMAC_ENV_FILE} ${AMAC_DIR} ${AMAC_PYTHON}' < "$i" > "/etc/systemd/system/$(basename "$i")"
+done
+systemctl daemon-reload
+systemctl enable --now amac-syncdevices.timer amac-syncdevices-full.timer amac-failstalejobs.timer
+
 # TODO: nftables
 
-# TODO: nginx + web stack
+# TODO: nginx + web stack. The web worker units need EnvironmentFile=${AMAC_ENV_FILE}, like amac-syncdevices.service.
 sudo cp pgadmin4.service /etc/system
\ No newline at end of file
@@ -1,21 +1,60 @@
+import asyncio
+import copy
 import json
+import threading
+import time
 from datetime import datetime, timedelta
 from functools import wraps
 
 from netaddr import EUI
 from login.utils import mutually_exclusive
 
-from interface.wrapper import ResponseData
+from interface import resilience
+from interface.cache import DeviceCache
+from interface.exceptions import ClearPassError
+from interface.metrics import Metrics
+from interface.store import SharedTokenStore
+from interface.wrapper import Device, ResponseData
+from django.conf import settings
 from django.utils import timezone
-from typing import Optional, Union
+from typing import AsyncIterator, Callable, Iterator, NamedTuple, Optional, Union
 import httpx
 import logging
 import os
 
 
+class ApiCall(NamedTuple):
+    """A ClearPass request, built once and sent by either the blocking or the async client"""
+    operation: str  # Timeout group: oauth, read, write
+    method: str
+    url: str
+    kwargs: dict
+
+
 class Token:
     _logger = logging.getLogger('CPPMAPI')
 
+    # One connection pool per worker process, shared by every Token instance.
+    _client: Optional[httpx.Client] = None
+    _client_pid: Optional[int] = None
+    _client_lock = threading.Lock()
+
+    # Token cache shared by every worker process on the host
+    _store: Optional[SharedTokenStore] = None
+    _store_refused = False
+
+    # Device lookups, shared by every Token instance in the process
+    _device_cache: Optional[DeviceCache] = None
+
+    # Health of ClearPass as seen by this process
+    _breaker: Optional[resilience.CircuitBreaker] = None
+
+    # Call latency and outcomes, aggregated across processes by the metrics view
+    _metrics: Optional[Metrics] = None
+
+    # Transient failures worth retrying, for idempotent requests
+    retry_status_codes = (502, 503, 504)
+
     def __init__(self):
         self.id = str(os.environ['CLIENT_ID'])
         self.secret = str(os.environ['CLIENT_SECRET'])
@@ -24,38 +63,241 @@ class Token:
         self.grant_type = ["client_credentials", "password", "refresh_token"]
         self.error_codes = [401, 403]
         self.token = ""
+        self.token_expiry = 0.0  # Unix time, from the `expires_in` of the /oauth response
+        self._renew_lock = threading.Lock()
+        # Set while a background refresh is pending, so ensure_token starts at most one
+        self._refresh_scheduled = False
+        self._schedule_lock = threading.Lock()
+
+    @classmethod
+    def get_client(cls) -> httpx.Client:
+        """
+        Returns the process-wide pooled client, creating it on first use.
+        httpx.Client is thread safe, so it is shared by all threads of a worker. A client inherited across a fork
+        (e.g. gunicorn --preload) is not reused, since its sockets belong to the parent process.
+        """
+        if cls._client is None or cls._client_pid != os.getpid():
+            with cls._client_lock:
+                if cls._client is None or cls._client_pid != os.getpid():
+                    cls._client = cls._create_client()
+                    cls._client_pid = os.getpid()
+        return cls._client
+
+    @classmethod
+    def get_store(cls) -> Optional[SharedTokenStore]:
+        if cls._store is None and settings.CLEARPASS_API['TOKEN_CACHE'] and not cls._store_refused:
+            try:
+                cls._store = SharedTokenStore(settings.CLEARPASS_API['TOKEN_CACHE'])
+            except OSError as err:
+                # Renewals are then only coalesced within each process
+                cls._logger.error(f'Not sharing the token between workers: {err}')
+                cls._store_refused = True
+        return cls._store
+
+    @classmethod
+    def get_device_cache(cls) -> DeviceCache:
+        if Token._device_cache is None:
+            conf = settings.CLEARPASS_API
+            Token._device_cache = DeviceCache(conf['DEVICE_CACHE_SIZE'], conf['DEVICE_CACHE_TTL'],
+                                              conf['DEVICE_CACHE_NEGATIVE_TTL'])
+        return Token._device_cache
+
+    @classmethod
+    def get_breaker(cls) -> resilience.CircuitBreaker:
+        if Token._breaker is None:
+            conf = settings.CLEARPASS_API
+            Token._breaker = resilience.CircuitBreaker(conf['BREAKER_WINDOW'], conf['BREAKER_MIN_CALLS'],
+                                                       conf['BREAKER_FAILURE_RATE'], conf['BREAKER_COOLDOWN'])
+        return Token._breaker
+
+    @classmethod
+    def get_metrics(cls) -> Metrics:
+        if Token._metrics is None:
+            Token._metrics = Metrics(settings.CLEARPASS_API['METRICS_DIR'] or None)
+        return Token._metrics
+
+    @classmethod
+    def _create_client(cls) -> httpx.Client:
+        return httpx.Client(**cls._client_options())
+
+    @classmethod
+    def _client_options(cls) -> dict:
+        conf = settings.CLEARPASS_API
+        http2 = conf['HTTP2']
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                cls._logger.warning('HTTP/2 requested but the "h2" package is not installed. Using HTTP/1.1')
+                http2 = False
+
+        return {
+            'limits': httpx.Limits(max_connections=conf['MAX_CONNECTIONS'],
+                                   max_keepalive_connections=conf['MAX_KEEPALIVE_CONNECTIONS'],
+                                   keepalive_expiry=conf['KEEPALIVE_EXPIRY']),
+            'timeout': cls._get_timeout('read'),
+            'http2': http2,
+            'verify': False,
+        }
+
+    @staticmethod
+    def _get_timeout(operation: str) -> httpx.Timeout:
+        conf = settings.CLEARPASS_API
+        return httpx.Timeout(conf['TIMEOUTS'][operation], connect=conf['CONNECT_TIMEOUT'])
+
+    def _request(self, operation: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Sends a request through the pooled client and the circuit breaker, using the timeout for `operation` (oauth,
+        read, write) cut down to the remaining deadline. GETs are retried on transport errors and 502/503/504.
+        """
+        delays = self._retry_delays(method)
+        while True:
+            try:
+                res = self._attempt(operation, method, url, **kwargs)
+            except httpx.TransportError:
+                if (delay := next(delays, None)) is None:
+                    raise
+            else:
+                if res.status_code not in self.retry_status_codes or (delay := next(delays, None)) is None:
+                    return res
+            self._retrying(operation, method, url, delay)
+            time.sleep(delay)
+
+    def _attempt(self, operation: str, method: str, url: str, **kwargs) -> httpx.Response:
+        timeout, breaker = self._before_attempt(operation, method)
+        with self.get_metrics().in_flight({'operation': operation}):
+            start = time.perf_counter()
+            try:
+                res = self.get_client().request(method, url, timeout=timeout, **kwargs)
+            except Exception as err:
+                self._after_attempt(breaker, operation, method, start, type(err).__name__, success=False)
+                raise
+        self._after_attempt(breaker, operation, method, start, res.status_code, success=res.status_code < 500)
+        return res
+
+    # Per-attempt bookkeeping, shared by Token and AsyncToken
+
+    def _before_attempt(self, operation: str, method: str) -> tuple[httpx.Timeout, resilience.CircuitBreaker]:
+        breaker = self.get_breaker()
+        try:
+            timeout = resilience.bounded_timeout(self._get_timeout(operation))
+            breaker.before_call()
+        except ClearPassError as err:
+            self.get_metrics().inc('clearpass_responses_total',
+                                   {'operation': operation, 'method': method, 'outcome': type(err).__name__})
+            raise
+        return timeout, breaker
+
+    def _after_attempt(self, breaker: resilience.CircuitBreaker, operation: str, method: str, start: float,
+                       outcome: Union[int, str], success: bool):
+        breaker.record(success)
+        metrics = self.get_metrics()
+        labels = {'operation': operation, 'method': method}
+        metrics.observe('clearpass_request_duration_seconds', labels, time.perf_counter() - start)
+        metrics.inc('clearpass_responses_total', {**labels, 'outcome': outcome})
+
+    def _retrying(self, operation: str, method: str, url: str, delay: float):
+        self._logger.warning(f'Retrying {method} {url} in {delay:.2f}s')
+        self.get_metrics().inc('clearpass_retries_total', {'operation': operation})
+
+    def _retry_delays(self, method: str):
+        conf = settings.CLEARPASS_API
+        return resilience.retry_delays(conf['RETRIES'] if method == 'GET' else 0, conf['RETRY_BACKOFF'])
+
+    def _send(self, call: ApiCall) -> ResponseData:
+        res = self._request(call.operation, call.method, call.url, **call.kwargs)
+        return ResponseData(res.status_code, res)
+
+    def renew_token(self, stale_token: Optional[str] = None):
+        """
+        Fetches a new token. Renewals are single-flight: callers pass the token they saw fail or expire, and if another
+        thread replaced it while this one waited on the lock, the fresh token is used as-is.
+        The shared token store is locked as well, so the same holds across worker processes.
+        """
+        store = self.get_store()
+        with self._renew_lock:
+            lock = store.acquire() if store else None
+            try:
+                if stale_token is not None and (self.token != stale_token or self._load_shared_token(stale_token)):
+                    self.get_metrics().inc('clearpass_token_renewals_total', {'outcome': 'coalesced'})
+                    return
+                call = self._build_renew_token()
+                self._store_token(self._request(call.operation, call.method, call.url, **call.kwargs))
+            except httpx.HTTPError as error:
+                self._logger.error(f"Make sure its the right api url: {error!r}")
+                self.get_metrics().inc('clearpass_token_renewals_total', {'outcome': 'error'})
+            finally:
+                if store:
+                    store.release(lock)
+
+    def _load_shared_token(self, stale_token: Optional[str] = None) -> bool:
+        """Adopts the token another worker published, unless it is the one this caller already knows is stale"""
+        if (store := self.get_store()) and (shared := store.load()) and shared[0] != stale_token:
+            self.token, self.token_expiry = shared
+            return True
+        return False
+
+    def ensure_token(self):
+        """Blocks on renewal if there is no usable token, and refreshes in the background if it expires soon"""
+        remaining = self.token_expiry - time.time()
+        if not self.token or remaining <= 0:
+            if not self._load_shared_token(stale_token=self.token):
+                self.renew_token(stale_token=self.token)
+        elif remaining <= settings.CLEARPASS_API['TOKEN_REFRESH_MARGIN']:
+            with self._schedule_lock:
+                if self._refresh_scheduled:
+                    return
+                self._refresh_scheduled = True
+            threading.Thread(target=self._background_renew, args=(self.token,), daemon=True).start()
 
-    def renew_token(self):
+    def _background_renew(self, stale_token: str):
         try:
-            req = httpx.post(self.api_url, headers={
+            self.renew_token(stale_token)
+        except ClearPassError as err:
+            # Breaker open or out of time: the token is still valid, the next call tries again
+            self._logger.warning(f'Background token refresh failed: {err!r}')
+        finally:
+            self._refresh_scheduled = False
+
+    def _build_renew_token(self) -> ApiCall:
+        return ApiCall('oauth', 'POST', self.api_url, {
+            'headers': {
                 'Content-Type': 'application/json',
                 'Accept': 'application/json',
-            }, json={
+            },
+            'json': {
                 'grant_type': self.grant_type[0],
                 'client_id': self.id,
                 'client_secret': self.secret,
-            }, verify=False)
-            if req.status_code == 200:
-                token_data = req.json()
-                self.token = token_data["access_token"]
-            elif req.status_code == 400:
-                self._logger.error("Make sure the client id and secret are correct <400(bad req)>")
+            },
+        })
 
-        except httpx.ConnectError as error:
-            self._logger.error("Make sure its the right api url", error)
+    def _store_token(self, req: httpx.Response):
+        outcome = 'ok' if req.status_code == 200 else 'failed'
+        self.get_metrics().inc('clearpass_token_renewals_total', {'outcome': outcome})
+        if req.status_code == 200:
+            token_data = req.json()
+            self.token = token_data["access_token"]
+            # Without an expiry, rely on the 401/403 replay in check_token to notice expired tokens
+            self.token_expiry = time.time() + float(token_data.get('expires_in', 'inf'))
+            if store := self.get_store():
+                store.save(self.token, self.token_expiry)
+        elif req.status_code == 400:
+            self._logger.error("Make sure the client id and secret are correct <400(bad req)>")
 
     def check_token(func):
         @wraps(func)
         def wrap(self, *args, **kwargs):
-            try:
-                response = func(self, *args, **kwargs)
-                if response.status_code in self.error_codes:
-                    raise AssertionError
-            except Exception:
-                self.renew_token()
+            self.ensure_token()
+            stale_token = self.token
+            response = func(self, *args, **kwargs)
+
+            # Only an auth failure is worth a replay. The token was revoked, or expired ahead of `expires_in`.
+            if response.status_code in self.error_codes:
+                self.renew_token(stale_token)
                 response = func(self, *args, **kwargs)
                 if response.status_code in self.error_codes:
-                    raise TypeError("Clearpass Token Error")
+                    raise ClearPassError("Clearpass Token Error", response.status_code)
 
             return response
         return wrap
@@ -63,85 +305,249 @@ class Token:
     @check_token
     def add_device(self, mac: EUI, username: str, device_name: Optional[str] = None,
                    time: Union[timedelta, datetime] = None) -> ResponseData:
-
-        res = httpx.post(f"{self.base_url}/device",
-                         json={
-                             'expire_time': self._get_expire_date(time),
-                             'mac': str(mac),
-                             'notes': device_name,
-                             'enabled': True,
-                             'visitor_name': username,
-                             'role_id': 2, # guest role
-                             'do_expire': 4,  # when the device expires delete the device
-                             'start_time': self._get_expire_date(timezone.now() - timedelta(minutes=20)) # ClearPass system clock 20 minutes faster
-                         }, headers=self._get_header(), verify=False)
-        return ResponseData(res.status_code, res)
+        response = self._send(self._build_add_device(mac, username, device_name, time))
+        self._device_added(mac, username, response)
+        return response
 
     @check_token
     def delete_device(self, mac: EUI):
-        res = httpx.delete(f"{self.base_url}/device/mac/{EUI(mac)}",
-                           #   params={'change_of_authorization': True},
-                           headers=self._get_header(),
-                           verify=False)
-        return ResponseData(res.status_code, res)
+        response = self._send(self._build_delete_device(mac))
+        self._device_written(response, DeviceCache.mac_tag(mac))
+        return response
 
-    @check_token
     @mutually_exclusive('mac', 'username')
     def get_device(self, mac: Optional[EUI] = None, username: Optional[str] = None, sort: str = "-id",
                    limit: int = 100) -> ResponseData:
+        key = DeviceCache.key(mac, username, sort, limit)
+        if (cached := self.get_device_cache().get(key)) is None:
+            cached = self._get_device(mac, username, sort, limit)
+            self.get_device_cache().put(key, cached)
+        return cached
+
+    @check_token
+    def _get_device(self, mac: Optional[EUI], username: Optional[str], sort: str, limit: int) -> ResponseData:
+        return self._send(self._build_get_device(mac, username, sort, limit))
+
+    @check_token
+    def list_devices(self, filters: Optional[dict] = None, sort: str = "+id", offset: int = 0,
+                     limit: int = 1000, next_url: Optional[str] = None) -> ResponseData:
+        """
+        One page of the whole device list, optionally filtered (ClearPass filter syntax). Not cached.
+        `next_url`, the `_links.next` of a previous page, takes precedence over the other arguments.
+        """
+        return self._send(self._build_list_devices(filters, sort, offset, limit, next_url))
+
+    def iter_device_pages(self, username: Optional[str] = None, filters: Optional[dict] = None, sort: str = "+id",
+                          page_size: int = 1000) -> Iterator[ResponseData]:
+        """
+        Walks the device list (of one visitor, if `username` is given) page by page, so only one page is ever held in
+        memory. Follows `_links.next` when ClearPass provides it, and offset/limit otherwise.
+        Raises ClearPassError if a page cannot be fetched.
+        """
+        filters = self._device_filters(username, filters)
+        offset, next_url = 0, None
+        while True:
+            page = self.list_devices(filters, sort, offset, page_size, next_url)
+            self._check_page(page, offset)
+            yield page
+            if (offset := self._next_offset(page, offset, page_size)) is None:
+                return
+            next_url = page.next_url
+
+    def iter_devices(self, username: Optional[str] = None, filters: Optional[dict] = None, sort: str = "+id",
+                     page_size: int = 1000, predicate: Optional[Callable[[Device], bool]] = None) -> Iterator[Device]:
+        """Like iter_device_pages, but yields single devices, optionally only those matching `predicate`"""
+        for page in self.iter_device_pages(username, filters, sort, page_size):
+            yield from (page.device if predicate is None else filter(predicate, page.device))
+
+    @check_token
+    @mutually_exclusive('mac', 'username', 'device_id')
+    def update_device(self, mac: Optional[EUI] = None, username: Optional[str] = None, device_id: Optional[int] = None,
+                      updated_fields: Optional[dict] = None) -> ResponseData:
+        if username is not None:
+            device_id = self._single_device_id(self.get_device(username=username))
+        response = self._send(self._build_update_device(mac, device_id, updated_fields))
+        self._device_written(response, *self._update_tags(mac, username, device_id, updated_fields))
+        return response
+
+    def replace_oldest_device(self, username: str, mac: EUI, device_name: Optional[str],
+                              device_limit: int) -> Optional[ResponseData]:
+        """
+        If `username` has `device_limit` devices or more, moves the oldest one (by start_time) to `mac`, in two calls:
+        one lookup returning only that device and the total count, and the PATCH. If ClearPass leaves out the count,
+        the user's devices are counted by listing them.
+        Returns the PATCH response, or None if the user is below the limit and a device should be added instead.
+        """
+        oldest = self._oldest_device(username)
+        if (total := self._oldest_total(oldest, username)) is None:
+            total = sum(1 for _ in self.iter_devices(username))
+        if (device_id := self._replaceable_device_id(oldest, total, device_limit)) is None:
+            return None
+        return self.update_device(device_id=device_id, updated_fields={'mac': str(mac), 'notes': device_name})
+
+    @check_token
+    def _oldest_device(self, username: str) -> ResponseData:
+        return self._send(self._build_oldest_device(username))
+
+    # Device cache write-through, shared by Token and AsyncToken
+
+    def _device_added(self, mac: EUI, username: str, response: ResponseData):
+        self._device_written(response, DeviceCache.mac_tag(mac), DeviceCache.name_tag(username))
+        # The created device is what a lookup by MAC returns, so the next lookup does not need ClearPass.
+        # It is cached as the 200 of such a lookup, not as the 201 of the add.
+        if response.status_code == 201:
+            lookup = copy.copy(response)
+            lookup.status_code = 200
+            self.get_device_cache().put(DeviceCache.key(mac), lookup)
+
+    def _device_written(self, response: ResponseData, *tags: tuple):
+        cache = self.get_device_cache()
+        cache.invalidate({*tags, *(tag for device in response.device for tag in cache.device_tags(device))})
+
+    @staticmethod
+    def _update_tags(mac: Optional[EUI], username: Optional[str], device_id: Optional[int],
+                     updated_fields: Optional[dict]) -> list[tuple]:
+        tags = []
         if mac is not None:
-            res = httpx.get(f"{self.base_url}/device/mac/{EUI(mac)}",
-                            headers=self._get_header(), verify=False)
-            return ResponseData(res.status_code, res)
+            tags.append(DeviceCache.mac_tag(mac))
+        if username is not None:
+            tags.append(DeviceCache.name_tag(username))
+        if device_id is not None:
+            tags.append(DeviceCache.id_tag(device_id))
+        if updated_fields and updated_fields.get('mac'):
+            tags.append(DeviceCache.mac_tag(updated_fields['mac']))
+        return tags
+
+    # Request builders, shared by Token and AsyncToken
+
+    def _build_add_device(self, mac: EUI, username: str, device_name: Optional[str],
+                          time: Union[timedelta, datetime, None]) -> ApiCall:
+        return ApiCall('write', 'POST', f"{self.base_url}/device", {
+            'json': {
+                'expire_time': self._get_expire_date(time),
+                'mac': str(mac),
+                'notes': device_name,
+                'enabled': True,
+                'visitor_name': username,
+                'role_id': 2, # guest role
+                'do_expire': 4,  # when the device expires delete the device
+                'start_time': self._get_expire_date(timezone.now() - timedelta(minutes=20)) # ClearPass system clock 20 minutes faster
+            },
+            'headers': self._get_header(),
+        })
+
+    def _build_delete_device(self, mac: EUI) -> ApiCall:
+        return ApiCall('write', 'DELETE', f"{self.base_url}/device/mac/{EUI(mac)}", {
+            #   'params': {'change_of_authorization': True},
+            'headers': self._get_header(),
+        })
+
+    def _build_get_device(self, mac: Optional[EUI], username: Optional[str], sort: str, limit: int) -> ApiCall:
+        if mac is not None:
+            return ApiCall('read', 'GET', f"{self.base_url}/device/mac/{EUI(mac)}", {
+                'headers': self._get_header(),
+            })
 
         elif username is not None:
-            res = httpx.get(f"{self.base_url}/device",
-                            params={
-                                'filter': json.dumps({'visitor_name': username}),
-                                'sort': sort,
-                                'limit': limit
-                            }, headers=self._get_header(), verify=False)
-            return ResponseData(res.status_code, res)
+            return ApiCall('read', 'GET', f"{self.base_url}/device", {
+                'params': {
+                    'filter': json.dumps({'visitor_name': username}),
+                    'sort': sort,
+                    'limit': limit
+                },
+                'headers': self._get_header(),
+            })
         else:
             raise TypeError('data cannot be empty')
 
-    @check_token
-    @mutually_exclusive('mac', 'name', 'device_id')
-    def update_device(self, mac: Optional[EUI] = None, username: Optional[str] = None, device_id: Optional[int] = None,
-                      updated_fields: Optional[dict] = None) -> ResponseData:
+    def _build_list_devices(self, filters: Optional[dict], sort: str, offset: int, limit: int,
+                            next_url: Optional[str] = None) -> ApiCall:
+        if next_url is not None:
+            return ApiCall('read', 'GET', str(httpx.URL(self.base_url).join(next_url)), {
+                'headers': self._get_header(),
+            })
+
+        return ApiCall('read', 'GET', f"{self.base_url}/device", {
+            'params': {
+                **({'filter': json.dumps(filters)} if filters else {}),
+                'sort': sort,
+                'offset': offset,
+                'limit': limit,
+            },
+            'headers': self._get_header(),
+        })
+
+    def _build_oldest_device(self, username: str) -> ApiCall:
+        # ClearPass sorts and counts server side, so one small page tells both which device to replace and whether to
+        return ApiCall('read', 'GET', f"{self.base_url}/device", {
+            'params': {
+                'filter': json.dumps({'visitor_name': username}),
+                'sort': '+start_time',
+                'limit': 1,
+                'calculate_count': 'true',
+            },
+            'headers': self._get_header(),
+        })
+
+    def _build_update_device(self, mac: Optional[EUI], device_id: Optional[int],
+                             updated_fields: Optional[dict]) -> ApiCall:
         updated_fields = {
             **updated_fields,
             'start_time': self._get_expire_date(timezone.now() - timedelta(minutes=20))
         }
         if mac is not None:
-            res = httpx.patch(f"{self.base_url}/device/mac/{mac}",
-                              # params={'change_of_authorization': True},
-                              json=updated_fields,
-                              headers=self._get_header(),
-                              verify=False)
-            return ResponseData(res.status_code, res)
-
-        elif username is not None:
-            device_response = self.get_device(username=username)
-            if len(device_response.device) != 1:
-                self._logger.error('Multiple devices with same name returned or the name does not exist')
-                raise TypeError('Cannot update device')
-            else:
-                clearpass_device_id = int(device_response.device[0]['id'])
-                res = httpx.patch(f"{self.base_url}/device/{clearpass_device_id}",
-                                  # params={'change_of_authorization': 1},
-                                  json=updated_fields, headers=self._get_header(), verify=False)
-                return ResponseData(res.status_code, res)
-
+            url = f"{self.base_url}/device/mac/{mac}"
         elif device_id is not None:
-            res = httpx.patch(f"{self.base_url}/device/{device_id}",
-                              # params={'change_of_authorization': 1},
-                              json=updated_fields, headers=self._get_header(), verify=False)
-            return ResponseData(res.status_code, res)
-
+            url = f"{self.base_url}/device/{device_id}"
         else:
             raise TypeError('data cannot be empty')
 
+        return ApiCall('write', 'PATCH', url, {
+            # 'params': {'change_of_authorization': 1},
+            'json': updated_fields,
+            'headers': self._get_header(),
+        })
+
+    @staticmethod
+    def _device_filters(username: Optional[str], filters: Optional[dict]) -> Optional[dict]:
+        if username is None:
+            return filters
+        return {**(filters or {}), 'visitor_name': username}
+
+    @staticmethod
+    def _check_page(page: ResponseData, offset: int):
+        if page.status_code != 200:
+            raise ClearPassError(f'Could not list devices at offset {offset}: HTTP {page.status_code}',
+                                 page.status_code)
+
+    @staticmethod
+    def _next_offset(page: ResponseData, offset: int, page_size: int) -> Optional[int]:
+        """Offset of the following page, or None if this was the last one"""
+        if page.next_url is None and len(page.device) < page_size:
+            return None
+        return offset + page_size
+
+    @staticmethod
+    def _oldest_total(oldest: ResponseData, username: str) -> Optional[int]:
+        """Number of devices `username` has, or None if ClearPass did not count them"""
+        if oldest.status_code != 200:
+            raise ClearPassError(f'Could not look up the devices of {username}: HTTP {oldest.status_code}',
+                                 oldest.status_code)
+        return oldest.total
+
+    @staticmethod
+    def _replaceable_device_id(oldest: ResponseData, total: int, device_limit: int) -> Optional[int]:
+        """Id of the device to replace, or None if the user is below `device_limit`"""
+        if total < device_limit or not oldest.device:
+            return None
+        return oldest.device[0].id
+
+    def _single_device_id(self, device_response: ResponseData) -> int:
+        if len(device_response.device) != 1:
+            self._logger.error('Multiple devices with same name returned or the name does not exist')
+            raise TypeError('Cannot update device')
+        return device_response.device[0].id
+
     def _get_expire_date(self, time: Union[timedelta, datetime, None]) -> str:
         result = None
         if not time:
@@ -161,3 +567,187 @@ class Token:
             'Content-Type': 'application/json',
             'Accept': 'application/json',
         }
+
+
+class AsyncToken(Token):
+    """
+    Non-blocking mirror of Token, built on httpx.AsyncClient.
+    Every public method is a coroutine with the same arguments and return values as its Token counterpart.
+    """
+    _logger = logging.getLogger('CPPMAPI')
+
+    # One connection pool per event loop. An AsyncClient cannot be shared between loops.
+    _async_client: Optional[httpx.AsyncClient] = None
+    _async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __init__(self):
+        super().__init__()
+        self._async_renew_lock = asyncio.Lock()
+        self._background_tasks = set()
+
+    @classmethod
+    def get_async_client(cls) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if cls._async_client is None or cls._async_client_loop is not loop:
+            cls._async_client = httpx.AsyncClient(**cls._client_options())
+            cls._async_client_loop = loop
+        return cls._async_client
+
+    async def _request(self, operation: str, method: str, url: str, **kwargs) -> httpx.Response:
+        delays = self._retry_delays(method)
+        while True:
+            try:
+                res = await self._attempt(operation, method, url, **kwargs)
+            except httpx.TransportError:
+                if (delay := next(delays, None)) is None:
+                    raise
+            else:
+                if res.status_code not in self.retry_status_codes or (delay := next(delays, None)) is None:
+                    return res
+            self._retrying(operation, method, url, delay)
+            await asyncio.sleep(delay)
+
+    async def _attempt(self, operation: str, method: str, url: str, **kwargs) -> httpx.Response:
+        timeout, breaker = self._before_attempt(operation, method)
+        with self.get_metrics().in_flight({'operation': operation}):
+            start = time.perf_counter()
+            try:
+                res = await self.get_async_client().request(method, url, timeout=timeout, **kwargs)
+            except Exception as err:
+                self._after_attempt(breaker, operation, method, start, type(err).__name__, success=False)
+                raise
+        self._after_attempt(breaker, operation, method, start, res.status_code, success=res.status_code < 500)
+        return res
+
+    async def _send(self, call: ApiCall) -> ResponseData:
+        res = await self._request(call.operation, call.method, call.url, **call.kwargs)
+        return ResponseData(res.status_code, res)
+
+    async def renew_token(self, stale_token: Optional[str] = None):
+        store = self.get_store()
+        async with self._async_renew_lock:
+            # Another process may hold the file lock for a whole /oauth round-trip, so wait for it off the loop
+            lock = await asyncio.to_thread(store.acquire) if store else None
+            try:
+                if stale_token is not None and (self.token != stale_token or self._load_shared_token(stale_token)):
+                    self.get_metrics().inc('clearpass_token_renewals_total', {'outcome': 'coalesced'})
+                    return
+                call = self._build_renew_token()
+                self._store_token(await self._request(call.operation, call.method, call.url, **call.kwargs))
+            except httpx.HTTPError as error:
+                self._logger.error(f"Make sure its the right api url: {error!r}")
+                self.get_metrics().inc('clearpass_token_renewals_total', {'outcome': 'error'})
+            finally:
+                if store:
+                    store.release(lock)
+
+    async def ensure_token(self):
+        remaining = self.token_expiry - time.time()
+        if not self.token or remaining <= 0:
+            if not self._load_shared_token(stale_token=self.token):
+                await self.renew_token(stale_token=self.token)
+        elif remaining <= settings.CLEARPASS_API['TOKEN_REFRESH_MARGIN'] and not self._refresh_scheduled:
+            # Set before yielding to the loop, so concurrent callers do not schedule another
+            self._refresh_scheduled = True
+            # Keep a reference, the event loop only holds weak references to tasks
+            task = asyncio.create_task(self._background_renew(self.token))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+
+    async def _background_renew(self, stale_token: str):
+        try:
+            await self.renew_token(stale_token)
+        except ClearPassError as err:
+            self._logger.warning(f'Background token refresh failed: {err!r}')
+        finally:
+            self._refresh_scheduled = False
+
+    def check_token(func):
+        @wraps(func)
+        async def wrap(self, *args, **kwargs):
+            await self.ensure_token()
+            stale_token = self.token
+            response = await func(self, *args, **kwargs)
+
+            if response.status_code in self.error_codes:
+                await self.renew_token(stale_token)
+                response = await func(self, *args, **kwargs)
+                if response.status_code in self.error_codes:
+                    raise ClearPassError("Clearpass Token Error", response.status_code)
+
+            return response
+        return wrap
+
+    @check_token
+    async def add_device(self, mac: EUI, username: str, device_name: Optional[str] = None,
+                         time: Union[timedelta, datetime] = None) -> ResponseData:
+        response = await self._send(self._build_add_device(mac, username, device_name, time))
+        self._device_added(mac, username, response)
+        return response
+
+    @check_token
+    async def delete_device(self, mac: EUI):
+        response = await self._send(self._build_delete_device(mac))
+        self._device_written(response, DeviceCache.mac_tag(mac))
+        return response
+
+    @mutually_exclusive('mac', 'username')
+    async def get_device(self, mac: Optional[EUI] = None, username: Optional[str] = None, sort: str = "-id",
+                         limit: int = 100) -> ResponseData:
+        key = DeviceCache.key(mac, username, sort, limit)
+        if (cached := self.get_device_cache().get(key)) is None:
+            cached = await self._get_device(mac, username, sort, limit)
+            self.get_device_cache().put(key, cached)
+        return cached
+
+    @check_token
+    async def _get_device(self, mac: Optional[EUI], username: Optional[str], sort: str, limit: int) -> ResponseData:
+        return await self._send(self._build_get_device(mac, username, sort, limit))
+
+    @check_token
+    async def list_devices(self, filters: Optional[dict] = None, sort: str = "+id", offset: int = 0,
+                           limit: int = 1000, next_url: Optional[str] = None) -> ResponseData:
+        return await self._send(self._build_list_devices(filters, sort, offset, limit, next_url))
+
+    async def iter_device_pages(self, username: Optional[str] = None, filters: Optional[dict] = None,
+                                sort: str = "+id", page_size: int = 1000) -> AsyncIterator[ResponseData]:
+        filters = self._device_filters(username, filters)
+        offset, next_url = 0, None
+        while True:
+            page = await self.list_devices(filters, sort, offset, page_size, next_url)
+            self._check_page(page, offset)
+            yield page
+            if (offset := self._next_offset(page, offset, page_size)) is None:
+                return
+            next_url = page.next_url
+
+    async def iter_devices(self, username: Optional[str] = None, filters: Optional[dict] = None, sort: str = "+id",
+                           page_size: int = 1000,
+                           predicate: Optional[Callable[[Device], bool]] = None) -> AsyncIterator[Device]:
+        async for page in self.iter_device_pages(username, filters, sort, page_size):
+            for device in page.device:
+                if predicate is None or predicate(device):
+                    yield device
+
+    @check_token
+    @mutually_exclusive('mac', 'username', 'device_id')
+    async def update_device(self, mac: Optional[EUI] = None, username: Optional[str] = None,
+                            device_id: Optional[int] = None, updated_fields: Optional[dict] = None) -> ResponseData:
+        if username is not None:
+            device_id = self._single_device_id(await self.get_device(username=username))
+        response = await self._send(self._build_update_device(mac, device_id, updated_fields))
+        self._device_written(response, *self._update_tags(mac, username, device_id, updated_fields))
+        return response
+
+    async def replace_oldest_device(self, username: str, mac: EUI, device_name: Optional[str],
+                                    device_limit: int) -> Optional[ResponseData]:
+        oldest = await self._oldest_device(username)
+        if (total := self._oldest_total(oldest, username)) is None:
+            total = sum([1 async for _ in self.iter_devices(username)])
+        if (device_id := self._replaceable_device_id(oldest, total, device_limit)) is None:
+            return None
+        return await self.update_device(device_id=device_id, updated_fields={'mac': str(mac), 'notes': device_name})
+
+    @check_token
+    async def _oldest_device(self, username: str) -> ResponseData:
+        return await self._send(self._build_oldest_device(username))
@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from django.conf import settings
+from netaddr import EUI
+
+from interface.api import Token
+from interface.wrapper import Device
+
+
+class RateLimiter:
+    """Token bucket, shared by all threads of a bulk operation. `acquire` blocks until a call may be made."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class BulkExecutor(ThreadPoolExecutor):
+    """A thread pool for ClearPass calls, with bounded concurrency and a requests-per-second cap"""
+
+    def __init__(self, concurrency: Optional[int] = None, rate: Optional[float] = None):
+        conf = settings.CLEARPASS_API
+        super().__init__(max_workers=concurrency or conf['BULK_CONCURRENCY'], thread_name_prefix='CPPMBulk')
+        self.limiter = RateLimiter(rate or conf['BULK_RATE'])
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        def limited():
+            self.limiter.acquire()
+            return fn(*args, **kwargs)
+        return super().submit(limited)
+
+
+@dataclass
+class BulkResult:
+    """Outcome of a bulk operation for a single user"""
+    username: str
+    devices: list[str] = field(default_factory=list)
+    errors: list[str] = field(default_factory=list)
+    pending: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def as_dict(self) -> dict:
+        return {'ok': self.ok, 'devices': self.devices, 'errors': self.errors}
+
+
+def remove_devices(access: Token, users: dict[str, str],
+                   progress: Optional[Callable[[BulkResult], None]] = None,
+                   executor: Optional[BulkExecutor] = None) -> dict[str, BulkResult]:
+    """
+    Removes every ClearPass device of each user.
+    Lookups for all users are fanned out first, and each user's deletes are queued as soon as its lookup returns.
+
+    :param access: the client to use
+    :param users: map of username to ClearPass visitor name (User.clearpass_name)
+    :param progress: called once per user, when all of that user's calls have finished
+    :param executor: defaults to a BulkExecutor using the configured concurrency and rate
+    :return: map of username to BulkResult
+    """
+    logger = logging.getLogger('CPPMBulk')
+    results = {username: BulkResult(username) for username in users}
+
+    def finish(result: BulkResult):
+        if progress is not None:
+            progress(result)
+
+    def lookup(name: str) -> list[Device]:
+        # All pages, get_device only returns the first one
+        return list(access.iter_devices(username=name, page_size=100))
+
+    with (executor or BulkExecutor()) as pool:
+        lookups = {pool.submit(lookup, name): results[username] for username, name in users.items()}
+        deletes: dict[Future, tuple[BulkResult, str]] = {}
+
+        for future in as_completed(lookups):
+            result = lookups[future]
+            try:
+                devices = future.result()
+            except Exception as err:
+                result.errors.append(f'lookup: {err!r}')
+                finish(result)
+                continue
+
+            for device in devices:
+                mac = str(EUI(device.mac))
+                deletes[pool.submit(access.delete_device, mac=mac)] = (result, mac)
+                result.pending += 1
+            if result.pending == 0:
+                finish(result)
+
+        for future in as_completed(deletes):
+            result, mac = deletes[future]
+            try:
+                resp = future.result()
+                # A 404 means the device is already gone, which is what we wanted
+                if resp.status_code >= 400 and resp.status_code != 404:
+                    result.errors.append(f'{mac}: HTTP {resp.status_code}')
+                else:
+                    result.devices.append(mac)
+            except Exception as err:
+                result.errors.append(f'{mac}: {err!r}')
+
+            result.pending -= 1
+            if result.pending == 0:
+                finish(result)
+
+    failed = sum(not result.ok for result in results.values())
+    logger.info(f'Removed devices for {len(results) - failed}/{len(results)} users')
+    return results
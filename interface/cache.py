@@ -0,0 +1,118 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Iterable, Optional
+
+from netaddr import EUI, AddrFormatError
+
+from interface.wrapper import Device, ResponseData
+
+
+class DeviceCache:
+    """
+    Per-process, thread safe LRU cache of ClearPass device lookups, with a TTL per entry.
+
+    Besides its own key, every entry is tagged with the MAC address, id and visitor name of each device it contains.
+    Writes invalidate by tag, so e.g. deleting a MAC also drops the cached device list of the user that owned it.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: OrderedDict[Hashable, tuple[float, ResponseData, set]] = OrderedDict()
+        self._tags: dict[tuple, set] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def mac_tag(mac) -> tuple:
+        try:
+            return 'mac', str(EUI(mac))
+        except AddrFormatError:
+            return 'mac', str(mac)
+
+    @staticmethod
+    def name_tag(username: str) -> tuple:
+        return 'name', username
+
+    @staticmethod
+    def id_tag(device_id) -> tuple:
+        return 'id', int(device_id)
+
+    @classmethod
+    def key(cls, mac=None, username: Optional[str] = None, sort: Optional[str] = None,
+            limit: Optional[int] = None) -> tuple:
+        return cls.mac_tag(mac) if mac is not None else cls.name_tag(username) + (sort, limit)
+
+    def get(self, key: tuple) -> Optional[ResponseData]:
+        with self._lock:
+            if (entry := self._entries.get(key)) is None:
+                return None
+            expiry, response, tags = entry
+            if expiry <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+
+        return self._copy(response)
+
+    def put(self, key: tuple, response: ResponseData):
+        """Caches successful lookups, and "not found" answers for a shorter time. Other responses are ignored."""
+        if response.status_code == 404 or (response.status_code == 200 and not response.device):
+            ttl = self.negative_ttl
+        elif response.status_code == 200:
+            ttl = self.ttl
+        else:
+            return
+
+        response = self._copy(response)
+        tags = {key[:2]}
+        for device in response.device:
+            tags.update(self.device_tags(device))
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, response, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, tags: Iterable[tuple]):
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.get(tag, set()).copy():
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def device_tags(self, device: Device) -> set:
+        tags = {self.id_tag(device.id)}
+        if device.mac:
+            tags.add(self.mac_tag(device.mac))
+        if device.visitor_name:
+            tags.add(self.name_tag(device.visitor_name))
+        return tags
+
+    @staticmethod
+    def _copy(response: ResponseData) -> ResponseData:
+        # Callers are free to modify their result (e.g. sort the device list) without touching the cached one
+        response = copy.copy(response)
+        response.device = list(response.device)
+        return response
+
+    def _remove(self, key: Hashable):
+        expiry, response, tags = self._entries.pop(key)
+        for tag in tags:
+            if (keys := self._tags.get(tag)) is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def __len__(self):
+        return len(self._entries)
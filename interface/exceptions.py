@@ -0,0 +1,17 @@
+from typing import Optional
+
+
+class ClearPassError(Exception):
+    """ClearPass could not be asked, or did not answer with what was asked for"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(ClearPassError):
+    """ClearPass has been failing, so calls are refused without trying until the breaker's cooldown has passed"""
+
+
+class DeadlineExceeded(ClearPassError):
+    """The request's time budget for ClearPass calls ran out"""
@@ -0,0 +1,219 @@
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Optional
+
+from interface.store import private_directory
+
+# Upper bounds (seconds) of the request duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_help = {
+    'clearpass_request_duration_seconds': ('histogram', 'Duration of ClearPass HTTP calls, retries counted separately'),
+    'clearpass_responses_total': ('counter', 'ClearPass HTTP calls by outcome (status code, or the error raised)'),
+    'clearpass_retries_total': ('counter', 'ClearPass calls retried after a transient failure'),
+    'clearpass_token_renewals_total': ('counter', 'OAuth token renewals by outcome'),
+    'clearpass_requests_in_flight': ('gauge', 'ClearPass HTTP calls currently waiting on an answer'),
+}
+
+
+class Metrics:
+    """
+    Counters, gauges and histograms for the ClearPass client, kept in memory per process.
+
+    Every process writes its values to its own file in `directory` every `flush_interval` seconds, from a background
+    thread, and `render` sums the files of all processes, so whichever gunicorn worker serves the metrics view reports
+    the totals of all of them. Files of processes that have exited are removed, which Prometheus sees as a counter
+    reset. The directory must be private to the service user (see interface.store.private_directory), as every file in
+    it is trusted.
+    """
+    _logger = logging.getLogger('CPPMMetrics')
+
+    # Seconds between writes of this process' file
+    flush_interval = 1.0
+
+    def __init__(self, directory: Optional[os.PathLike] = None):
+        if directory:
+            try:
+                directory = private_directory(directory, 'CPPM_METRICS_DIR')
+            except OSError as err:
+                self._logger.error(f'Only reporting the metrics of the process serving the view: {err}')
+                directory = None
+        self.directory: Optional[Path] = directory or None
+        self._counters: dict[tuple, float] = defaultdict(float)
+        self._gauges: dict[tuple, float] = defaultdict(float)
+        self._histograms: dict[tuple, list[float]] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._writer: Optional[threading.Thread] = None
+        self._pid = None
+        self._path: Optional[Path] = None
+        self._forked()
+        if self.directory is not None:
+            atexit.register(self.flush, force=True)
+
+    def inc(self, name: str, labels: dict, value: float = 1.0):
+        with self._lock:
+            self._changed()
+            self._counters[self._key(name, labels)] += value
+
+    def observe(self, name: str, labels: dict, value: float):
+        with self._lock:
+            self._changed()
+            # Bucket counts, then the sum and the count of observations
+            buckets = self._histograms.setdefault(self._key(name, labels), [0.0] * (len(DURATION_BUCKETS) + 2))
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    buckets[i] += 1
+            buckets[-2] += value
+            buckets[-1] += 1
+
+    @contextmanager
+    def in_flight(self, labels: dict):
+        key = self._key('clearpass_requests_in_flight', labels)
+        with self._lock:
+            self._changed()
+            self._gauges[key] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._changed()
+                self._gauges[key] -= 1
+
+    def flush(self, force: bool = False):
+        """Writes this process' values to its file, if they changed since the last write or if forced"""
+        if self.directory is None:
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._forked()
+            if not (self._dirty or force):
+                return
+            self._dirty = False
+            snapshot, path = self._snapshot(), self._path
+
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(snapshot, fp)
+            os.replace(tmp_path, path)
+        except OSError as err:
+            self._logger.warning(f'Could not write metrics to {self.directory}: {err!r}')
+
+    def _changed(self):
+        """Called with the lock held before every update. Starts this process' writer thread if needed."""
+        if self._pid != os.getpid():
+            self._forked()
+        self._dirty = True
+        if self._writer is None and self.directory is not None:
+            self._writer = threading.Thread(target=self._write_periodically, daemon=True, name='CPPMMetrics')
+            self._writer.start()
+
+    def _forked(self):
+        # A forked child inherits the parent's values and lock state but not its writer thread
+        self._counters.clear()
+        self._gauges.clear()
+        self._histograms.clear()
+        self._writer = None
+        self._pid = os.getpid()
+        # The start time keeps a process that is given a dead one's pid from overwriting its file
+        if self.directory is not None:
+            self._path = self.directory / f'{self._pid}-{time.time_ns()}.json'
+
+    def _write_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def render(self) -> str:
+        """All processes' values, in the Prometheus text exposition format"""
+        self.flush(force=True)
+        counters, gauges, histograms = self._aggregate(self._collect())
+
+        lines = []
+        for name, (kind, help_text) in _help.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            if kind == 'histogram':
+                for labels, values in sorted(item for item in histograms.items() if item[0][0] == name):
+                    # Bucket counts are already cumulative, see observe
+                    for bound, count in zip(DURATION_BUCKETS, values):
+                        lines.append(f'{name}_bucket{self._labels(labels[1], le=f"{bound:g}")} {count:g}')
+                    lines.append(f'{name}_bucket{self._labels(labels[1], le="+Inf")} {values[-1]:g}')
+                    lines.append(f'{name}_sum{self._labels(labels[1])} {values[-2]:g}')
+                    lines.append(f'{name}_count{self._labels(labels[1])} {values[-1]:g}')
+            else:
+                samples = counters if kind == 'counter' else gauges
+                for labels, value in sorted(item for item in samples.items() if item[0][0] == name):
+                    lines.append(f'{name}{self._labels(labels[1])} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+    def _snapshot(self) -> dict:
+        return {
+            'counters': [[*key, value] for key, value in self._counters.items()],
+            'gauges': [[*key, value] for key, value in self._gauges.items()],
+            'histograms': [[*key, values] for key, values in self._histograms.items()],
+        }
+
+    def _collect(self) -> Iterable[dict]:
+        if self.directory is None:
+            with self._lock:
+                return [self._snapshot()]
+
+        snapshots = []
+        for path in self.directory.glob('*.json'):
+            try:
+                pid = int(path.stem.partition('-')[0])
+                if not _alive(pid):
+                    path.unlink(missing_ok=True)
+                    continue
+                snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    @staticmethod
+    def _aggregate(snapshots: Iterable[dict]) -> tuple[dict, dict, dict]:
+        counters, gauges, histograms = defaultdict(float), defaultdict(float), {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot['counters']:
+                counters[name, tuple(map(tuple, labels))] += value
+            for name, labels, value in snapshot['gauges']:
+                gauges[name, tuple(map(tuple, labels))] += value
+            for name, labels, values in snapshot['histograms']:
+                total = histograms.setdefault((name, tuple(map(tuple, labels))), [0.0] * len(values))
+                for i, value in enumerate(values):
+                    total[i] += value
+        return counters, gauges, histograms
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    @staticmethod
+    def _labels(labels: tuple, **extra: str) -> str:
+        pairs = [*labels, *extra.items()]
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,122 @@
+import contextvars
+import logging
+import math
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import httpx
+
+from interface.exceptions import CircuitOpenError, DeadlineExceeded
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('clearpass_deadline', default=None)
+
+
+@contextmanager
+def deadline(seconds: float):
+    """
+    Bounds the total time ClearPass calls may take within the block (and any thread or task started with a copy of its
+    context). Nested deadlines can only shorten the budget.
+    """
+    end = time.monotonic() + seconds
+    if (outer := _deadline.get()) is not None:
+        end = min(end, outer)
+    token = _deadline.set(end)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float:
+    """Seconds left in the current deadline, or infinity if there is none"""
+    end = _deadline.get()
+    return math.inf if end is None else end - time.monotonic()
+
+
+def bounded_timeout(timeout: httpx.Timeout) -> httpx.Timeout:
+    """Shrinks `timeout` to fit the current deadline. Raises DeadlineExceeded if there is no time left."""
+    if (left := remaining()) == math.inf:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded('ClearPass time budget exhausted')
+    return httpx.Timeout(
+        connect=min(timeout.connect or left, left),
+        read=min(timeout.read or left, left),
+        write=min(timeout.write or left, left),
+        pool=min(timeout.pool or left, left),
+    )
+
+
+def retry_delays(retries: int, base: float, cap: float = 2.0) -> Iterator[float]:
+    """Exponential backoff with full jitter, stopping early if the next wait would not fit in the deadline"""
+    for attempt in range(retries):
+        delay = random.uniform(0, min(cap, base * 2 ** attempt))
+        if delay >= remaining():
+            return
+        yield delay
+
+
+class CircuitBreaker:
+    """
+    Tracks the outcome of the last `window` calls. Once at least `min_calls` were made and the failure rate reaches
+    `failure_rate`, the circuit opens and calls fail fast for `cooldown` seconds. Then a single probe call is let
+    through (half-open): if it succeeds the circuit closes, otherwise it opens again.
+    """
+    _logger = logging.getLogger('CPPMBreaker')
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, window: int, min_calls: int, failure_rate: float, cooldown: float):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raises CircuitOpenError if the call must not be made"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self._opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                self._probe_started = None
+            # A probe that never reported back (e.g. a cancelled task) is given up on after another cooldown
+            if self.state == self.HALF_OPEN and (self._probe_started is None
+                                                 or now - self._probe_started >= self.cooldown):
+                self._probe_started = now
+                return
+        raise CircuitOpenError('ClearPass circuit breaker is open')
+
+    def record(self, success: bool):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe_started = None
+                if success:
+                    self._logger.info('ClearPass recovered, closing circuit')
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (self.state == self.CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_rate):
+                self._logger.error(f'{failures} of the last {len(self._outcomes)} ClearPass calls failed, '
+                                   f'opening circuit for {self.cooldown:.0f}s')
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
@@ -0,0 +1,89 @@
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines. Renewals are then only coalesced within a process.
+    fcntl = None
+
+
+def private_directory(directory: os.PathLike, setting: str) -> Path:
+    """
+    Creates `directory` private to this user, or raises PermissionError if it exists and other users can write to it.
+    `setting` names the environment variable to point elsewhere in the error.
+    """
+    directory = Path(directory)
+    directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+    stat = directory.stat()
+    if (hasattr(os, 'getuid') and stat.st_uid != os.getuid()) or stat.st_mode & 0o022:
+        raise PermissionError(f'{directory} must be owned by this user and not writable by others. '
+                              f'Set {setting} to a private directory.')
+    return directory
+
+
+class SharedTokenStore:
+    """
+    A small JSON file holding the current ClearPass token and its expiry, shared by every worker process on the host.
+    Writes are atomic (rename), and `locked()` holds an exclusive flock so only one process renews at a time.
+    """
+    _logger = logging.getLogger('CPPMTokenStore')
+
+    def __init__(self, path: os.PathLike):
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(self.path.name + '.lock')
+        self._check_directory()
+
+    def _check_directory(self):
+        # Anyone else able to write to it could plant a token, or hold the lock file and block every renewal
+        private_directory(self.path.parent, 'CPPM_TOKEN_CACHE')
+
+    def load(self) -> Optional[tuple[str, float]]:
+        """Returns (token, expiry) if the stored token has not expired yet"""
+        try:
+            data = json.loads(self.path.read_text())
+            token, expiry = data['access_token'], float(data['expires_at'])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as err:
+            self._logger.warning(f'Ignoring unreadable token cache {self.path}: {err!r}')
+            return None
+
+        return (token, expiry) if token and expiry > time.time() else None
+
+    def save(self, token: str, expiry: float):
+        # The token is a credential: only the service user may read it
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name)
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                json.dump({'access_token': token, 'expires_at': expiry}, fp)
+            os.replace(tmp_path, self.path)
+        except OSError as err:
+            self._logger.error(f'Could not write token cache {self.path}: {err!r}')
+            Path(tmp_path).unlink(missing_ok=True)
+
+    def acquire(self) -> Optional[int]:
+        if fcntl is None:
+            return None
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    @staticmethod
+    def release(fd: Optional[int]):
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    @contextmanager
+    def locked(self):
+        fd = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(fd)
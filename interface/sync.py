@@ -0,0 +1,170 @@
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Iterator, Optional
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from interface.api import Token
+from interface.exceptions import ClearPassError
+from interface.wrapper import Device, ResponseData
+from login.models import ClearPassDevice, User
+
+
+@dataclass
+class SyncStats:
+    seen: int = 0
+    created: int = 0
+    updated: int = 0
+    deleted: int = 0
+    skipped: int = 0
+
+    def __str__(self):
+        return f'seen {self.seen}, created {self.created}, updated {self.updated}, deleted {self.deleted}, ' \
+               f'skipped {self.skipped}'
+
+
+class DeviceSync:
+    """
+    Mirrors the ClearPass device list into ClearPassDevice, one page at a time.
+
+    A full sync walks every device and deletes local rows ClearPass no longer has. An incremental sync only asks
+    ClearPass for devices started (registered or updated) since the newest one already mirrored. Either way, rows are
+    only written when the hash of their ClearPass record changed. Devices ClearPass holds invalid data for are logged
+    and skipped, their rows are left as they are.
+    """
+    _logger = logging.getLogger('CPPMSync')
+
+    page_size = 1000
+
+    # ClearPass' clock runs ahead of ours (see Token.add_device), so incremental syncs look back further than needed
+    incremental_overlap = timedelta(hours=1)
+
+    def __init__(self, access: Optional[Token] = None):
+        self.access = access or Token()
+
+    def run(self, full: bool = False) -> SyncStats:
+        stats = SyncStats()
+        started = timezone.now()
+        filters = None if full else self._incremental_filter()
+        seen_ids = set()
+
+        for page in self._pages(filters):
+            self._apply_page(page.device, started, stats)
+            seen_ids.update(device.id for device in page.device)
+
+        if filters is None:
+            stats.deleted = self._delete_missing(seen_ids)
+
+        self._logger.info(f'{"Full" if full else "Incremental"} device sync: {stats}')
+        return stats
+
+    def _pages(self, filters: Optional[dict]) -> Iterator[ResponseData]:
+        """
+        Pages through the devices by id (id > the last one seen) rather than by offset. Devices deleted during the walk
+        would shift the offsets of the following pages, so devices would be missed, and their rows deleted.
+        """
+        last_id = None
+        while True:
+            page_filters = {**(filters or {}), **({'id': {'$gt': last_id}} if last_id is not None else {})}
+            page = self.access.list_devices(page_filters or None, sort='+id', limit=self.page_size)
+            if page.status_code != 200:
+                raise ClearPassError(f'Could not list devices after id {last_id}: HTTP {page.status_code}',
+                                     page.status_code)
+            yield page
+            if not page.device or (page.next_url is None and len(page.device) < self.page_size):
+                return
+            last_id = page.device[-1].id
+
+    def _incremental_filter(self) -> Optional[dict]:
+        newest = ClearPassDevice.objects.aggregate(newest=Max('start_time'))['newest']
+        if newest is None:
+            return None
+        return {'start_time': {'$gte': int((newest - self.incremental_overlap).timestamp())}}
+
+    def _apply_page(self, devices: list[Device], synced_at: datetime, stats: SyncStats):
+        stats.seen += len(devices)
+        existing = {
+            clearpass_id: (pk, digest)
+            for pk, clearpass_id, digest in ClearPassDevice.objects
+            .filter(clearpass_id__in=[device.id for device in devices])
+            .values_list('pk', 'clearpass_id', 'digest')
+        }
+        users = self._resolve_users(devices)
+
+        to_create, to_update = [], []
+        for device in devices:
+            try:
+                row = self._to_row(device, users, synced_at)
+            except ValidationError:
+                self._logger.warning(f'Skipping ClearPass device {device.id}: invalid MAC address {device.mac!r}')
+                stats.skipped += 1
+                continue
+            if (known := existing.get(row.clearpass_id)) is None:
+                to_create.append(row)
+            elif known[1] != row.digest:
+                row.pk = known[0]
+                to_update.append(row)
+
+        with transaction.atomic():
+            ClearPassDevice.objects.bulk_create(to_create, batch_size=500)
+            ClearPassDevice.objects.bulk_update(to_update, fields=[
+                'mac_address', 'visitor_name', 'user', 'notes', 'sponsor_name', 'start_time', 'expire_time',
+                'digest', 'synced_at',
+            ], batch_size=500)
+        stats.created += len(to_create)
+        stats.updated += len(to_update)
+
+    @staticmethod
+    def _delete_missing(seen_ids: set[int]) -> int:
+        stale = [pk for pk, clearpass_id in ClearPassDevice.objects.values_list('pk', 'clearpass_id').iterator()
+                 if clearpass_id not in seen_ids]
+        deleted = 0
+        for i in range(0, len(stale), 500):
+            deleted += ClearPassDevice.objects.filter(pk__in=stale[i:i + 500]).delete()[0]
+        return deleted
+
+    @staticmethod
+    def _resolve_users(devices: list[Device]) -> dict[str, int]:
+        """Maps the usernames in the visitor names (see User.clearpass_name) of a page to user ids, in one query"""
+        usernames = {username_of(device.visitor_name) for device in devices} - {None}
+        return dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+
+    @staticmethod
+    def _to_row(device: Device, users: dict[str, int], synced_at: datetime) -> ClearPassDevice:
+        return ClearPassDevice(
+            clearpass_id=device.id,
+            mac_address=ClearPassDevice._meta.get_field('mac_address').clean(device.mac, None),
+            visitor_name=device.visitor_name or '',
+            user_id=users.get(username_of(device.visitor_name)),
+            notes=device.notes,
+            sponsor_name=device.sponsor_name,
+            start_time=parse_clearpass_time(device.start_time),
+            expire_time=parse_clearpass_time(device.expire_time),
+            digest=hashlib.md5(json.dumps(device.as_dict(), sort_keys=True, default=str).encode()).hexdigest(),
+            synced_at=synced_at,
+        )
+
+
+def username_of(visitor_name: Optional[str]) -> Optional[str]:
+    """'S:12345678' -> '12345678'. The inverse of User.clearpass_name"""
+    if not visitor_name:
+        return None
+    prefix, sep, username = visitor_name.partition(':')
+    return username.lower() if sep else None
+
+
+def parse_clearpass_time(value) -> Optional[datetime]:
+    """ClearPass reports times as UNIX timestamps. Anything else readable as a datetime is accepted as well."""
+    if value in (None, ''):
+        return None
+    try:
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError):
+        return parse_datetime(str(value))
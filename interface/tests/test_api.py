@@ -0,0 +1,160 @@
+import asyncio
+import os
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from netaddr import EUI
+
+from benchmarks.fake_clearpass import FakeClearPass
+from interface.api import AsyncToken, Token
+
+# Per-process state of the client, reset so every test starts cold
+_process_state = {'_device_cache': None, '_breaker': None, '_metrics': None, '_store': None, '_store_refused': False}
+
+
+@override_settings(CLEARPASS_API={**settings.CLEARPASS_API, 'TOKEN_CACHE': '', 'METRICS_DIR': '', 'RETRIES': 0})
+class FakeClearPassTestCase(SimpleTestCase):
+    """Runs the client against benchmarks.fake_clearpass, seeded with 3 devices for each of 10 users"""
+    user = 'S:200000001'
+
+    def setUp(self):
+        self.server = FakeClearPass(client_id='client', client_secret='secret')
+        self.server.store.seed(30, 10)
+        self.enter(self.server.running())
+        self.enter(mock.patch.dict(os.environ, BASE_URL=self.server.base_url, CLIENT_ID='client',
+                                          CLIENT_SECRET='secret'))
+        for name, value in _process_state.items():
+            self.enter(mock.patch.object(Token, name, value))
+
+    def enter(self, context):
+        # TestCase.enterContext is Python 3.11+
+        value = context.__enter__()
+        self.addCleanup(context.__exit__, None, None, None)
+        return value
+
+    def requests(self, route: str) -> int:
+        return self.server.stats[route]
+
+    def user_devices(self, username: str) -> list[dict]:
+        return self.server.store.query({'visitor_name': username}, '+start_time')
+
+
+class TokenTests(FakeClearPassTestCase):
+    def setUp(self):
+        super().setUp()
+        self.access = Token()
+
+    def test_token_grant(self):
+        self.access.ensure_token()
+
+        self.assertTrue(self.server.token_valid(self.access.token))
+        self.assertAlmostEqual(self.access.token_expiry, time.time() + self.server.faults.token_ttl, delta=5)
+        self.assertEqual(self.requests('POST oauth'), 1)
+
+    def test_renews_an_expired_token(self):
+        self.access.ensure_token()
+        self.access.token_expiry = time.time() - 1
+
+        self.access.ensure_token()
+
+        self.assertEqual(self.requests('POST oauth'), 2)
+
+    def test_renews_a_revoked_token(self):
+        self.access.ensure_token()
+        self.server.tokens.clear()
+
+        response = self.access.list_devices(limit=1)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.server.token_valid(self.access.token))
+        self.assertEqual(self.requests('POST oauth'), 2)
+
+    def test_get_device_is_cached_until_deleted(self):
+        mac = EUI(self.user_devices(self.user)[0]['mac'])
+
+        self.assertEqual(self.access.get_device(mac=mac).device[0].visitor_name, self.user)
+        self.access.get_device(mac=mac)
+        self.assertEqual(self.requests('GET get_device'), 1)
+
+        self.assertEqual(self.access.delete_device(mac).status_code, 204)
+        self.assertEqual(self.access.get_device(mac=mac).status_code, 404)
+        self.assertEqual(self.requests('GET get_device'), 2)
+
+    def test_added_device_is_looked_up_from_the_cache(self):
+        mac = EUI('00-aa-00-00-00-01')
+        self.assertEqual(self.access.add_device(mac, self.user).status_code, 201)
+
+        response = self.access.get_device(mac=mac)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.device[0].visitor_name, self.user)
+        self.assertEqual(self.requests('GET get_device'), 0)
+
+    def test_iter_devices_pages(self):
+        for i in range(20):
+            self.server.store.add({'mac': f'00-aa-00-00-00-{i:02x}', 'visitor_name': self.user})
+
+        devices = list(self.access.iter_devices(self.user, page_size=10))
+
+        self.assertEqual(len(devices), 23)
+        self.assertEqual(len({device.id for device in devices}), 23)
+        self.assertEqual(self.requests('GET list_devices'), 3)
+
+    def test_replace_oldest_device(self):
+        oldest = self.user_devices(self.user)[0]
+
+        self.assertIsNone(self.access.replace_oldest_device(self.user, EUI('00-aa-00-00-00-01'), 'new', 4))
+        response = self.access.replace_oldest_device(self.user, EUI('00-aa-00-00-00-01'), 'new', 3)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.device[0].id, oldest['id'])
+        self.assertEqual(self.server.store.find(device_id=oldest['id'])['mac'], '00-AA-00-00-00-01')
+        self.assertEqual(len(self.user_devices(self.user)), 3)
+
+
+class AsyncTokenTests(FakeClearPassTestCase):
+    def setUp(self):
+        super().setUp()
+        self.access = AsyncToken()
+
+    def test_token_grant_and_renewal(self):
+        async def run():
+            await self.access.ensure_token()
+            self.server.tokens.clear()
+            return await self.access.list_devices(limit=1)
+
+        self.assertEqual(asyncio.run(run()).status_code, 200)
+        self.assertTrue(self.server.token_valid(self.access.token))
+        self.assertEqual(self.requests('POST oauth'), 2)
+
+    def test_get_device_is_cached_until_deleted(self):
+        mac = EUI(self.user_devices(self.user)[0]['mac'])
+
+        async def run():
+            await self.access.get_device(mac=mac)
+            await self.access.get_device(mac=mac)
+            await self.access.delete_device(mac)
+            return await self.access.get_device(mac=mac)
+
+        self.assertEqual(asyncio.run(run()).status_code, 404)
+        self.assertEqual(self.requests('GET get_device'), 2)
+
+    def test_iter_devices_pages(self):
+        for i in range(20):
+            self.server.store.add({'mac': f'00-aa-00-00-00-{i:02x}', 'visitor_name': self.user})
+
+        async def run():
+            return [device async for device in self.access.iter_devices(self.user, page_size=10)]
+
+        self.assertEqual(len(asyncio.run(run())), 23)
+        self.assertEqual(self.requests('GET list_devices'), 3)
+
+    def test_replace_oldest_device(self):
+        oldest = self.user_devices(self.user)[0]
+
+        response = asyncio.run(self.access.replace_oldest_device(self.user, EUI('00-aa-00-00-00-01'), 'new', 3))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.store.find(device_id=oldest['id'])['mac'], '00-AA-00-00-00-01')
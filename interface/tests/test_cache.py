@@ -0,0 +1,96 @@
+import json
+from unittest import mock
+
+import httpx
+from django.test import SimpleTestCase
+
+from interface import cache
+from interface.cache import DeviceCache
+from interface.wrapper import ResponseData
+
+
+def response(status: int, *devices: dict) -> ResponseData:
+    body = {'_embedded': {'items': list(devices)}} if status == 200 else (devices[0] if devices else {})
+    return ResponseData(status, httpx.Response(status, content=json.dumps(body).encode()))
+
+
+def device(device_id: int, mac: str, visitor_name: str = 'alice') -> dict:
+    return {'id': device_id, 'mac': mac, 'visitor_name': visitor_name}
+
+
+class DeviceCacheTests(SimpleTestCase):
+    mac = '00-16-3E-00-00-01'
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(cache, 'time', mock.Mock(monotonic=lambda: self.now))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = DeviceCache(maxsize=2, ttl=60, negative_ttl=5)
+
+    def put_device(self, device_id: int, mac: str, visitor_name: str = 'alice') -> tuple:
+        key = DeviceCache.key(mac)
+        self.cache.put(key, response(200, device(device_id, mac, visitor_name)))
+        return key
+
+    def test_entries_expire_after_their_ttl(self):
+        key = self.put_device(1, self.mac)
+        self.now += 59
+        self.assertEqual(self.cache.get(key).device[0].id, 1)
+
+        self.now += 1
+
+        self.assertIsNone(self.cache.get(key))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_not_found_expires_after_the_negative_ttl(self):
+        key = DeviceCache.key(self.mac)
+        self.cache.put(key, response(404))
+        self.assertEqual(self.cache.get(key).status_code, 404)
+
+        self.now += 5
+
+        self.assertIsNone(self.cache.get(key))
+
+    def test_least_recently_used_is_evicted(self):
+        first = self.put_device(1, '00-16-3E-00-00-01')
+        second = self.put_device(2, '00-16-3E-00-00-02')
+        self.cache.get(first)
+
+        third = self.put_device(3, '00-16-3E-00-00-03')
+
+        self.assertIsNone(self.cache.get(second))
+        self.assertIsNotNone(self.cache.get(first))
+        self.assertIsNotNone(self.cache.get(third))
+
+    def test_update_invalidates_by_id(self):
+        key = self.put_device(1, self.mac)
+
+        self.cache.invalidate([DeviceCache.id_tag(1)])
+
+        self.assertIsNone(self.cache.get(key))
+
+    def test_delete_invalidates_the_owners_device_list(self):
+        devices = DeviceCache.key(username='alice', sort='+start_time')
+        self.cache.put(devices, response(200, device(1, self.mac), device(2, '00-16-3E-00-00-02')))
+        other = self.put_device(3, '00-16-3E-00-00-03', 'bob')
+
+        # MACs are tagged in one dialect, whatever dialect they are invalidated with
+        self.cache.invalidate([DeviceCache.mac_tag('00:16:3e:00:00:01')])
+
+        self.assertIsNone(self.cache.get(devices))
+        self.assertIsNotNone(self.cache.get(other))
+
+    def test_errors_and_add_responses_are_not_cached(self):
+        key = DeviceCache.key(self.mac)
+        for status in (201, 401, 500):
+            with self.subTest(status=status):
+                self.cache.put(key, response(status, device(1, self.mac)))
+                self.assertIsNone(self.cache.get(key))
+
+    def test_callers_get_a_copy(self):
+        key = self.put_device(1, self.mac)
+
+        self.cache.get(key).device.clear()
+
+        self.assertEqual(len(self.cache.get(key).device), 1)
@@ -0,0 +1,132 @@
+import time
+from unittest import mock
+
+import httpx
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from interface import resilience
+from interface.api import Token
+from interface.exceptions import CircuitOpenError, DeadlineExceeded
+from interface.tests.test_api import FakeClearPassTestCase
+
+
+class ClockTestCase(SimpleTestCase):
+    """resilience's time.monotonic, advanced by hand"""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(resilience, 'time', mock.Mock(monotonic=lambda: self.now))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class CircuitBreakerTests(ClockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.breaker = resilience.CircuitBreaker(window=4, min_calls=4, failure_rate=0.5, cooldown=30)
+
+    def trip(self):
+        for success in (True, True, False, False):
+            self.breaker.before_call()
+            self.breaker.record(success)
+
+    def test_opens_at_the_failure_rate(self):
+        for success in (True, True, True, False):
+            self.breaker.record(success)
+        self.assertEqual(self.breaker.state, self.breaker.CLOSED)
+
+        self.breaker.record(False)
+
+        self.assertEqual(self.breaker.state, self.breaker.OPEN)
+        self.assertRaises(CircuitOpenError, self.breaker.before_call)
+
+    def test_half_open_after_cooldown_then_closes(self):
+        self.trip()
+        self.now += 29
+        self.assertRaises(CircuitOpenError, self.breaker.before_call)
+
+        self.now += 1
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, self.breaker.HALF_OPEN)
+
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, self.breaker.CLOSED)
+        self.breaker.before_call()
+
+    def test_failed_probe_opens_again(self):
+        self.trip()
+        self.now += 30
+        self.breaker.before_call()
+
+        self.breaker.record(False)
+
+        self.assertEqual(self.breaker.state, self.breaker.OPEN)
+        self.assertRaises(CircuitOpenError, self.breaker.before_call)
+
+    def test_single_probe_while_half_open(self):
+        self.trip()
+        self.now += 30
+        self.breaker.before_call()
+
+        self.assertRaises(CircuitOpenError, self.breaker.before_call)
+        self.now += 29
+        self.assertRaises(CircuitOpenError, self.breaker.before_call)
+
+    def test_lost_probe_is_replaced_after_cooldown(self):
+        self.trip()
+        self.now += 30
+        self.breaker.before_call()
+
+        self.now += 30
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, self.breaker.HALF_OPEN)
+
+
+@mock.patch.object(resilience.random, 'uniform', lambda low, high: high)
+class DeadlineTests(ClockTestCase):
+    def test_retries_stop_when_the_budget_runs_out(self):
+        with resilience.deadline(1.0):
+            delays = resilience.retry_delays(retries=5, base=0.4)
+            self.assertEqual(next(delays), 0.4)
+            self.now += 0.4
+            # 0.8 s would not fit in the 0.6 s left
+            self.assertIsNone(next(delays, None))
+
+    def test_timeout_is_cut_to_the_budget(self):
+        with resilience.deadline(1.0):
+            self.now += 0.75
+            timeout = resilience.bounded_timeout(httpx.Timeout(5, connect=3))
+            self.assertEqual((timeout.connect, timeout.read), (0.25, 0.25))
+
+            self.now += 0.25
+            self.assertRaises(DeadlineExceeded, resilience.bounded_timeout, httpx.Timeout(5))
+
+    def test_nested_deadline_only_shortens(self):
+        with resilience.deadline(1.0):
+            with resilience.deadline(10.0):
+                self.assertEqual(resilience.remaining(), 1.0)
+            with resilience.deadline(0.5):
+                self.assertEqual(resilience.remaining(), 0.5)
+        self.assertEqual(resilience.remaining(), float('inf'))
+
+    def test_no_deadline_keeps_all_retries(self):
+        self.assertEqual(list(resilience.retry_delays(retries=3, base=0.4)), [0.4, 0.8, 1.6])
+
+
+class RequestBudgetTests(FakeClearPassTestCase):
+    def test_budget_runs_out_during_retries(self):
+        access = Token()
+        access.ensure_token()
+        self.server.faults.error_rate, self.server.faults.error_codes = 1.0, (503,)
+
+        with override_settings(CLEARPASS_API={**settings.CLEARPASS_API, 'RETRIES': 10, 'RETRY_BACKOFF': 0.2}), \
+                mock.patch.object(resilience.random, 'uniform', lambda low, high: high), \
+                resilience.deadline(1.0):
+            start = time.monotonic()
+            response = access.list_devices(limit=1)
+
+        # Waits of 0.2 s and 0.4 s fit in the budget, the next 0.8 s does not: three attempts, not eleven
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.requests('GET list_devices'), 3)
+        self.assertLess(time.monotonic() - start, 1.0)
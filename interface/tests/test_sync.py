@@ -0,0 +1,47 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from interface.api import Token
+from interface.sync import DeviceSync
+from interface.tests.test_api import FakeClearPassTestCase
+from login.models import ClearPassDevice
+
+
+class DeviceSyncTests(FakeClearPassTestCase, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.sync = DeviceSync(Token())
+        self.sync.page_size = 10
+
+    def test_full_sync(self):
+        stats = self.sync.run(full=True)
+
+        self.assertEqual((stats.seen, stats.created), (30, 30))
+        self.assertEqual(ClearPassDevice.objects.count(), 30)
+        self.assertEqual(self.requests('GET list_devices'), 4)
+
+    def test_devices_deleted_during_a_full_sync_do_not_shift_the_pages(self):
+        self.sync.run(full=True)
+        list_devices = self.sync.access.list_devices
+        first = min(self.server.store.devices.values(), key=lambda device: device['id'])
+
+        def delete_after_the_first_page(*args, **kwargs):
+            page = list_devices(*args, **kwargs)
+            if first['id'] in self.server.store.devices:
+                self.server.store.delete(first)
+            return page
+
+        with mock.patch.object(self.sync.access, 'list_devices', side_effect=delete_after_the_first_page):
+            stats = self.sync.run(full=True)
+
+        # An offset would have skipped the device that moved onto the first page, and deleted its row
+        self.assertEqual((stats.seen, stats.deleted), (30, 0))
+        self.assertEqual(ClearPassDevice.objects.count(), 30)
+
+    def test_invalid_mac_is_skipped(self):
+        self.server.store.add({'mac': 'not a mac', 'visitor_name': self.user})
+
+        stats = self.sync.run(full=True)
+
+        self.assertEqual((stats.seen, stats.created, stats.skipped), (31, 30, 1))
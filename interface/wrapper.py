@@ -1,45 +1,160 @@
-from dataclasses import dataclass, field, fields
-from typing import Union
+import json
+from typing import Iterator, Optional, Union
+
+from interface.exceptions import ClearPassError
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # orjson is optional, it only speeds up decoding large device lists
+    _loads = json.loads
+
+
+class Device:
+    """
+    A ClearPass device record. Fields are read from the decoded JSON item on access, nothing is copied up front.
+    Item access (device['mac']) is kept for code written against the old dict records.
+    """
+    __slots__ = ('_raw',)
+
+    _fields = ('id', 'mac', 'notes', 'start_time', 'expire_time', 'sponsor_name', 'visitor_name')
+
+    # Keys of the old dict records, including their misspellings
+    _aliases = {
+        'expire_name': 'expire_time',
+        'sponosor_name': 'sponsor_name',
+        'device_name': 'visitor_name',
+    }
+
+    def __init__(self, raw: dict):
+        self._raw = raw
+
+    @property
+    def id(self) -> int:
+        return int(self._raw['id'])
+
+    @property
+    def mac(self) -> str:
+        return self._raw['mac']
+
+    @property
+    def notes(self) -> Optional[str]:
+        return self._raw.get('notes')
+
+    @property
+    def start_time(self) -> Union[str, int, None]:
+        return self._raw.get('start_time')
+
+    @property
+    def expire_time(self) -> Union[str, int, None]:
+        return self._raw.get('expire_time')
+
+    @property
+    def sponsor_name(self) -> Optional[str]:
+        return self._raw.get('sponsor_name')
+
+    @property
+    def visitor_name(self) -> Optional[str]:
+        return self._raw.get('visitor_name')
+
+    def __getitem__(self, key: str):
+        key = self._aliases.get(key, key)
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def as_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self._fields}
+
+    def __eq__(self, other):
+        return isinstance(other, Device) and self._raw == other._raw
+
+    def __repr__(self):
+        return f'Device(id={self._raw.get("id")}, mac={self._raw.get("mac")}, visitor={self.visitor_name})'
 
 
-@dataclass
 class ResponseData:
-    device: list[dict[str, Union[str, int]]] = None
-    status_code: int = None
+    """
+    A ClearPass response. The body is only decoded when its contents are first asked for, and Device records are only
+    created for the items that are iterated over or listed.
+    """
+    __slots__ = ('status_code', '_content', '_items', '_device', '_next_url', '_total')
 
     def __init__(self, status, res):
-        self.status_code = status
-        self._initiate_field()
-        try:
-            response = res.json()
-        except:
-            return
+        self.status_code: int = status
+        self._content: Optional[bytes] = res.content
+        self._items: Optional[list[dict]] = None
+        self._device: Optional[list[Device]] = None
+        self._next_url: Optional[str] = None
+        self._total: Optional[int] = None
 
-        if str(self.status_code)[0] == '4':
-            return
+    @property
+    def device(self) -> list[Device]:
+        if self._device is None:
+            self._device = [Device(item) for item in self._decoded_items()]
+        return self._device
 
-        if '_embedded' in response:
-            for data in response['_embedded']['items']:
-                self._add_device(self._create_device(data))
-        else:
-            self._add_device(self._create_device(response))
+    @device.setter
+    def device(self, value: list[Device]):
+        self._device = value
+
+    @property
+    def next_url(self) -> Optional[str]:
+        """`_links.next` of a paged list"""
+        self._decoded_items()
+        return self._next_url
+
+    @property
+    def total(self) -> Optional[int]:
+        """Number of matching devices across all pages, if the list was requested with calculate_count"""
+        self._decoded_items()
+        return self._total
+
+    @property
+    def count(self) -> int:
+        return len(self._device if self._device is not None else self._decoded_items())
+
+    def raise_for_status(self, allow=()) -> 'ResponseData':
+        """Raises ClearPassError if ClearPass answered with an error status, other than those in `allow`"""
+        if self.status_code >= 400 and self.status_code not in allow:
+            raise ClearPassError(f'HTTP {self.status_code}', self.status_code)
+        return self
+
+    def __iter__(self) -> Iterator[Device]:
+        if self._device is not None:
+            return iter(self._device)
+        return map(Device, self._decoded_items())
 
     def __eq__(self, other):
         return self.device == other.device
 
-    def _initiate_field(self):
-        self.device = []
-
-    def _create_device(self, data):
-        return {
-            'id': int(data['id']),
-            'mac': data['mac'],
-            'notes': data['notes'],
-            'start_time': data['start_time'],
-            'expire_name': data['expire_time'],
-            'sponosor_name': data['sponsor_name'],
-            'device_name': data['visitor_name']
-        }
-
-    def _add_device(self, d):
-        self.device.append(d)
+    def __copy__(self):
+        new = ResponseData.__new__(ResponseData)
+        new.status_code, new._content, new._items, new._device, new._next_url, new._total = \
+            self.status_code, self._content, self._items, self._device, self._next_url, self._total
+        return new
+
+    def _decoded_items(self) -> list[dict]:
+        if self._items is None:
+            self._items = self._decode()
+        return self._items
+
+    def _decode(self) -> list[dict]:
+        content, self._content = self._content, None
+        if str(self.status_code)[0] == '4' or not content:
+            return []
+
+        try:
+            response = _loads(content)
+        except ValueError:
+            return []
+
+        if not isinstance(response, dict):
+            return []
+        if '_embedded' in response:
+            self._next_url = response.get('_links', {}).get('next', {}).get('href')
+            self._total = response.get('count')
+            return response['_embedded']['items']
+        if 'id' in response:
+            return [response]
+        return []
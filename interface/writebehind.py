@@ -0,0 +1,101 @@
+import logging
+import time
+from datetime import timedelta
+from typing import Optional
+
+import httpx
+from django.conf import settings
+from django.db import close_old_connections
+from netaddr import EUI
+
+from interface.api import Token
+from interface.bulk import BulkExecutor
+from interface.cache import DeviceCache
+from interface.exceptions import ClearPassError, CircuitOpenError
+from login.models import DeviceMutation
+
+
+class DeviceQueueWorker:
+    """
+    Drains DeviceMutation, writing registrations to ClearPass in batches of concurrent calls.
+
+    Each registration is idempotent: ClearPass is first asked whether the MAC is already registered to the user (e.g.
+    because an earlier attempt timed out after ClearPass had stored it), and only then is a device added, or the user's
+    oldest device replaced if they are at their limit. Failures are retried with exponential backoff.
+    """
+    _logger = logging.getLogger('CPPMQueue')
+
+    # 4xx answers mean ClearPass rejected the registration itself, so it is not retried. Except for these.
+    transient_status_codes = (401, 403, 408, 409, 429)
+
+    def __init__(self, access: Optional[Token] = None, batch: Optional[int] = None):
+        conf = settings.CLEARPASS_API
+        self.access = access or Token()
+        self.batch = batch or conf['QUEUE_BATCH']
+        self.max_attempts = conf['QUEUE_MAX_ATTEMPTS']
+        self.backoff = conf['QUEUE_BACKOFF']
+
+    def run(self, interval: float, once: bool = False):
+        with BulkExecutor() as pool:
+            while True:
+                processed = self.drain(pool)
+                if once:
+                    return processed
+                if not processed:
+                    time.sleep(interval)
+
+    def drain(self, pool: BulkExecutor) -> int:
+        """Claims and runs one batch, returning how many jobs it held"""
+        close_old_connections()
+        jobs = DeviceMutation.claim(self.batch)
+        for future in [pool.submit(self.process, job) for job in jobs]:
+            future.result()
+        return len(jobs)
+
+    def process(self, job: DeviceMutation):
+        try:
+            self.register(job)
+        except (ClearPassError, httpx.HTTPError) as err:
+            # The breaker being open says nothing about this job, so it does not count as an attempt
+            if isinstance(err, CircuitOpenError):
+                job.attempts -= 1
+            status = getattr(err, 'status_code', None)
+            self._failed(job, repr(err), permanent=status is not None and 400 <= status < 500
+                         and status not in self.transient_status_codes)
+        except Exception as err:
+            self._logger.exception(f'Registering {job.mac_address} failed')
+            self._failed(job, repr(err), permanent=False)
+        else:
+            job.succeed()
+            self._logger.info(f'Registered {job.mac_address} to {job.visitor_name} after {job.attempts} attempt(s)')
+        finally:
+            close_old_connections()
+
+    def register(self, job: DeviceMutation):
+        # Decisions are made on what ClearPass has now, not on what this process cached
+        self.access.get_device_cache().invalidate([DeviceCache.mac_tag(job.mac_address),
+                                                   DeviceCache.name_tag(job.visitor_name)])
+
+        mac = EUI(job.mac_address)
+        existing = self.access.get_device(mac=mac)
+        existing.raise_for_status(allow=(404,))
+        if existing.status_code != 404 and any(device.visitor_name == job.visitor_name for device in existing):
+            return
+
+        if job.device_limit is not None:
+            replaced = self.access.replace_oldest_device(job.visitor_name, mac, job.device_name, job.device_limit)
+            if replaced is not None:
+                replaced.raise_for_status()
+                return
+
+        self.access.add_device(mac=mac, username=job.visitor_name, device_name=job.device_name,
+                               time=job.expire_time).raise_for_status()
+
+    def _failed(self, job: DeviceMutation, error: str, permanent: bool):
+        if permanent or job.attempts + 1 >= self.max_attempts:
+            self._logger.error(f'Giving up on registering {job.mac_address} to {job.visitor_name}: {error}')
+            job.fail(error, retry_in=None)
+        else:
+            retry_in = timedelta(seconds=self.backoff * 2 ** job.attempts)
+            self._logger.warning(f'Registering {job.mac_address} failed ({error}), retrying in {retry_in}')
+            job.fail(error, retry_in=retry_in)
@@ -6,6 +6,9 @@ from .usertype import UserTypeAdmin
 from .permissions import PermissionsAdmin
 from .history import LoginHistoryAdmin
 from .session import SessionAdmin
+from .bulkJob import BulkJobAdmin
+from .clearpassDevice import ClearPassDeviceAdmin
+from .deviceMutation import DeviceMutationAdmin
 
 # Remove Groups from admin page
 admin.site.unregister(Group)
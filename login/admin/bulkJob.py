@@ -0,0 +1,36 @@
+from django.contrib import admin
+from django.utils.html import format_html_join
+from django.utils.safestring import mark_safe
+
+from login.models import BulkJob
+
+
+@admin.register(BulkJob)
+class BulkJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'action', 'created_by', 'status', 'get_progress', 'failed', 'created', 'finished')
+    list_filter = ('status', 'action')
+    ordering = ('-created',)
+    fields = ('action', 'created_by', 'status', 'get_progress', 'failed', 'created', 'finished', 'heartbeat', 'error',
+              'get_summary')
+    readonly_fields = fields
+
+    @admin.display(description='Progress')
+    def get_progress(self, obj: BulkJob):
+        return f'{obj.completed} / {obj.total}'
+
+    @admin.display(description='Summary')
+    def get_summary(self, obj: BulkJob):
+        # Failures first, they are what the admin needs to act on
+        items = sorted(obj.summary.items(), key=lambda item: item[1].get('ok', False))
+        return format_html_join(
+            mark_safe(''), '<pre style="margin: 0em 0em;">{} {}: {}</pre>',
+            (('OK  ' if res.get('ok') else 'FAIL', name, ', '.join(res.get('errors') or res.get('devices') or ['-']))
+             for name, res in items)
+        ) or '-'
+
+    # Jobs are only created by admin actions
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,34 @@
+from django.contrib import admin
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+
+from login.models import ClearPassDevice
+
+
+@admin.register(ClearPassDevice)
+class ClearPassDeviceAdmin(admin.ModelAdmin):
+    list_display = ('mac_address', 'visitor_name', 'get_user', 'notes', 'start_time', 'expire_time', 'synced_at')
+    search_fields = ('mac_address', 'visitor_name', 'user__username')
+    search_help_text = "Searches filter by mac address, visitor name, and username"
+    list_filter = ('user__type',)
+    ordering = ('-start_time',)
+    list_select_related = ('user',)
+
+    @admin.display(description='User')
+    def get_user(self, obj: ClearPassDevice):
+        if obj.user_id is None:
+            return '-'
+        return mark_safe('<a href={}>{}</a>'.format(
+            reverse('admin:login_user_change', args=(obj.user_id,)),
+            obj.user
+        ))
+
+    # Mirror of ClearPass, only written by the sync
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,39 @@
+from django.contrib import admin, messages
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from login.models import DeviceMutation
+
+
+@admin.register(DeviceMutation)
+class DeviceMutationAdmin(admin.ModelAdmin):
+    list_display = ('mac_address', 'visitor_name', 'user', 'status', 'attempts', 'created', 'finished')
+    search_fields = ('mac_address', 'visitor_name', 'user__username')
+    search_help_text = "Searches filter by mac address, visitor name, and username"
+    list_filter = ('status',)
+    ordering = ('-created',)
+    list_select_related = ('user',)
+    readonly_fields = [field.name for field in DeviceMutation._meta.fields]
+    actions = ['retry']
+
+    @admin.action(description='Retry selected failed registrations')
+    def retry(self, request, queryset):
+        retried = 0
+        for job in queryset.filter(status=DeviceMutation.Status.FAILED):
+            job.status, job.attempts, job.next_attempt, job.finished = \
+                DeviceMutation.Status.PENDING, 0, timezone.now(), None
+            try:
+                with transaction.atomic():
+                    job.save(update_fields=['status', 'attempts', 'next_attempt', 'finished'])
+                retried += 1
+            except IntegrityError:
+                # A newer registration for the MAC is already queued
+                continue
+        self.message_user(request, f'Queued {retried} registrations again', messages.SUCCESS)
+
+    # Jobs are only created by logins
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
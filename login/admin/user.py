@@ -6,11 +6,11 @@ from django.urls import reverse
 from django.utils import timezone
 from django.utils.html import linebreaks
 from django.utils.safestring import mark_safe
-from netaddr import EUI
 
+import interface.bulk as bulk
 from interface.api import Token
-from login.models import User, UserSession, LoginHistory
-from django.db.models import QuerySet
+from login.models import User, UserSession, LoginHistory, BulkJob, Permissions
+from django.db.models import Count, QuerySet
 from django.http import HttpRequest
 
 access = Token()
@@ -46,15 +46,25 @@ def remove_sessions(model_admin, request: HttpRequest, queryset: QuerySet):
 
 @admin.action(description='Remove all devices')
 def remove_devices(model_admin, request: HttpRequest, queryset: QuerySet):
-    for user in queryset:
-        resp = access.get_device(username=user.clearpass_name)
-        for device in resp.device:
-            access.delete_device(mac=EUI(device['mac']))
+    # This can take minutes for thousands of users, so it runs as a background job
+    users = {user.username: user.clearpass_name for user in queryset.select_related('type')}
+    job = BulkJob.objects.create(action='Remove all devices', created_by=request.user, total=len(users))
+
+    def run(job: BulkJob):
+        results = bulk.remove_devices(access, users, progress=lambda result: job.report_progress(result.ok))
+        return {username: result.as_dict() for username, result in results.items()}
+
+    job.start(run)
+    model_admin.message_user(request, mark_safe(
+        f'Removing devices of {len(users)} users in the background. '
+        f'<a href="{reverse("admin:login_bulkjob_change", args=(job.pk,))}">Track progress</a>'
+    ))
 
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
-    list_display = ('is_active', 'username', 'type', 'get_modifications', 'last_login', 'start_time')
+    list_display = ('is_active', 'username', 'type', 'get_modifications', 'get_device_count', 'last_login',
+                    'start_time')
     list_display_links = ('username',)
     search_fields = ('username',)
     search_help_text = "Searches filter by username"
@@ -70,9 +80,30 @@ class UserAdmin(BaseUserAdmin):
 
     @admin.display(description='Modifications')
     def get_modifications(self, obj: User):
-        limit = obj.get_permission("warningThreshold", default=None)
+        # Resolved for the whole page, see get_changelist_instance
+        if (resolved := getattr(obj, 'resolved_permissions', None)) is not None:
+            limit = resolved['warningThreshold']
+        else:
+            limit = obj.get_permission("warningThreshold", default=None)
         return f'{obj.mac_modifications} / {limit if limit else "-"}'
 
+    def get_queryset(self, request: HttpRequest):
+        # Device counts come from the local ClearPass mirror, in the same query as the users
+        return super().get_queryset(request).annotate(device_count=Count('clearpass_devices'))
+
+    def get_changelist_instance(self, request: HttpRequest):
+        changelist = super().get_changelist_instance(request)
+        # Resolve the page's thresholds together instead of one get_permission per row
+        users = list(changelist.result_list)
+        resolved = Permissions.objects.resolve_many(users, ['warningThreshold'])
+        for user in users:
+            user.resolved_permissions = resolved[user.pk]
+        return changelist
+
+    @admin.display(description='Devices', ordering='device_count')
+    def get_device_count(self, obj: User):
+        return obj.device_count
+
     @admin.display(description='Permissions')
     def get_permissions(self, obj: User):
         return mark_safe(linebreaks(
@@ -91,13 +122,13 @@ class UserAdmin(BaseUserAdmin):
         resp = access.get_device(username=obj.clearpass_name)
         if resp.device:
             return mark_safe(linebreaks(
-                '\n'.join(device['mac'] for device in resp.device)
+                '\n'.join(device.mac for device in resp.device)
             ))
         return 'None'
 
     @admin.display(description='Login History')
     def get_login_history(self, obj: User):
-        history = LoginHistory.objects.filter(user=obj)
+        history = LoginHistory.objects.filter(user=obj).order_by('time')
         return mark_safe('\n'.join(
             '<pre style="margin: 0em 0em;"><a href="{}">{}</a></pre>'.format(
                 reverse("admin:login_loginhistory_change", args=(history_obj.pk,)),
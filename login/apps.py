@@ -14,6 +14,8 @@ class LoginConfig(AppConfig):
     verbose_name = 'Authentication'
 
     def ready(self):
+        from . import signals  # noqa: F401
+
         if not connection.introspection.table_names():
             logger.critical(f'Could not find any tables in the database. Did you migrate?')
 
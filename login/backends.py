@@ -0,0 +1,14 @@
+from django.contrib.auth.backends import ModelBackend
+
+
+class UserContextBackend(ModelBackend):
+    """ModelBackend, checking the password of the request's UserContext user instead of querying it again"""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        context = getattr(request, 'user_context', None)
+        if context is None or context.user is None or context.username != username or password is None:
+            return super().authenticate(request, username=username, password=password, **kwargs)
+
+        user = context.user
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
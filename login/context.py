@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from typing import Any, Optional
+
+from django.http import HttpRequest
+
+from .models.permissions import Permissions
+from .models.user import User
+
+
+class UserContext:
+    """
+    The user a login request is about, loaded once with its user type, and its effective permissions.
+
+    It is kept on the request (see `for_request`), so the login form, the authentication backend, the view and
+    LoginHistory.log share one User instead of each querying it again.
+    """
+
+    def __init__(self, username: str, user: Optional[User]):
+        self.username = username
+        self.user = user
+        self._permissions: Optional[dict[str, Any]] = None
+
+    @classmethod
+    def for_request(cls, request: Optional[HttpRequest], username: str) -> UserContext:
+        context: Optional[UserContext] = getattr(request, 'user_context', None)
+        if context is None or context.username != username:
+            context = cls(username, User.objects.select_related('type').filter(username=username).first())
+            if request is not None:
+                request.user_context = context
+        return context
+
+    @property
+    def permissions(self) -> dict[str, Any]:
+        """Every node that applies to the user, keyed by lowercase node. Empty if there is no such user."""
+        if self._permissions is None:
+            self._permissions = {} if self.user is None else \
+                Permissions.objects.tree.effective(self.user.username, self.user.type.name)
+        return self._permissions
+
+    def get_permission(self, node: str, *, default=None):
+        return self.permissions.get(node.lower(), default)
@@ -0,0 +1,103 @@
+"""
+dnsmasq --dhcp-script entry point: applies lease events to the LeaseStore the workers read MAC addresses from.
+It does not load Django, so each call only costs an interpreter start.
+
+dnsmasq runs it (see deploy/main/amac-dhcp-script) as
+
+    <script> add|old|del <mac> <ip> [hostname]
+    <script> init            (with leasefile-ro: prints the stored leases in lease file format)
+
+and it can replay events without dnsmasq, from a lease file (every line applied as "old") or from a file of
+`<action> <mac> <ip> [hostname]` lines:
+
+    $ python -m login.dhcp_script --store /tmp/leases.sqlite3 --replay /var/lib/misc/dnsmasq.leases
+
+The store is AMAC_DNSMASQ_LEASE_STORE unless --store is given.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Mapping, Optional
+
+from login.leases import Lease, LeaseStore, parse_lease
+
+
+def lease_expiry(environ: Mapping[str, str]) -> Optional[datetime]:
+    """dnsmasq passes the expiry as a timestamp, or only the remaining time if built with HAVE_BROKEN_RTC"""
+    if expires := environ.get('DNSMASQ_LEASE_EXPIRES'):
+        expiry = int(expires)
+    elif remaining := environ.get('DNSMASQ_TIME_REMAINING'):
+        expiry = int(time.time()) + int(remaining)
+    else:
+        return None
+    return datetime.fromtimestamp(expiry, tz=timezone.utc) if expiry else None
+
+
+def apply(store: LeaseStore, conn, action: str, mac: str, ip: str, hostname: Optional[str] = None,
+          environ: Mapping[str, str] = os.environ, expiry: Optional[datetime] = None):
+    if action in ('add', 'old'):
+        store.add(conn, Lease(ip, mac, expiry or lease_expiry(environ), hostname,
+                              environ.get('DNSMASQ_CLIENT_ID') or None))
+    elif action == 'del':
+        store.delete(conn, ip, mac)
+    # Other events (tftp, arp, ...) are of no interest
+
+
+def print_leases(store: LeaseStore, conn):
+    for lease in store.all(conn):
+        expiry = int(lease.expiry.timestamp()) if lease.expiry else 0
+        print(f'{expiry} {lease.mac} {lease.ip} {lease.hostname or "*"} {lease.client_id or "*"}')
+
+
+def replay(store: LeaseStore, conn, path: str) -> int:
+    count = 0
+    with open(path) as fp:
+        conn.execute('BEGIN')
+        for line in fp:
+            if (lease := parse_lease(line)) is not None:
+                apply(store, conn, 'old', lease.mac, lease.ip, lease.hostname,
+                      environ={'DNSMASQ_CLIENT_ID': lease.client_id or ''}, expiry=lease.expiry)
+            elif len(fields := line.split()) >= 3:
+                apply(store, conn, *fields[:4], environ={})
+            else:
+                continue
+            count += 1
+        conn.execute('COMMIT')
+    return count
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--store', default=os.environ.get('AMAC_DNSMASQ_LEASE_STORE'))
+    parser.add_argument('--replay', metavar='FILE', help='Apply the leases or events in FILE, then exit')
+    parser.add_argument('action', nargs='?')
+    parser.add_argument('mac', nargs='?')
+    parser.add_argument('ip', nargs='?')
+    parser.add_argument('hostname', nargs='?')
+    args = parser.parse_args(argv)
+
+    if not args.store:
+        parser.error('No lease store: set AMAC_DNSMASQ_LEASE_STORE or pass --store')
+
+    store = LeaseStore(args.store)
+    conn = store.connect(readonly=False)
+    try:
+        if args.replay:
+            start = time.perf_counter()
+            count = replay(store, conn, args.replay)
+            print(f'Applied {count} events to {args.store} in {(time.perf_counter() - start) * 1000:.1f} ms')
+        elif args.action == 'init':
+            print_leases(store, conn)
+        elif args.action is None:
+            parser.error('Give an action, or --replay')
+        elif args.mac and args.ip:
+            apply(store, conn, args.action, args.mac, args.ip, args.hostname)
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
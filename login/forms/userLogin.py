@@ -1,5 +1,5 @@
 import re
-from datetime import timedelta
+from typing import Optional
 
 from django.core.exceptions import ValidationError
 from django.utils import timezone
@@ -7,7 +7,9 @@ from django.utils import timezone
 from django import forms
 from django.contrib.auth.forms import AuthenticationForm as BaseAuthenticationForm
 
-from login.models import User, LoginHistory, Permissions
+from login import ratelimit
+from login.context import UserContext
+from login.models import User
 
 
 # TODO: Update Last Login!!!
@@ -34,6 +36,7 @@ class UserLoginForm(BaseAuthenticationForm):
         self.fields['password'].widget.attrs['placeholder'] = widget_placeholders[user_type][1]
         self.password_correct = False
         self.mac_changed = False
+        self.user_context: Optional[UserContext] = None
 
         for visible in self.visible_fields():
             visible.field.widget.attrs['class'] = 'formField'
@@ -48,16 +51,14 @@ class UserLoginForm(BaseAuthenticationForm):
 
     def clean(self):
         username = self.cleaned_data.get("username")
-        if (user_obj := User.objects.filter(username=username)).exists():
-            user = user_obj.first()
-            limit = user.get_permission('rateLimit/passwordsPerHour', default=None)
-            if limit is not None:
-                history = LoginHistory.objects.filter(user=user,
-                                                              logged_in=False,
-                                                              time__gt=timezone.now() - timedelta(
-                                                                  hours=1)).count() > limit
+        if username is not None:
+            # Loads the user and its permissions for the rest of the request, see UserContext
+            self.user_context = UserContext.for_request(self.request, username)
 
-                if history:
+        if self.user_context is not None and (user := self.user_context.user) is not None:
+            limit = self.user_context.get_permission('rateLimit/passwordsPerHour', default=None)
+            if limit is not None:
+                if ratelimit.failed_attempts(user) > limit:
                     raise ValidationError(
                         self.error_messages['rate_limit'],
                         code='rate_limit'
@@ -72,24 +73,17 @@ class UserLoginForm(BaseAuthenticationForm):
         super().clean()
 
     def rate_limit_check(self, user: User):
-        if user.get_permission('bypassRateLimit', default=False):
+        context = self.user_context
+        if context.get_permission('bypassRateLimit', default=False):
             return
 
-        perms = {
-            perms.suffix: perms.value
-            for perms in user.permissions().filter(suffix__startswith="rateLimit")
-        }
-
-        not_new_user = LoginHistory.objects.filter(user=user, mac_updated=True).count() > perms.get(
-            'rateLimit/changesUntilOldUser')
-
-        modification_lim = LoginHistory.objects.filter(user=user, logged_in=True, mac_updated=True,
-                                                       time__gt=(timezone.now() - timedelta(hours=1))
-                                                       ).count() > perms.get('rateLimit/changesPerHour')
+        changes, recent_changes, same_mac = ratelimit.device_changes(
+            user, str(self.request.session.get('mac_address')),
+            context.get_permission('rateLimit/uniqueMacIntervalByHours'))
 
-        unique_mac_lim = LoginHistory.objects.filter(user=user, mac_address=self.request.session.get('macaddr'),
-                                                     time__gt=timezone.now() - timedelta(
-                                                         hours=perms.get("rateLimit/uniqueMacIntervalByHours"))).exists()
+        not_new_user = changes > context.get_permission('rateLimit/changesUntilOldUser')
+        modification_lim = recent_changes > context.get_permission('rateLimit/changesPerHour')
+        unique_mac_lim = same_mac > 0
 
         if not_new_user and (modification_lim or unique_mac_lim):
             raise ValidationError(
@@ -109,7 +103,7 @@ class UserLoginForm(BaseAuthenticationForm):
         self.password_correct = True
 
         # Should account be disabled?
-        if (disable_time := user.get_permission('disableTime')) is not None:
+        if (disable_time := self.user_context.get_permission('disableTime')) is not None:
             if disable_time.as_datetime(reftime=user.start_time) <= timezone.now():
                 user.is_active = False
                 user.save(update_fields=["is_active"])
@@ -0,0 +1,191 @@
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+try:
+    import inotify_simple
+except ImportError:  # Optional: without it, the lease file is stat()ed on every lookup instead
+    inotify_simple = None
+
+
+class Lease(NamedTuple):
+    """One line of the dnsmasq lease file"""
+    ip: str
+    mac: str
+    expiry: Optional[datetime]  # None for infinite leases
+    hostname: Optional[str]
+    client_id: Optional[str]
+
+
+def parse_lease(line: str) -> Optional[Lease]:
+    """
+    Parses `<expiry> <mac> <ip> <hostname> <client id>`, with `*` for an unknown hostname or client id.
+    Returns None for lines that are not IPv4 leases (e.g. the `duid` line of DHCPv6).
+    """
+    fields = line.split(maxsplit=4)
+    if len(fields) < 3 or not fields[0].isdigit():
+        return None
+    expiry, mac, ip = int(fields[0]), fields[1], fields[2]
+    hostname = fields[3] if len(fields) > 3 and fields[3] != '*' else None
+    client_id = fields[4].strip() if len(fields) > 4 and fields[4].strip() != '*' else None
+    return Lease(ip, mac, datetime.fromtimestamp(expiry, tz=timezone.utc) if expiry else None, hostname, client_id)
+
+
+class LeaseIndex:
+    """
+    Per-process IP -> Lease index of the dnsmasq lease file.
+
+    The file is only read again when its inode, size or mtime changed since the last read, so a lookup is a stat() and
+    a dict hit. With `watch`, an inotify watcher (if inotify_simple is installed) marks the index stale instead, and
+    lookups skip the stat() as well.
+
+    dnsmasq rewrites the file on every lease change, which on a busy network is many times a second, so a changed file
+    is only re-read once `min_rebuild_interval` seconds have passed since the last read. An IP missing from the index
+    always gets the file re-read (if it changed), so a client that just got its lease is never turned away.
+    """
+    _logger = logging.getLogger('Leases')
+
+    def __init__(self, path: os.PathLike, watch: bool = False, min_rebuild_interval: float = 1.0):
+        self.path = Path(path)
+        self.min_rebuild_interval = min_rebuild_interval
+        # Lines are only parsed once they are looked up
+        self._lines: dict[str, str] = {}
+        self._signature: Optional[tuple] = None
+        self._built_at = -math.inf
+        self._lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stale = threading.Event()
+        self._stale.set()
+        if watch:
+            self._start_watcher()
+
+    def get(self, ip: str) -> Optional[Lease]:
+        if (self._watcher is None or self._stale.is_set()) and \
+                time.monotonic() - self._built_at >= self.min_rebuild_interval:
+            self.refresh()
+        if (line := self._lines.get(ip)) is None and self.refresh():
+            line = self._lines.get(ip)
+        return parse_lease(line) if line is not None else None
+
+    def refresh(self) -> bool:
+        """Rebuilds the index if the file changed. Returns whether it was rebuilt."""
+        # Cleared before looking at the file, so a change made meanwhile marks the index stale again
+        self._stale.clear()
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            self._lines, self._signature = {}, None
+            return False
+
+        signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if signature == self._signature:
+            return False
+
+        with self._lock:
+            if signature == self._signature:
+                return False
+            lines = {}
+            with open(self.path) as fp:
+                for line in fp:
+                    if len(fields := line.split(maxsplit=3)) >= 3:
+                        lines[fields[2]] = line
+            # Replaced whole, concurrent lookups see either the old or the new index
+            self._lines, self._signature = lines, signature
+            self._built_at = time.monotonic()
+        return True
+
+    def __len__(self):
+        return len(self._lines)
+
+    def _start_watcher(self):
+        if inotify_simple is None:
+            self._logger.warning('inotify_simple is not installed, falling back to stat() on every lookup')
+            return
+
+        flags = inotify_simple.flags
+        inotify = inotify_simple.INotify()
+        # dnsmasq rewrites the file in place, but other tools replace it: watch the directory for both
+        inotify.add_watch(self.path.parent, flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE | flags.DELETE)
+
+        def watch():
+            while True:
+                if any(event.name == self.path.name for event in inotify.read()):
+                    self._stale.set()
+
+        self._watcher = threading.Thread(target=watch, daemon=True, name='LeaseWatcher')
+        self._watcher.start()
+
+
+class LeaseStore:
+    """
+    IP -> lease bindings pushed by dnsmasq's --dhcp-script (see login/dhcp_script.py), in a small SQLite file shared
+    by every worker. Lease events are applied as they happen, so workers never need to read the lease file.
+
+    The script, run by dnsmasq, is the only writer. Workers open the file read-only, one connection per thread.
+    While the file does not exist yet, or the script holds its lock for longer than `busy_timeout` seconds, lookups
+    are answered from `fallback` (the lease file) instead.
+    """
+    _logger = logging.getLogger('Leases')
+
+    busy_timeout = 0.2
+
+    _schema = """
+        CREATE TABLE IF NOT EXISTS lease (
+            ip TEXT PRIMARY KEY,
+            mac TEXT NOT NULL,
+            expiry INTEGER NOT NULL,
+            hostname TEXT,
+            client_id TEXT
+        )
+    """
+
+    def __init__(self, path: os.PathLike, fallback: Optional[LeaseIndex] = None):
+        self.path = Path(path)
+        self.fallback = fallback
+        self._local = threading.local()
+
+    def connect(self, readonly: bool = True) -> sqlite3.Connection:
+        if readonly:
+            # A read-only URI, so workers do not need write access to the file or its directory
+            return sqlite3.connect(f'{self.path.resolve().as_uri()}?mode=ro', uri=True, timeout=self.busy_timeout)
+
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        # Bindings can be rebuilt from dnsmasq (it reports every lease as "old" on startup), durability is less
+        # important than keeping up with lease events
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(self._schema)
+        return conn
+
+    def get(self, ip: str) -> Optional[Lease]:
+        try:
+            if (conn := getattr(self._local, 'conn', None)) is None:
+                conn = self._local.conn = self.connect()
+            row = conn.execute('SELECT ip, mac, expiry, hostname, client_id FROM lease WHERE ip = ?', (ip,)).fetchone()
+        except sqlite3.OperationalError as err:
+            # Not created yet (dnsmasq has not reported a lease), or locked by the script
+            self._logger.warning(f'Lease store unavailable ({err}), looking {ip} up in the lease file')
+            return self.fallback.get(ip) if self.fallback is not None else None
+        return self._lease(*row) if row is not None else None
+
+    def add(self, conn: sqlite3.Connection, lease: Lease):
+        conn.execute('INSERT OR REPLACE INTO lease (ip, mac, expiry, hostname, client_id) VALUES (?, ?, ?, ?, ?)',
+                     (lease.ip, lease.mac, int(lease.expiry.timestamp()) if lease.expiry else 0, lease.hostname,
+                      lease.client_id))
+
+    def delete(self, conn: sqlite3.Connection, ip: str, mac: str):
+        # Only if the IP was not handed to another client meanwhile
+        conn.execute('DELETE FROM lease WHERE ip = ? AND mac = ?', (ip, mac))
+
+    def all(self, conn: sqlite3.Connection) -> list[Lease]:
+        rows = conn.execute('SELECT ip, mac, expiry, hostname, client_id FROM lease ORDER BY expiry').fetchall()
+        return [self._lease(*row) for row in rows]
+
+    @staticmethod
+    def _lease(ip: str, mac: str, expiry: int, hostname: Optional[str], client_id: Optional[str]) -> Lease:
+        return Lease(ip, mac, datetime.fromtimestamp(expiry, tz=timezone.utc) if expiry else None, hostname, client_id)
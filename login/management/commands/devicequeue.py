@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from interface.writebehind import DeviceQueueWorker
+
+
+class Command(BaseCommand):
+    help = 'Writes the device registrations queued by logins to ClearPass'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process a single batch and exit')
+        parser.add_argument('--batch', type=int, help='Registrations claimed at a time (CLEARPASS_API QUEUE_BATCH)')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait before polling again when the queue is empty')
+
+    def handle(self, *args, once=False, batch=None, interval=1.0, **options):
+        processed = DeviceQueueWorker(batch=batch).run(interval, once=once)
+        if once:
+            self.stdout.write(self.style.SUCCESS(f'Processed {processed} queued registrations'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from login.models import BulkJob
+
+
+class Command(BaseCommand):
+    help = 'Marks bulk jobs whose worker stopped (no heartbeat for BulkJob.stale_after) as failed'
+
+    def handle(self, *args, **options):
+        failed = BulkJob.fail_stale()
+        self.stdout.write(self.style.SUCCESS(f'Marked {failed} stale bulk jobs as failed'))
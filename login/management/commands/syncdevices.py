@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from interface.sync import DeviceSync
+
+
+class Command(BaseCommand):
+    help = 'Mirrors the ClearPass device inventory into the ClearPassDevice table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Walk every device and remove local rows ClearPass no longer has. '
+                                 'By default, only devices started since the last sync are fetched.')
+
+    def handle(self, *args, full=False, **options):
+        stats = DeviceSync().run(full=full)
+        self.stdout.write(self.style.SUCCESS(f'Synced ClearPass devices: {stats}'))
@@ -1,13 +1,58 @@
+import asyncio
+import logging
+import zoneinfo
+from typing import Optional
+
+from asgiref.sync import sync_to_async
 from django.utils import timezone
 
 from login.models import Permissions
 
 
 class TimezoneMiddleware:
+    """
+    Activates the global/localTimezone node. It is read from the PermissionTree, so requests do not query the database
+    for it, and the ZoneInfo is built once per timezone name.
+
+    Runs natively under ASGI as well. The tree may need reloading, so the zone is then looked up in a thread.
+    """
+    _logger = logging.getLogger('TimezoneMiddleware')
+
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self._zones: dict[str, Optional[zoneinfo.ZoneInfo]] = {}
+        if asyncio.iscoroutinefunction(get_response):
+            # Makes the instance a coroutine function to Django, as MiddlewareMixin does (asgiref 3.5 has no
+            # markcoroutinefunction)
+            self._is_coroutine = asyncio.coroutines._is_coroutine
 
     def __call__(self, request):
-        if local_tz := Permissions.objects.filter(permission='global/localTimezone').first():
-            timezone.activate(local_tz.value)
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.activate(self.get_zone())
         return self.get_response(request)
+
+    async def __acall__(self, request):
+        self.activate(await sync_to_async(self.get_zone)())
+        return await self.get_response(request)
+
+    @staticmethod
+    def activate(zone: Optional[zoneinfo.ZoneInfo]):
+        if zone is not None:
+            timezone.activate(zone)
+        else:
+            timezone.deactivate()
+
+    def get_zone(self) -> Optional[zoneinfo.ZoneInfo]:
+        if not (name := Permissions.objects.tree.scope('global').get('localtimezone')):
+            return None
+        if name not in self._zones:
+            try:
+                self._zones[name] = zoneinfo.ZoneInfo(name)
+            except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+                self._logger.error(f'Unknown global/localTimezone {name!r}, using the default timezone')
+                self._zones[name] = None
+        return self._zones[name]
@@ -0,0 +1,35 @@
+# Generated by Django 4.0.7 on 2026-10-18 09:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import macaddress.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('login', '0002_bulkjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClearPassDevice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clearpass_id', models.PositiveBigIntegerField(unique=True)),
+                ('mac_address', macaddress.fields.MACAddressField(db_index=True, integer=False, max_length=17)),
+                ('visitor_name', models.CharField(db_index=True, max_length=160)),
+                ('notes', models.TextField(blank=True, null=True)),
+                ('sponsor_name', models.CharField(blank=True, max_length=160, null=True)),
+                ('start_time', models.DateTimeField(blank=True, null=True)),
+                ('expire_time', models.DateTimeField(blank=True, null=True)),
+                ('digest', models.CharField(max_length=32)),
+                ('synced_at', models.DateTimeField()),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='clearpass_devices', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'ClearPass Device',
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.0.7 on 2026-10-18 09:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.utils.timezone
+import login.models.user
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('login', '0003_clearpassdevice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceMutation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mac_address', models.CharField(db_index=True, max_length=17)),
+                ('visitor_name', models.CharField(max_length=160)),
+                ('device_name', models.CharField(blank=True, max_length=160)),
+                ('device_limit', models.PositiveIntegerField(blank=True, null=True)),
+                ('expire_time', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=models.SET(login.models.user.get_sentinel_user), to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Device Mutation',
+                'indexes': [models.Index(fields=['status', 'next_attempt'], name='login_devic_status_df563e_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='devicemutation',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('mac_address',), name='login_devicemutation_one_pending_per_mac'),
+        ),
+    ]
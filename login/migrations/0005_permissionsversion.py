@@ -0,0 +1,23 @@
+# Generated by Django 4.0.7 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('login', '0004_devicemutation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PermissionsVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Permissions Version',
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.0.7 on 2026-10-18 11:05
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+# Case-insensitive prefix index for PermissionsManager.get_bulk's `permission__istartswith` lookups. Django 4.0
+# cannot declare an expression index with an operator class, so it is created per backend:
+#   PostgreSQL compiles istartswith to UPPER("permission"::text) LIKE UPPER('prefix%')
+#   SQLite compiles it to a case-insensitive LIKE, which only uses an index with the NOCASE collation
+INDEX_NAME = 'login_permissions_permission_prefix'
+
+CREATE_INDEX = {
+    'postgresql': f'CREATE INDEX {INDEX_NAME} ON login_permissions (UPPER(permission::text) text_pattern_ops)',
+    'sqlite': f'CREATE INDEX {INDEX_NAME} ON login_permissions (permission COLLATE NOCASE)',
+}
+
+
+def create_index(apps, schema_editor):
+    if sql := CREATE_INDEX.get(schema_editor.connection.vendor):
+        schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_INDEX:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('login', '0005_permissionsversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='permissions',
+            index=models.Index(django.db.models.functions.text.Lower('permission'), name='login_permissions_lower'),
+        ),
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.0.7 on 2026-10-18 11:40
+
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+from login.ratelimit import mac_key
+
+# login/ratelimit.py's bucket size when this migration was written
+BUCKET = 300
+
+
+def backfill(apps, schema_editor):
+    """Counts the login history the counters replace, so limits carry over"""
+    LoginHistory = apps.get_model('login', 'LoginHistory')
+    RateCounter = apps.get_model('login', 'RateCounter')
+
+    counts = Counter()
+    for user_id, changes in (LoginHistory.objects.filter(mac_updated=True)
+                             .values_list('user_id').annotate(models.Count('pk'))):
+        counts[f'changes/{user_id}', 0] = changes
+
+    since = timezone.now() - timedelta(seconds=settings.RATE_LIMIT_RETENTION)
+    recent = LoginHistory.objects.filter(time__gte=since)
+    for user_id, mac_address, time, logged_in, mac_updated in recent.values_list(
+            'user_id', 'mac_address', 'time', 'logged_in', 'mac_updated').iterator():
+        bucket = int(time.timestamp()) // BUCKET * BUCKET
+        if not logged_in:
+            counts[f'failed/{user_id}', bucket] += 1
+        if mac_updated:
+            counts[f'recentChanges/{user_id}', bucket] += 1
+        counts[mac_key(user_id, mac_address), bucket] += 1
+
+    RateCounter.objects.bulk_create([RateCounter(key=key, bucket=bucket, count=count)
+                                     for (key, bucket), count in counts.items()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('login', '0006_permissions_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=120)),
+                ('bucket', models.PositiveBigIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Rate Counter',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='ratecounter',
+            constraint=models.UniqueConstraint(fields=('key', 'bucket'), name='login_ratecounter_key_bucket'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
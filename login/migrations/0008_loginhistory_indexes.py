@@ -0,0 +1,21 @@
+# Generated by Django 4.0.7 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('login', '0007_ratecounter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loginhistory',
+            index=models.Index(fields=['user', 'time'], name='login_lh_user_time'),
+        ),
+        migrations.AddIndex(
+            model_name='loginhistory',
+            index=models.Index(fields=['time'], name='login_lh_time'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.0.7 on 2026-10-18 15:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('login', '0009_bulkjob_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devicemutation',
+            name='history',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='login.loginhistory'),
+        ),
+    ]
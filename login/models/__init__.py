@@ -1,5 +1,10 @@
 from .user import User
 from .usertype import UserType
 from .permissions import Permissions
+from .permissionsVersion import PermissionsVersion
+from .rateCounter import RateCounter
 from .history import LoginHistory
 from .userSession import UserSession
+from .bulkJob import BulkJob
+from .clearpassDevice import ClearPassDevice
+from .deviceMutation import DeviceMutation
@@ -0,0 +1,105 @@
+import datetime
+import logging
+import threading
+import time
+from typing import Callable
+
+from django.db import connections, models
+from django.utils import timezone
+
+from .user import User, get_sentinel_user
+
+
+class BulkJob(models.Model):
+    """
+    A long-running admin action, run in a background thread. Progress is written back so any worker can show it.
+
+    The thread dies with its worker (gunicorn restart, deploy, SIGKILL), so a running job writes a heartbeat, and
+    `fail_stale` (run by `manage.py failstalejobs`, on a timer) marks jobs whose heartbeat stopped as failed.
+    """
+    _logger = logging.getLogger('BulkJob')
+    _progress_lock = threading.Lock()
+
+    # Minimum seconds between progress writes
+    flush_interval = 1.0
+    # Seconds between heartbeats of a running job
+    heartbeat_interval = 10.0
+    # A job that has not started or sent a heartbeat for this long is assumed dead
+    stale_after = datetime.timedelta(minutes=1)
+
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        RUNNING = 'running'
+        DONE = 'done'
+        FAILED = 'failed'
+
+    action = models.CharField(max_length=64)
+    created_by = models.ForeignKey(User, null=True, on_delete=models.SET(get_sentinel_user))
+    created = models.DateTimeField(default=timezone.now)
+    finished = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    total = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    summary = models.JSONField(default=dict, blank=True)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = 'Bulk Job'
+
+    def __str__(self):
+        return f'{self.action} ({self.completed}/{self.total})'
+
+    def start(self, target: Callable[['BulkJob'], dict]):
+        """
+        Runs `target(job)` in a daemon thread. `target` reports per-item progress with `report_progress`, and returns
+        a JSON serializable summary that is saved once it finishes.
+        """
+        done = threading.Event()
+
+        def beat():
+            while not done.wait(self.heartbeat_interval):
+                BulkJob.objects.filter(pk=self.pk, status=self.Status.RUNNING).update(heartbeat=timezone.now())
+            connections.close_all()
+
+        def run():
+            self._last_flush = 0.0
+            try:
+                BulkJob.objects.filter(pk=self.pk).update(status=self.Status.RUNNING, heartbeat=timezone.now())
+                threading.Thread(target=beat, daemon=True, name=f'BulkJob-{self.pk}-heartbeat').start()
+                self.summary = target(self)
+                self.status = self.Status.DONE
+            except Exception as err:
+                self._logger.exception(f'Bulk job {self.pk} failed: {err!r}')
+                self.status = self.Status.FAILED
+                self.error = repr(err)
+            finally:
+                done.set()
+                self.finished = timezone.now()
+                self.save(update_fields=['status', 'finished', 'completed', 'failed', 'summary', 'error'])
+                connections.close_all()
+
+        threading.Thread(target=run, daemon=True, name=f'BulkJob-{self.pk}').start()
+
+    @classmethod
+    def fail_stale(cls) -> int:
+        """Marks jobs whose thread is gone as failed. Returns how many were."""
+        cutoff = timezone.now() - cls.stale_after
+        return cls.objects.filter(
+            models.Q(status=cls.Status.RUNNING, heartbeat__lt=cutoff) |
+            models.Q(status=cls.Status.PENDING, created__lt=cutoff)
+        ).update(status=cls.Status.FAILED, finished=timezone.now(),
+                 error='Interrupted: the worker running this job stopped. Items not listed were not processed.')
+
+    def report_progress(self, ok: bool):
+        """Thread safe. Counts one finished item, and periodically writes the counts to the database."""
+        with self._progress_lock:
+            self.completed += 1
+            self.failed += not ok
+            if (now := time.monotonic()) - self._last_flush < self.flush_interval:
+                return
+            self._last_flush = now
+            completed, failed = self.completed, self.failed
+
+        BulkJob.objects.filter(pk=self.pk).update(completed=completed, failed=failed)
@@ -0,0 +1,30 @@
+from django.db import models
+from macaddress.fields import MACAddressField
+
+from .user import User
+
+
+class ClearPassDevice(models.Model):
+    """
+    Local mirror of the ClearPass device inventory, kept up to date by `manage.py syncdevices`.
+    ClearPass remains the source of truth: use this for lookups and reports that would otherwise need one API call per
+    user, not for decisions that must see a device registered seconds ago.
+    """
+    clearpass_id = models.PositiveBigIntegerField(unique=True)
+    mac_address = MACAddressField(integer=False, db_index=True)
+    visitor_name = models.CharField(max_length=160, db_index=True)
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='clearpass_devices')
+    notes = models.TextField(null=True, blank=True)
+    sponsor_name = models.CharField(max_length=160, null=True, blank=True)
+    start_time = models.DateTimeField(null=True, blank=True)
+    expire_time = models.DateTimeField(null=True, blank=True)
+
+    # Hash of the ClearPass record, so a sync only writes rows that changed
+    digest = models.CharField(max_length=32)
+    synced_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'ClearPass Device'
+
+    def __str__(self):
+        return f'{self.mac_address} ({self.visitor_name})'
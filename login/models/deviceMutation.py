@@ -0,0 +1,139 @@
+import datetime
+from typing import Optional
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .history import LoginHistory
+from .user import User, get_sentinel_user
+from ..ratelimit import record_change
+
+
+class DeviceMutation(models.Model):
+    """
+    A device registration waiting to be written to ClearPass by `manage.py devicequeue`.
+    Logins only commit one of these and return, so their latency no longer depends on ClearPass.
+
+    The MAC address is the idempotency key: while a registration for a MAC is pending, registering it again replaces
+    the pending one, and the worker never runs two registrations for the same MAC at once.
+
+    The login that queued the registration is logged without mac_updated. It is set, and the device change counted
+    towards the user's rate limits, once the registration has been written.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        RUNNING = 'running'
+        DONE = 'done'
+        FAILED = 'failed'
+
+    # A RUNNING job whose worker has not reported back for this long is assumed dead, and is picked up again
+    lease = datetime.timedelta(minutes=5)
+
+    mac_address = models.CharField(max_length=17, db_index=True)
+    user = models.ForeignKey(User, on_delete=models.SET(get_sentinel_user))
+    visitor_name = models.CharField(max_length=160)
+    device_name = models.CharField(max_length=160, blank=True)
+    device_limit = models.PositiveIntegerField(null=True, blank=True)
+    expire_time = models.DateTimeField(null=True, blank=True)
+    history = models.ForeignKey(LoginHistory, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(default=timezone.now)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Device Mutation'
+        indexes = [models.Index(fields=['status', 'next_attempt'])]
+        constraints = [
+            models.UniqueConstraint(fields=['mac_address'], condition=Q(status='pending'),
+                                    name='login_devicemutation_one_pending_per_mac'),
+        ]
+
+    def __str__(self):
+        return f'{self.mac_address} -> {self.visitor_name} ({self.status})'
+
+    @classmethod
+    def enqueue(cls, mac_address: str, user: User, visitor_name: str, device_name: Optional[str],
+                device_limit: Optional[int], expire_time: Optional[datetime.datetime],
+                history: Optional[LoginHistory] = None) -> 'DeviceMutation':
+        fields = {
+            'user': user,
+            'visitor_name': visitor_name,
+            'device_name': device_name or '',
+            'device_limit': device_limit,
+            'expire_time': expire_time,
+            'history': history,
+            'attempts': 0,
+            'last_error': '',
+            'created': timezone.now(),
+            'next_attempt': timezone.now(),
+        }
+        job, created = cls.objects.update_or_create(mac_address=mac_address, status=cls.Status.PENDING, defaults=fields)
+        return job
+
+    @classmethod
+    def claim(cls, batch: int) -> list['DeviceMutation']:
+        """
+        Marks up to `batch` due jobs as RUNNING and returns them, oldest first. Safe to call from several workers:
+        rows locked by another worker are skipped (on databases that support it), and MACs with a running job wait.
+        """
+        now = timezone.now()
+        stale = Q(status=cls.Status.RUNNING, claimed_at__lt=now - cls.lease)
+        busy_macs = cls.objects.filter(status=cls.Status.RUNNING, claimed_at__gte=now - cls.lease) \
+            .values('mac_address')
+
+        with transaction.atomic():
+            jobs = list(
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(Q(status=cls.Status.PENDING, next_attempt__lte=now) | stale)
+                .exclude(mac_address__in=busy_macs)
+                .order_by('created')[:batch]
+            )
+            # Two pending rows for the same MAC cannot exist, but a stale running one can sit next to a pending one
+            seen, claimed = set(), []
+            for job in jobs:
+                if job.mac_address not in seen:
+                    seen.add(job.mac_address)
+                    claimed.append(job)
+            cls.objects.filter(pk__in=[job.pk for job in claimed]).update(status=cls.Status.RUNNING, claimed_at=now)
+
+        for job in claimed:
+            job.status, job.claimed_at = cls.Status.RUNNING, now
+        return claimed
+
+    def succeed(self):
+        self.status = self.Status.DONE
+        self.finished = timezone.now()
+        self.attempts += 1
+        self.last_error = ''
+        self.save(update_fields=['status', 'finished', 'attempts', 'last_error'])
+        if self.history_id is not None:
+            LoginHistory.objects.filter(pk=self.history_id).update(mac_updated=True)
+            record_change(self.user)
+
+    def fail(self, error: str, retry_in: Optional[datetime.timedelta]):
+        """Records a failed attempt. The job is retried after `retry_in`, or given up on if it is None."""
+        self.attempts += 1
+        self.last_error = error
+        if retry_in is None:
+            self.status = self.Status.FAILED
+            self.finished = timezone.now()
+        else:
+            self.status = self.Status.PENDING
+            self.next_attempt = timezone.now() + retry_in
+
+        fields = ['attempts', 'last_error', 'status', 'finished', 'next_attempt']
+        try:
+            with transaction.atomic():
+                self.save(update_fields=fields)
+        except IntegrityError:
+            # A newer registration for this MAC was queued meanwhile. It wins, this one is dropped.
+            self.status = self.Status.FAILED
+            self.finished = timezone.now()
+            self.last_error = f'superseded: {error}'
+            self.save(update_fields=fields)
@@ -8,6 +8,8 @@ from ipware import get_client_ip
 from macaddress.fields import MACAddressField
 
 from .user import User, get_sentinel_user
+from ..context import UserContext
+from ..ratelimit import record_attempt
 from ..utils import MACAddress
 
 
@@ -25,6 +27,12 @@ class LoginHistory(models.Model):
     class Meta:
         verbose_name = 'Login History'
         verbose_name_plural = 'Login History'
+        indexes = [
+            # A user's history, ordered by time (UserAdmin.get_login_history)
+            models.Index(fields=('user', 'time'), name='login_lh_user_time'),
+            # The admin changelist, ordered and filtered by time, and the recent rows migration 0007 backfills from
+            models.Index(fields=('time',), name='login_lh_time'),
+        ]
 
     @property
     def concise_str(self):
@@ -38,30 +46,33 @@ class LoginHistory(models.Model):
     @classmethod
     def log(cls, request: HttpRequest,
             user: Union[User, str], mac_address: Optional[MACAddress] = None,
-            logged_in: bool = False, mac_updated: bool = False):
+            logged_in: bool = False, mac_updated: bool = False) -> Optional['LoginHistory']:
         """
         :param request: the request
         :param user: the user trying to login
         :param logged_in: did the user have the correct password?
         :param mac_updated: did the user successfully update their mac address?
         :param mac_address: what is the user's mac address at time of login?
+        :return: the logged attempt, or None if it could not be logged
         """
         if isinstance(user, str):
-            qs = User.objects.filter(username__exact=user)
-            if not qs.exists():
-                return False
-            user = qs.first()
+            # Usually already loaded by the login form
+            if (user := UserContext.for_request(request, user).user) is None:
+                return None
 
         try:
             # TODO: Fill in host
             client_ip, is_routable = get_client_ip(request)
             cls._logger.info(f'Login: {user.username} from {client_ip} using {mac_address}. '
                              f'Success: {logged_in}, Updated: {mac_updated}')
-            cls.objects.create(user=user,
-                               mac_address=str(mac_address),
-                               ip=client_ip,
-                               host='',
-                               logged_in=logged_in,
-                               mac_updated=mac_updated)
+            entry = cls.objects.create(user=user,
+                                       mac_address=str(mac_address),
+                                       ip=client_ip,
+                                       host='',
+                                       logged_in=logged_in,
+                                       mac_updated=mac_updated)
+            record_attempt(user, str(mac_address), logged_in, mac_updated)
+            return entry
         except Exception as err:
             cls._logger.error(err)
+            return None
@@ -1,19 +1,26 @@
 from __future__ import annotations
 
-import functools
 import json
+import logging
+import math
 import re
+import threading
+import time
 import zoneinfo
 from datetime import datetime, timezone
+from types import MappingProxyType
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
 
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Any, Iterable, Mapping, Optional, Union
 from netaddr import IPNetwork
 
-from django.db.models import Q, Case, When, Count, Min
-from django.db.models.functions import Substr
+from django.db.models import Q, Case, When, Exists, OuterRef, QuerySet, Value
+from django.db.models.functions import Concat, Lower, Substr
+
+from .permissionsVersion import PermissionsVersion
 
 if TYPE_CHECKING:
     from .user import User
@@ -21,25 +28,29 @@ if TYPE_CHECKING:
 
 
 class WhenType:
+    """
+    A date relative to a reference time, as `month/day/year`. Each part is either fixed (`09`, `2026`) or an offset
+    from the reference's (`+4`, `-1`). Parsed once into (is offset, amount) pairs, so evaluating is integer arithmetic.
+    """
     _validator = re.compile(r'^(0[1-9]|1[012]|[+-]\d+?)/(0[1-9]|[12][0-9]|3[01]|[+-]\d+?)/(\d{4}|[+-]\d+?)$')
+    _timezone = zoneinfo.ZoneInfo("America/New_York")
 
     def __init__(self, offset_str: str):
         self._offset_str = offset_str
-        self._matched = self._validator.match(offset_str)
-        if not self._matched:
+        matched = self._validator.match(offset_str)
+        if not matched:
             raise ValidationError(f"Invalid schema: {offset_str}")
+        self._parts = tuple((group[0] in '+-', int(group)) for group in matched.groups())
 
     def as_datetime(self, reftime: datetime = None) -> datetime:
         if reftime is None:
             reftime = datetime.today()
 
-        # Evaluate each group to form the date
-        m, d, y = tuple(map(lambda ofst, ref: ref + eval(ofst) if ofst[0] in '+-' else int(ofst),
-                            self._matched.groups(),
-                            (reftime.month, reftime.day, reftime.year)
-                            ))
-
-        return datetime(y, m, d, tzinfo=zoneinfo.ZoneInfo("America/New_York"))
+        (month_offset, month), (day_offset, day), (year_offset, year) = self._parts
+        return datetime(reftime.year + year if year_offset else year,
+                        reftime.month + month if month_offset else month,
+                        reftime.day + day if day_offset else day,
+                        tzinfo=self._timezone)
 
     def __str__(self):
         return self._offset_str
@@ -48,6 +59,29 @@ class WhenType:
         return self._offset_str == other._offset_str
 
 
+# From DB (str) -> Python (Any)
+_to_python = {
+    0: lambda x: None,
+    1: lambda x: bool(json.loads(x.lower())),
+    2: lambda x: int(json.loads(x)),
+    3: lambda x: x,
+    4: lambda x: float(json.loads(x)),
+    5: lambda x: WhenType(x),
+    6: lambda x: IPNetwork(x)
+}
+
+# From Python (Any) -> DB (str)
+_to_db = {
+    0: lambda x: json.dumps(x),
+    1: lambda x: json.dumps(x),
+    2: lambda x: json.dumps(x),
+    3: lambda x: x,
+    4: lambda x: json.dumps(x),
+    5: lambda x: str(x),
+    6: lambda x: str(x)
+}
+
+
 class Datatype(models.IntegerChoices):
     NULL = 0
     BOOLEAN = 1
@@ -59,41 +93,105 @@ class Datatype(models.IntegerChoices):
 
     @staticmethod
     def to_python(datatype: int):
-        # From DB (str) -> Python (Any)
-        _map = {
-            0: lambda x: None,
-            1: lambda x: bool(json.loads(x.lower())),
-            2: lambda x: int(json.loads(x)),
-            3: lambda x: x,
-            4: lambda x: float(json.loads(x)),
-            5: lambda x: WhenType(x),
-            6: lambda x: IPNetwork(x)
-        }
-        return _map[datatype]
+        return _to_python[datatype]
 
     @staticmethod
     def to_db(datatype: int):
-        # From Python (Any) -> DB (str)
-        _map = {
-            0: lambda x: json.dumps(x),
-            1: lambda x: json.dumps(x),
-            2: lambda x: json.dumps(x),
-            3: lambda x: x,
-            4: lambda x: json.dumps(x),
-            5: lambda x: str(x),
-            6: lambda x: str(x)
-        }
-        return _map[datatype]
+        return _to_db[datatype]
+
+
+class PermissionTree:
+    """
+    Every Permissions row, loaded in one query and decoded once, kept per process as {scope: {node: value}}:
+
+        user/<username>/rateLimit/passwordsPerHour -> {'user/<username>': {'ratelimit/passwordsperhour': 3}}
+
+    with `global` as the scope of global nodes. Nodes are matched case-insensitively, so keys are lowercase.
+
+    The tree is dropped when a Permissions row is saved or deleted in this process (see login/signals.py). Other
+    processes compare PermissionsVersion with the version they loaded, at most once every `check_interval` seconds.
+    """
+    _logger = logging.getLogger('PermissionTree')
+
+    # Returned for scopes without nodes. Always the same object, so callers can tell the scope has not changed.
+    _empty_scope: Mapping[str, Any] = MappingProxyType({})
+
+    def __init__(self, check_interval: Optional[float] = None):
+        self._check_interval = check_interval
+        self._scopes: Optional[dict[str, dict[str, Any]]] = None
+        self._version: Optional[int] = None
+        self._checked_at = -math.inf
+        self._lock = threading.Lock()
+
+    @property
+    def check_interval(self) -> float:
+        if self._check_interval is None:
+            self._check_interval = settings.PERMISSIONS_CHECK_INTERVAL
+        return self._check_interval
+
+    def scope(self, scope: str) -> Mapping[str, Any]:
+        """
+        Nodes of `scope` (e.g. 'global', 'userType/student'), without the scope prefix. Not to be modified.
+        The same mapping is returned until the tree is reloaded.
+        """
+        return self._refresh().get(scope.lower(), self._empty_scope)
+
+    def resolve(self, user: User, node: str, *, default=None):
+        """The value of `node` for `user`: its own node, else its user type's, else the global one"""
+        return self.resolve_all(user.username, user.type.name, (node,), default=default)[node]
+
+    def resolve_all(self, username: str, usertype: str, nodes: Iterable[str], *, default=None) -> dict[str, Any]:
+        """The values of `nodes` for the user `username` of type `usertype`, keyed by node as given"""
+        scopes = self._refresh()
+        chain = [scoped for scope in (f'user/{username.lower()}', f'usertype/{usertype.lower()}', 'global')
+                 if (scoped := scopes.get(scope)) is not None]
+        resolved = {}
+        for node in nodes:
+            key = node.lower()
+            resolved[node] = next((scoped[key] for scoped in chain if key in scoped), default)
+        return resolved
+
+    def effective(self, username: str, usertype: str) -> dict[str, Any]:
+        """Every node that applies to the user `username` of type `usertype`, keyed by lowercase node"""
+        scopes = self._refresh()
+        return {**scopes.get('global', {}), **scopes.get(f'usertype/{usertype.lower()}', {}),
+                **scopes.get(f'user/{username.lower()}', {})}
+
+    def invalidate(self):
+        self._scopes = None
+
+    def _refresh(self) -> dict[str, dict[str, Any]]:
+        scopes = self._scopes
+        if scopes is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return scopes
+
+        with self._lock:
+            if self._scopes is None or PermissionsVersion.current() != self._version:
+                self._load()
+            self._checked_at = time.monotonic()
+            return self._scopes
+
+    def _load(self):
+        # Read first, so rows changed while loading are loaded again at the next check
+        version = PermissionsVersion.current()
+        scopes = {}
+        for permission, raw_value, datatype in Permissions.objects.values_list('permission', 'raw_value', 'type'):
+            head, _, rest = permission.lower().partition('/')
+            if head != 'global':
+                name, _, rest = rest.partition('/')
+                head = f'{head}/{name}'
+            try:
+                scopes.setdefault(head, {})[rest] = Datatype.to_python(datatype)(raw_value)
+            except Exception as err:
+                self._logger.error(f'Ignoring {permission}, could not decode {raw_value!r}: {err!r}')
+        self._scopes, self._version = scopes, version
 
 
 class PermissionsManager(models.Manager):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.get_raw_nodes = functools.lru_cache(maxsize=8)(self._get_raw_nodes)
-
-    def _get_raw_nodes(self, node_prefix: str):
-        return self.filter(permission__istartswith=node_prefix)
+        self.tree = PermissionTree()
 
     def get_bulk(self, user: Optional[User] = None, usertype: Optional[UserType] = None,
                  *, query_user=True, query_group=True, query_global=True):
@@ -113,57 +211,58 @@ class PermissionsManager(models.Manager):
 
         # Grab all related permissions that start with `group_prefix` or `user_prefix`
         # Annotate them with the key suffix
+        # Nodes are case-insensitive: istartswith uses the prefix index of migration 0006
         all_related_perms = (
             self.filter(
-                Q(permission__startswith=group_prefix)
-                | Q(permission__startswith=user_prefix)
-                | Q(permission__startswith=global_prefix))
+                Q(permission__istartswith=group_prefix)
+                | Q(permission__istartswith=user_prefix)
+                | Q(permission__istartswith=global_prefix))
             .annotate(suffix=Case(
-                When(permission__startswith=user_prefix, then=Substr('permission', len(user_prefix) + 1)),
-                When(permission__startswith=group_prefix, then=Substr('permission', len(group_prefix) + 1)),
-                When(permission__startswith=global_prefix, then=Substr('permission', len(global_prefix) + 1)),
+                When(permission__istartswith=user_prefix, then=Substr('permission', len(user_prefix) + 1)),
+                When(permission__istartswith=group_prefix, then=Substr('permission', len(group_prefix) + 1)),
+                When(permission__istartswith=global_prefix, then=Substr('permission', len(global_prefix) + 1)),
             ), priority=Case(
-                When(permission__startswith=user_prefix, then=1),
-                When(permission__startswith=group_prefix, then=2),
-                When(permission__startswith=global_prefix, then=3),
+                When(permission__istartswith=user_prefix, then=1),
+                When(permission__istartswith=group_prefix, then=2),
+                When(permission__istartswith=global_prefix, then=3),
             ))
         )
 
-        # Of those related permissions, find duplicate suffixes, and lowest available priority
-        unique_perm_nodes = (all_related_perms
-                             .values('suffix')
-                             .annotate(dcount=Count('suffix'))
-                             .filter(dcount__gt=1)
-                             .values_list('suffix', flat=True))
-
-        # For each of the duplicates, perform priority: user -> userType -> Global
-        lowest_priority = lambda s: all_related_perms.filter(suffix=s).aggregate(Min('priority'))['priority__min']
-        exclusion_list = [
-            pk
-            for node in unique_perm_nodes
-            for pk in
-            all_related_perms.filter(
-                Q(suffix=node) & ~Q(priority=lowest_priority(node))
-            ).values_list('id', flat=True)
-        ]
+        # Priority: user -> userType -> Global, in the same statement. A node is left out if the same suffix is set
+        # with a higher priority, found with an index lookup on LOWER(permission).
+        def node_exists(prefix: str) -> Exists:
+            return Exists(self.annotate(node=Lower('permission'))
+                          .filter(node=Concat(Value(prefix.lower()), Lower(OuterRef('suffix')))))
+
+        return (all_related_perms
+                .annotate(user_override=node_exists(user_prefix), group_override=node_exists(group_prefix))
+                .filter(Q(priority=1)
+                        | Q(priority=2, user_override=False)
+                        | Q(priority=3, user_override=False, group_override=False)))
+
+    def resolve_many(self, users: Union[QuerySet, Iterable[User]], nodes: Iterable[str], *,
+                     default=None) -> dict[int, dict[str, Any]]:
+        """
+        The values of `nodes` for many users at once, as {user id: {node: value}}, like `get_user_node` for each.
+        Takes at most one query for the users and their user types, plus the PermissionTree's (see its _refresh).
+        """
+        from .usertype import UserType
+
+        if isinstance(users, QuerySet):
+            rows = users.values_list('pk', 'username', 'type__name')
+        else:
+            users = list(users)
+            names = dict(UserType.objects.filter(pk__in={user.type_id for user in users}).values_list('pk', 'name'))
+            rows = [(user.pk, user.username, names[user.type_id]) for user in users]
 
-        return all_related_perms.exclude(id__in=exclusion_list)
+        nodes = tuple(nodes)
+        return {pk: self.tree.resolve_all(username, usertype, nodes, default=default)
+                for pk, username, usertype in rows}
 
     def get_user_node(self, user: User, node_suffix: str, *, default=None):
         if not node_suffix:
             raise NameError("Cannot query with an empty node")
-
-        if filtered := self.get_raw_nodes(f'user/{user.username}/{node_suffix}'):
-            return filtered.first().value
-
-        group = user.type.name
-        if filtered := self.get_raw_nodes(f'userType/{group}/{node_suffix}'):
-            return filtered.first().value
-
-        if filtered := self.get_raw_nodes(f'global/{node_suffix}'):
-            return filtered.first().value
-
-        return default
+        return self.tree.resolve(user, node_suffix, default=default)
 
 
 class Permissions(models.Model):
@@ -175,6 +274,9 @@ class Permissions(models.Model):
 
     class Meta:
         verbose_name = 'Permission'
+        indexes = [
+            models.Index(Lower('permission'), name='login_permissions_lower'),
+        ]
 
     def __str__(self):
         value = self.value
@@ -184,7 +286,11 @@ class Permissions(models.Model):
 
     @property
     def value(self):
-        return Datatype.to_python(self.type)(self.raw_value)
+        # Decoded once per instance, and again only if the type or raw value was changed since
+        decoded = self.__dict__.get('_decoded')
+        if decoded is None or decoded[0] != (self.type, self.raw_value):
+            decoded = self._decoded = (self.type, self.raw_value), Datatype.to_python(self.type)(self.raw_value)
+        return decoded[1]
 
     def clean(self):
         super().clean()
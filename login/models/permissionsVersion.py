@@ -0,0 +1,25 @@
+from django.db import models
+from django.db.models import F
+
+
+class PermissionsVersion(models.Model):
+    """
+    A single row, bumped whenever a Permissions row is saved or deleted. Every process keeps its own PermissionTree,
+    and reloads it once it sees the version change.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Permissions Version'
+
+    def __str__(self):
+        return f'v{self.version}'
+
+    @classmethod
+    def current(cls) -> int:
+        return cls.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls):
+        if not cls.objects.filter(pk=1).update(version=F('version') + 1):
+            cls.objects.get_or_create(pk=1, defaults={'version': 1})
@@ -0,0 +1,48 @@
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q, Sum
+
+
+class RateCounter(models.Model):
+    """
+    One time bucket of a rate limit counter (see login/ratelimit.py). `bucket` is the Unix time the bucket starts at,
+    or 0 for a counter that never expires.
+    """
+    key = models.CharField(max_length=120)
+    bucket = models.PositiveBigIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Rate Counter'
+        constraints = [
+            # Also the index every read and increment uses
+            models.UniqueConstraint(fields=('key', 'bucket'), name='login_ratecounter_key_bucket'),
+        ]
+
+    def __str__(self):
+        return f'{self.key} @ {self.bucket}: {self.count}'
+
+    @classmethod
+    def hit(cls, key: str, bucket: int):
+        """Atomically adds one to the bucket, creating it if needed"""
+        if cls.objects.filter(key=key, bucket=bucket).update(count=F('count') + 1):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(key=key, bucket=bucket, count=1)
+        except IntegrityError:
+            # Created concurrently
+            cls.objects.filter(key=key, bucket=bucket).update(count=F('count') + 1)
+
+    @classmethod
+    def totals(cls, since: dict[str, int]) -> dict[str, int]:
+        """The sum of each key's buckets starting at or after since[key], in one query"""
+        totals = cls.objects.filter(key__in=since).aggregate(**{
+            str(i): Sum('count', filter=Q(key=key, bucket__gte=start)) for i, (key, start) in enumerate(since.items())
+        })
+        return {key: totals[str(i)] or 0 for i, key in enumerate(since)}
+
+    @classmethod
+    def prune(cls, before: int) -> int:
+        """Deletes expiring buckets that start before `before`"""
+        deleted, _ = cls.objects.filter(bucket__gt=0, bucket__lt=before).delete()
+        return deleted
@@ -0,0 +1,93 @@
+"""
+Login rate limits, kept as sliding-window counters in RateCounter instead of counting LoginHistory rows, so a check
+costs the same however long the history is.
+
+Each counter is split in BUCKET-second buckets. A window of N seconds sums the buckets starting in the last N seconds,
+so it may also count up to one bucket more than N seconds old. Counters, and the permission node limiting each:
+
+    failed/<user id>              failed attempts                   rateLimit/passwordsPerHour, over the last hour
+    changes/<user id>             device changes, never expire      rateLimit/changesUntilOldUser
+    recentChanges/<user id>       device changes                    rateLimit/changesPerHour, over the last hour
+    mac/<user id>/<mac address>   attempts from that MAC            rateLimit/uniqueMacIntervalByHours
+
+Like the LoginHistory count it replaces, the MAC counter counts every attempt from the MAC, failed ones included.
+MACs are keyed in one canonical form, see mac_key.
+
+LoginHistory.log records every attempt, and DeviceMutation.succeed the device changes queued by write-behind logins.
+Buckets older than settings.RATE_LIMIT_RETENTION are pruned as attempts are recorded, at most once every
+PRUNE_INTERVAL seconds per process.
+"""
+import math
+import time
+from typing import Optional
+
+from django.conf import settings
+from netaddr import EUI, AddrFormatError
+
+from .models.rateCounter import RateCounter
+from .models.user import User
+
+BUCKET = 300
+PRUNE_INTERVAL = 600.0
+
+_last_prune = -math.inf
+
+
+def _bucket(now: float) -> int:
+    return int(now) // BUCKET * BUCKET
+
+
+def _since(now: float, seconds: float) -> int:
+    return _bucket(now - seconds)
+
+
+def mac_key(user_id: int, mac_address) -> str:
+    """Key of the MAC counter. LoginHistory and the session hold MACs in different dialects, so they are normalized."""
+    try:
+        mac_address = EUI(str(mac_address))
+    except (AddrFormatError, TypeError, ValueError):
+        pass
+    return f'mac/{user_id}/{mac_address}'
+
+
+def record_attempt(user: User, mac_address: Optional[str], logged_in: bool, mac_updated: bool,
+                   now: Optional[float] = None):
+    now = time.time() if now is None else now
+    bucket = _bucket(now)
+    if not logged_in:
+        RateCounter.hit(f'failed/{user.pk}', bucket)
+    if mac_updated:
+        record_change(user, now)
+    RateCounter.hit(mac_key(user.pk, mac_address), bucket)
+    prune(now)
+
+
+def record_change(user: User, now: Optional[float] = None):
+    """Counts a device change. Registrations queued by a write-behind login only count once they are written."""
+    now = time.time() if now is None else now
+    RateCounter.hit(f'changes/{user.pk}', 0)
+    RateCounter.hit(f'recentChanges/{user.pk}', _bucket(now))
+
+
+def failed_attempts(user: User, now: Optional[float] = None) -> int:
+    """Failed attempts over the last hour"""
+    now = time.time() if now is None else now
+    key = f'failed/{user.pk}'
+    return RateCounter.totals({key: _since(now, 3600)})[key]
+
+
+def device_changes(user: User, mac_address: Optional[str], mac_interval_hours: float,
+                   now: Optional[float] = None) -> tuple[int, int, int]:
+    """Device changes ever, over the last hour, and attempts from `mac_address` over the last `mac_interval_hours`"""
+    now = time.time() if now is None else now
+    keys = f'changes/{user.pk}', f'recentChanges/{user.pk}', mac_key(user.pk, mac_address)
+    totals = RateCounter.totals(dict(zip(keys, (0, _since(now, 3600), _since(now, mac_interval_hours * 3600)))))
+    return totals[keys[0]], totals[keys[1]], totals[keys[2]]
+
+
+def prune(now: Optional[float] = None, force: bool = False):
+    global _last_prune
+    now = time.time() if now is None else now
+    if force or time.monotonic() - _last_prune >= PRUNE_INTERVAL:
+        _last_prune = time.monotonic()
+        RateCounter.prune(_since(now, settings.RATE_LIMIT_RETENTION))
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Permissions, PermissionsVersion
+
+
+@receiver(post_save, sender=Permissions)
+@receiver(post_delete, sender=Permissions)
+def permissions_changed(sender, **kwargs):
+    # In the transaction of the change, so other processes see the new version together with the new rows
+    PermissionsVersion.bump()
+    Permissions.objects.tree.invalidate()
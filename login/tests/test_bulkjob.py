@@ -0,0 +1,26 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from login.models import BulkJob
+
+
+class FailStaleTests(TestCase):
+    def test_fails_jobs_whose_worker_stopped(self):
+        old = timezone.now() - BulkJob.stale_after * 2
+        dead = BulkJob.objects.create(action='test', status=BulkJob.Status.RUNNING, heartbeat=old)
+        never_started = BulkJob.objects.create(action='test', created=old)
+        alive = BulkJob.objects.create(action='test', status=BulkJob.Status.RUNNING, heartbeat=timezone.now())
+        queued = BulkJob.objects.create(action='test')
+
+        out = StringIO()
+        call_command('failstalejobs', stdout=out)
+
+        self.assertIn('Marked 2', out.getvalue())
+        statuses = dict(BulkJob.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[dead.pk], BulkJob.Status.FAILED)
+        self.assertEqual(statuses[never_started.pk], BulkJob.Status.FAILED)
+        self.assertEqual(statuses[alive.pk], BulkJob.Status.RUNNING)
+        self.assertEqual(statuses[queued.pk], BulkJob.Status.PENDING)
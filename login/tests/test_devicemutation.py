@@ -0,0 +1,126 @@
+import datetime
+import json
+from unittest import mock
+
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import IntegrityError, transaction
+from django.db.models import QuerySet
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from interface.writebehind import DeviceQueueWorker
+from login import ratelimit
+from login.models import DeviceMutation, LoginHistory, User, UserType
+from login.views import result
+
+MAC = '00:16:3e:00:00:01'
+
+
+class DeviceMutationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', UserType.objects.create(name='Student'), 'password')
+
+    def enqueue(self, mac_address: str = MAC, **kwargs) -> DeviceMutation:
+        return DeviceMutation.enqueue(mac_address, self.user, 'alice', None, None, None, **kwargs)
+
+    def test_claim_skips_locked_rows(self):
+        self.enqueue()
+
+        with mock.patch.object(QuerySet, 'select_for_update', autospec=True,
+                               side_effect=QuerySet.select_for_update) as select_for_update:
+            DeviceMutation.claim(10)
+
+        self.assertEqual(select_for_update.call_args.kwargs, {'skip_locked': True})
+
+    def test_claimed_jobs_are_not_claimed_again(self):
+        job = self.enqueue()
+
+        self.assertEqual([claimed.pk for claimed in DeviceMutation.claim(10)], [job.pk])
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeviceMutation.Status.RUNNING)
+        self.assertEqual(DeviceMutation.claim(10), [])
+
+    def test_stale_jobs_are_claimed_again_after_the_lease(self):
+        job = self.enqueue()
+        DeviceMutation.claim(10)
+
+        DeviceMutation.objects.filter(pk=job.pk).update(claimed_at=timezone.now() - DeviceMutation.lease
+                                                        - datetime.timedelta(seconds=1))
+
+        self.assertEqual([claimed.pk for claimed in DeviceMutation.claim(10)], [job.pk])
+
+    def test_running_mac_is_not_claimed_twice(self):
+        self.enqueue()
+        DeviceMutation.claim(10)
+        waiting = self.enqueue()
+        other = self.enqueue('00:16:3e:00:00:02')
+
+        self.assertEqual([claimed.pk for claimed in DeviceMutation.claim(10)], [other.pk])
+        self.assertEqual(DeviceMutation.objects.get(pk=waiting.pk).status, DeviceMutation.Status.PENDING)
+
+    def test_one_pending_job_per_mac(self):
+        first = self.enqueue()
+        second = self.enqueue()
+
+        self.assertEqual(first.pk, second.pk)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            DeviceMutation.objects.create(mac_address=MAC, user=self.user, visitor_name='alice')
+
+    def test_failed_job_is_superseded_by_a_newer_one(self):
+        self.enqueue()
+        job = DeviceMutation.claim(10)[0]
+        newer = self.enqueue()
+
+        job.fail('timeout', retry_in=datetime.timedelta(seconds=2))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeviceMutation.Status.FAILED)
+        self.assertEqual(job.last_error, 'superseded: timeout')
+        self.assertEqual(DeviceMutation.objects.get(pk=newer.pk).status, DeviceMutation.Status.PENDING)
+
+    @override_settings(CLEARPASS_API={'QUEUE_BATCH': 10, 'QUEUE_MAX_ATTEMPTS': 3, 'QUEUE_BACKOFF': 2})
+    def test_retries_back_off_then_give_up(self):
+        worker = DeviceQueueWorker(access=mock.Mock())
+        self.enqueue()
+
+        for attempt, delay in enumerate((2, 4)):
+            job = DeviceMutation.claim(10)[0]
+            before = timezone.now()
+            worker._failed(job, 'timeout', permanent=False)
+
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (DeviceMutation.Status.PENDING, attempt + 1))
+            self.assertGreaterEqual(job.next_attempt, before + datetime.timedelta(seconds=delay))
+            self.assertEqual(DeviceMutation.claim(10), [])  # Not due yet
+            DeviceMutation.objects.filter(pk=job.pk).update(next_attempt=timezone.now())
+
+        job = DeviceMutation.claim(10)[0]
+        worker._failed(job, 'timeout', permanent=False)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (DeviceMutation.Status.FAILED, 3))
+        self.assertIsNotNone(job.finished)
+
+    def test_change_is_logged_once_written(self):
+        history = LoginHistory.objects.create(user=self.user, mac_address=MAC, ip='127.0.0.1', host='',
+                                              logged_in=True)
+        job = self.enqueue(history=history)
+        self.assertEqual(ratelimit.device_changes(self.user, MAC, 18)[0], 0)
+
+        DeviceMutation.claim(10)[0].succeed()
+
+        history.refresh_from_db()
+        self.assertTrue(history.mac_updated)
+        self.assertEqual(ratelimit.device_changes(self.user, MAC, 18)[0], 1)
+        self.assertEqual(DeviceMutation.objects.get(pk=job.pk).status, DeviceMutation.Status.DONE)
+
+    def test_status_of_a_deleted_job_stops_polling(self):
+        request = RequestFactory().get('/success/status')
+        request.session = SessionStore()
+        request.session['device_mutation'] = 0
+
+        response = result.SuccessStatus.as_view()(request)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('error_url', json.loads(response.content))
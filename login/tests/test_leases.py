@@ -0,0 +1,104 @@
+import os
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from login import leases
+from login.leases import LeaseIndex, LeaseStore, parse_lease
+
+LEASE = '1893456000 00:16:3e:00:00:01 10.0.0.1 laptop 01:00:16:3e:00:00:01\n'
+OTHER = '1893456000 00:16:3e:00:00:02 10.0.0.2 * *\n'
+
+
+class LeaseTestCase(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'dnsmasq.leases'
+        self.mtime = 1_700_000_000
+        self.write(LEASE)
+        self.now = 1000.0
+        patcher = mock.patch.object(leases, 'time', mock.Mock(monotonic=lambda: self.now))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, *lines: str):
+        self.path.write_text(''.join(lines))
+        # Rewrites of the same size within one mtime tick would keep the signature
+        self.mtime += 1
+        os.utime(self.path, (self.mtime, self.mtime))
+
+
+class LeaseIndexTests(LeaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.index = LeaseIndex(self.path, min_rebuild_interval=1.0)
+
+    def test_lookup(self):
+        self.assertEqual(self.index.get('10.0.0.1'), parse_lease(LEASE))
+        self.assertEqual(self.index.get('10.0.0.1').hostname, 'laptop')
+        self.assertIsNone(self.index.get('10.0.0.9'))
+
+    def test_refresh_only_rebuilds_a_changed_file(self):
+        self.assertTrue(self.index.refresh())
+        self.assertFalse(self.index.refresh())
+
+        self.write(LEASE, OTHER)
+
+        self.assertTrue(self.index.refresh())
+        self.assertEqual(len(self.index), 2)
+
+    def test_changes_are_read_after_the_rebuild_interval(self):
+        self.index.get('10.0.0.1')
+        self.write(LEASE.replace('laptop', 'phone'))
+
+        self.assertEqual(self.index.get('10.0.0.1').hostname, 'laptop')
+        self.now += 1
+        self.assertEqual(self.index.get('10.0.0.1').hostname, 'phone')
+
+    def test_unknown_ip_is_read_at_once(self):
+        self.index.get('10.0.0.1')
+        self.write(LEASE, OTHER)
+
+        self.assertEqual(self.index.get('10.0.0.2').mac, '00:16:3e:00:00:02')
+
+    def test_deleted_file_empties_the_index(self):
+        self.index.get('10.0.0.1')
+        self.path.unlink()
+        self.now += 1
+
+        self.assertIsNone(self.index.get('10.0.0.1'))
+        self.assertEqual(len(self.index), 0)
+
+
+class LeaseStoreTests(LeaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = LeaseStore(self.path.with_name('leases.sqlite3'), fallback=LeaseIndex(self.path))
+
+    def test_lookup(self):
+        writer = self.store.connect(readonly=False)
+        self.addCleanup(writer.close)
+        self.store.add(writer, parse_lease(OTHER))
+
+        self.assertEqual(self.store.get('10.0.0.2').mac, '00:16:3e:00:00:02')
+        self.assertIsNone(self.store.get('10.0.0.1'))
+
+    def test_missing_store_falls_back_to_the_lease_file(self):
+        with self.assertLogs('Leases', 'WARNING'):
+            self.assertEqual(self.store.get('10.0.0.1'), parse_lease(LEASE))
+
+    def test_locked_store_falls_back_to_the_lease_file(self):
+        writer = self.store.connect(readonly=False)
+        self.addCleanup(writer.close)
+        self.store.add(writer, parse_lease(OTHER))
+        self.store.get('10.0.0.2')
+        writer.execute('BEGIN EXCLUSIVE')
+        self.addCleanup(writer.execute, 'ROLLBACK')
+
+        with self.assertLogs('Leases', 'WARNING') as logs:
+            self.assertEqual(self.store.get('10.0.0.1'), parse_lease(LEASE))
+
+        self.assertIn('locked', logs.output[0])
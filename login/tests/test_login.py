@@ -0,0 +1,87 @@
+import math
+import time
+from unittest import mock
+
+import httpx
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import RequestFactory, TestCase, override_settings
+
+from interface.wrapper import ResponseData
+from login import ratelimit
+from login.models import DeviceMutation, LoginHistory, Permissions, User, UserType
+from login.utils import MACAddress
+from login.views import login
+
+
+@override_settings(DEBUG=True)
+@mock.patch.object(login.access, 'replace_oldest_device', return_value=None)
+@mock.patch.object(login.access, 'add_device',
+                   return_value=ResponseData(201, httpx.Response(201, json={'id': 1, 'mac': '00-16-3E-00-00-01'})))
+class LoginTests(TestCase):
+    fixtures = ['default_userTypes', 'default_permissions']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', UserType.objects.get(name='Student'), 'password')
+
+    def setUp(self):
+        # Keeps the rate limit counters in one bucket, so a test never creates one more bucket row than another
+        frozen = mock.patch.object(ratelimit.time, 'time', return_value=time.time())
+        frozen.start()
+        self.addCleanup(frozen.stop)
+        # Counts queries between PermissionsVersion checks: the tree is loaded by the first post and not checked again
+        unchecked = mock.patch.object(Permissions.objects.tree, '_check_interval', math.inf)
+        unchecked.start()
+        self.addCleanup(unchecked.stop)
+        Permissions.objects.tree.invalidate()
+
+        self.session = SessionStore()
+        self.session['mac_address'] = MACAddress('00:16:3e:00:00:01')
+        self.session.save()
+
+    def post(self, password: str):
+        request = RequestFactory().post('/login/student', {'username': 'alice', 'password': password})
+        request.session = SessionStore(self.session.session_key)
+        return login.Login.as_view()(request, usertype='student')
+
+    def test_successful_login_queries(self, add_device, replace_oldest_device):
+        self.post('password')  # Loads the PermissionTree
+
+        with self.assertNumQueries(9):
+            response = self.post('password')
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, '/success/')
+        add_device.assert_called()
+        self.assertTrue(LoginHistory.objects.filter(user=self.user, logged_in=True).exists())
+
+    def test_failed_login_queries(self, add_device, replace_oldest_device):
+        self.post('wrong')  # Loads the PermissionTree
+
+        with self.assertNumQueries(6):
+            response = self.post('wrong')
+
+        self.assertEqual(response.status_code, 200)
+        add_device.assert_not_called()
+        self.assertTrue(LoginHistory.objects.filter(user=self.user, logged_in=False).exists())
+
+    def test_same_mac_rate_limited(self, add_device, replace_oldest_device):
+        # Past changesUntilOldUser, a MAC registered within uniqueMacIntervalByHours cannot be registered again
+        for _ in range(4):
+            ratelimit.record_attempt(self.user, str(self.session['mac_address']), logged_in=True, mac_updated=True)
+
+        response = self.post('password')
+
+        self.assertEqual(response.status_code, 200)
+        add_device.assert_not_called()
+
+    def test_write_behind_logs_the_change_once_written(self, add_device, replace_oldest_device):
+        with override_settings(CLEARPASS_API={**settings.CLEARPASS_API, 'WRITE_BEHIND': True}):
+            response = self.post('password')
+
+        self.assertEqual(response.url, '/success/')
+        add_device.assert_not_called()
+        job = DeviceMutation.objects.get()
+        self.assertFalse(job.history.mac_updated)
+        self.assertEqual(ratelimit.device_changes(self.user, str(self.session['mac_address']), 18)[0], 0)
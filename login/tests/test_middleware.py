@@ -0,0 +1,51 @@
+import asyncio
+import zoneinfo
+
+from asgiref.sync import async_to_sync
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from login.middleware import TimezoneMiddleware
+from login.models import Permissions
+from login.models.permissions import Datatype
+
+
+def current_zone(request):
+    return HttpResponse(str(timezone.get_current_timezone()))
+
+
+async def async_current_zone(request):
+    return current_zone(request)
+
+
+class TimezoneMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Permissions.objects.create(permission='global/localTimezone', raw_value='Asia/Tokyo', type=Datatype.STRING)
+
+    def setUp(self):
+        Permissions.objects.tree.invalidate()
+        self.addCleanup(timezone.deactivate)
+        self.request = RequestFactory().get('/')
+
+    def test_sync(self):
+        middleware = TimezoneMiddleware(current_zone)
+
+        self.assertFalse(asyncio.iscoroutinefunction(middleware))
+        self.assertEqual(middleware(self.request).content, b'Asia/Tokyo')
+
+    def test_async(self):
+        middleware = TimezoneMiddleware(async_current_zone)
+
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        self.assertEqual(async_to_sync(middleware)(self.request).content, b'Asia/Tokyo')
+
+    def test_unknown_zone_uses_the_default(self):
+        Permissions.objects.filter(permission__iexact='global/localTimezone').update(raw_value='Nowhere/Atlantis')
+        Permissions.objects.tree.invalidate()
+
+        with self.assertLogs('TimezoneMiddleware', 'ERROR'):
+            response = TimezoneMiddleware(current_zone)(self.request)
+
+        self.assertEqual(response.content, str(zoneinfo.ZoneInfo(timezone.get_default_timezone_name())).encode())
@@ -0,0 +1,64 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from login.models import Permissions, User, UserType
+from login.models.permissions import Datatype
+from login.utils import NetworkAllowlist
+
+
+class GetBulkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = UserType.objects.create(name='Student')
+        cls.alice = User.objects.create_user('alice', cls.student, 'password')
+        cls.bob = User.objects.create_user('bob', cls.student, 'password')
+
+        for node, value in [
+            ('global/deviceLimit', '10'),
+            ('userType/student/deviceLimit', '5'),
+            ('user/alice/deviceLimit', '2'),
+            ('global/maxAttempts', '3'),
+            # Nodes are case-insensitive
+            ('USERTYPE/Student/maxAttempts', '4'),
+        ]:
+            Permissions.objects.create(permission=node, raw_value=value, type=Datatype.INTEGER)
+
+    def resolve(self, **kwargs) -> dict[str, int]:
+        with self.assertNumQueries(1):
+            return {perm.suffix.lower(): perm.value for perm in Permissions.objects.get_bulk(**kwargs)}
+
+    def test_user_overrides_user_type_and_global(self):
+        self.assertEqual(self.resolve(user=self.alice), {'devicelimit': 2, 'maxattempts': 4})
+
+    def test_user_type_overrides_global(self):
+        self.assertEqual(self.resolve(user=self.bob), {'devicelimit': 5, 'maxattempts': 4})
+
+    def test_global_only(self):
+        self.assertEqual(self.resolve(), {'devicelimit': 10, 'maxattempts': 3})
+
+    def test_skipped_levels_do_not_override(self):
+        self.assertEqual(self.resolve(user=self.alice, query_user=False), {'devicelimit': 5, 'maxattempts': 4})
+        self.assertEqual(self.resolve(usertype=self.student, query_group=False), {'devicelimit': 10, 'maxattempts': 3})
+
+
+class NetworkAllowlistTests(TestCase):
+    def setUp(self):
+        Permissions.objects.tree.invalidate()
+        self.allowlist = NetworkAllowlist()
+
+    def test_missing_global_scope_is_compiled_once(self):
+        with mock.patch.object(NetworkAllowlist, '_compile', wraps=self.allowlist._compile) as compile_:
+            self.assertIn('192.0.2.1', self.allowlist)
+            self.assertIn('192.0.2.1', self.allowlist)
+
+        compile_.assert_called_once()
+
+    def test_compiled_again_when_the_tree_is_reloaded(self):
+        self.assertIn('192.0.2.1', self.allowlist)
+
+        Permissions.objects.create(permission='global/loginIPRestriction', raw_value='10.0.0.0/8',
+                                   type=Datatype.IPNetwork)
+
+        self.assertNotIn('192.0.2.1', self.allowlist)
+        self.assertIn('10.1.2.3', self.allowlist)
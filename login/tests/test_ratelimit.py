@@ -0,0 +1,53 @@
+import importlib
+import time
+
+from django.apps import apps
+from django.test import TestCase
+
+from login import ratelimit
+from login.models import LoginHistory, RateCounter, User, UserType
+from login.utils import MACAddress
+
+backfill = importlib.import_module('login.migrations.0007_ratecounter').backfill
+
+
+class RateLimitTests(TestCase):
+    mac = MACAddress('00:16:3e:00:00:01')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', UserType.objects.create(name='Student'), 'password')
+
+    def test_failed_attempts_count_towards_the_mac(self):
+        ratelimit.record_attempt(self.user, str(self.mac), logged_in=False, mac_updated=False)
+
+        self.assertEqual(ratelimit.failed_attempts(self.user), 1)
+        self.assertEqual(ratelimit.device_changes(self.user, str(self.mac), 18), (0, 0, 1))
+
+    def test_device_changes(self):
+        ratelimit.record_attempt(self.user, str(self.mac), logged_in=True, mac_updated=True)
+        ratelimit.record_attempt(self.user, '00:16:3e:00:00:02', logged_in=True, mac_updated=True)
+
+        self.assertEqual(ratelimit.device_changes(self.user, str(self.mac), 18), (2, 2, 1))
+
+    def test_mac_window(self):
+        now = time.time()
+        ratelimit.record_attempt(self.user, str(self.mac), logged_in=True, mac_updated=True, now=now - 2 * 3600)
+
+        self.assertEqual(ratelimit.device_changes(self.user, str(self.mac), 1, now=now)[2], 0)
+        self.assertEqual(ratelimit.device_changes(self.user, str(self.mac), 18, now=now)[2], 1)
+
+    def test_backfilled_history_is_read(self):
+        # LoginHistory returns MACs as 00:16:3e:00:00:01, the session as 00-16-3E-00-00-01
+        LoginHistory.objects.bulk_create([
+            LoginHistory(user=self.user, mac_address=str(self.mac), ip='127.0.0.1', host='', logged_in=True,
+                         mac_updated=True),
+            LoginHistory(user=self.user, mac_address=str(self.mac), ip='127.0.0.1', host='', logged_in=False,
+                         mac_updated=False),
+        ])
+        RateCounter.objects.all().delete()
+
+        backfill(apps, None)
+
+        self.assertEqual(ratelimit.device_changes(self.user, str(self.mac), 18), (1, 1, 2))
+        self.assertEqual(ratelimit.failed_attempts(self.user), 1)
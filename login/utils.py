@@ -1,21 +1,26 @@
+import asyncio
 import logging
 import random
 import re
 import time
 from datetime import datetime, timezone
 from functools import wraps
-from pathlib import Path
-from typing import Optional, TYPE_CHECKING
+from typing import Mapping, Optional, TYPE_CHECKING, Union
 
+import httpx
+from asgiref.sync import sync_to_async
 from django.core.exceptions import ValidationError
 from django.http import HttpRequest
 from django.conf import settings
 from django.shortcuts import redirect
 from django.urls import reverse
 from ipware import get_client_ip
-from netaddr import EUI, IPNetwork
+from netaddr import EUI, IPSet
 from django.db.utils import OperationalError
 
+from interface.exceptions import ClearPassError
+from interface.resilience import deadline
+from .leases import LeaseIndex, LeaseStore
 from .models import Permissions
 
 
@@ -32,19 +37,121 @@ class MACAddress(EUI):
         return self.words[0] & 0x2
 
 
-def restricted_network(view):
-    def wrapper(request: HttpRequest, *args, **kwargs):
+def async_aware(check):
+    """
+    Turns `check(request) -> Optional[HttpResponse]` into a view decorator. If the check returns a response, it is
+    returned in place of the view. Async views get an async wrapper, with the (database-touching) check run in a thread.
+    """
+    @wraps(check)
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            async def async_wrapper(request: HttpRequest, *args, **kwargs):
+                if (response := await sync_to_async(check)(request)) is not None:
+                    return response
+                return await view(request, *args, **kwargs)
+            return async_wrapper
+
+        def wrapper(request: HttpRequest, *args, **kwargs):
+            if (response := check(request)) is not None:
+                return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class NetworkAllowlist:
+    """
+    Networks allowed to log in, compiled into an IPSet from the global nodes of the PermissionTree.
+
+    Every `global/loginIPRestriction` node counts: the node itself and any below it (e.g.
+    `global/loginIPRestriction/guestVLAN`), so more networks are added as more nodes. The set is compiled again
+    whenever the tree was reloaded.
+    """
+    node = 'loginiprestriction'
+    _logger = logging.getLogger('NetworkAllowlist')
+
+    def __init__(self):
+        self._networks: Optional[IPSet] = None
+        self._source: Optional[Mapping] = None
+
+    def __contains__(self, ip) -> bool:
+        return ip in self.get()
+
+    def get(self) -> IPSet:
         try:
-            netwk = Permissions.objects.get_raw_nodes('global/loginIPRestriction').first().value
+            nodes = Permissions.objects.tree.scope('global')
         except OperationalError:
-            netwk = IPNetwork('0.0.0.0/0')
+            # Not migrated yet
+            return IPSet(['0.0.0.0/0'])
+        # A reloaded tree is a new dict. A missing scope is always the same empty mapping, so it is compiled once.
+        if nodes is not self._source:
+            self._networks, self._source = self._compile(nodes), nodes
+        return self._networks
+
+    def _compile(self, nodes: Mapping) -> IPSet:
+        networks = IPSet(value for node, value in nodes.items()
+                         if node == self.node or node.startswith(f'{self.node}/'))
+        if not networks:
+            self._logger.warning('No global/loginIPRestriction node, every network is allowed')
+            return IPSet(['0.0.0.0/0'])
+        return networks
+
+
+_allowlist = NetworkAllowlist()
+
+
+def get_allowlist() -> NetworkAllowlist:
+    return _allowlist
+
+
+@async_aware
+def restricted_network(request: HttpRequest):
+    client_ip, routable = get_client_ip(request)
+    if not settings.DEBUG and (client_ip is None or client_ip not in get_allowlist()):
+        return redirect(f'{reverse("error")}?reason=wrongNetwork')
+
+
+def clearpass_fallback(view):
+    """
+    Runs the view within the ClearPass time budget (CLEARPASS_API['REQUEST_BUDGET']). If ClearPass is down, slow or
+    refusing the token, the user is sent to the error page instead of getting a 500.
+    """
+    def fallback(err: Exception):
+        logging.getLogger('CPPMFallback').error(f'ClearPass unavailable: {err!r}')
+        return redirect(f'{reverse("error")}?reason=clearpassAPI')
+
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request: HttpRequest, *args, **kwargs):
+            try:
+                with deadline(settings.CLEARPASS_API['REQUEST_BUDGET']):
+                    return await view(request, *args, **kwargs)
+            except (ClearPassError, httpx.HTTPError) as err:
+                return fallback(err)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request: HttpRequest, *args, **kwargs):
+        try:
+            with deadline(settings.CLEARPASS_API['REQUEST_BUDGET']):
+                return view(request, *args, **kwargs)
+        except (ClearPassError, httpx.HTTPError) as err:
+            return fallback(err)
+    return wrapper
 
-        client_ip, routable = get_client_ip(request)
-        if not settings.DEBUG and client_ip not in netwk:
-            return redirect(f'{reverse("error")}?reason=wrongNetwork')
 
-        return view(request, *args, **kwargs)
-    return wrapper
+_leases: Union[LeaseIndex, LeaseStore, None] = None
+
+
+def get_leases() -> Union[LeaseIndex, LeaseStore]:
+    """The store dnsmasq pushes lease events to if there is one, backed by the lease file. The lease file otherwise."""
+    global _leases
+    if _leases is None:
+        if settings.DNSMASQ_LEASE_STORE:
+            _leases = LeaseStore(settings.DNSMASQ_LEASE_STORE, fallback=LeaseIndex(settings.DNSMASQ_LEASE_FILE))
+        else:
+            _leases = LeaseIndex(settings.DNSMASQ_LEASE_FILE, watch=settings.DNSMASQ_WATCH_LEASES)
+    return _leases
 
 
 def attach_mac_to_session(view):
@@ -53,13 +160,9 @@ def attach_mac_to_session(view):
 
         # TODO: Remove reliance on dnsmasq running on same server??
 
-        def get_mac(ip: str) -> MACAddress:
-            if (lease_file := Path('/var/lib/misc/dnsmasq.leases')).is_file():
-                with open(lease_file) as fp:
-                    for cnt, line in enumerate(fp):
-                        line = line.strip().split(maxsplit=4)
-                        if line[2] == ip:
-                            return MACAddress(line[1])
+        def get_mac(ip: str) -> Optional[MACAddress]:
+            if (lease := get_leases().get(ip)) is not None:
+                return MACAddress(lease.mac)
 
         start = time.perf_counter()
         client_ip, routable = get_client_ip(request)
@@ -80,17 +183,15 @@ def attach_mac_to_session(view):
     return wrapper
 
 
-def check_mac_redirect(view):
-    def wrapper(request: HttpRequest, *args, **kwargs):
-        macaddr = request.session['mac_address']
-
-        if macaddr is None:
-            return redirect(f'{reverse("error")}?reason=unknownMAC')
-        if macaddr.is_locally_administered:
-            return redirect(reverse('instructions'))
+@async_aware
+def check_mac_redirect(request: HttpRequest):
+    # Also loads the session, so async views can read it afterwards without touching the database
+    macaddr = request.session['mac_address']
 
-        return view(request, *args, **kwargs)
-    return wrapper
+    if macaddr is None:
+        return redirect(f'{reverse("error")}?reason=unknownMAC')
+    if macaddr.is_locally_administered:
+        return redirect(reverse('instructions'))
 
 
 def mutually_exclusive(keyword, *keywords):
@@ -1,5 +1,5 @@
 from .homepage import Index, Instructions
-from .result import Success, Error
+from .result import Success, SuccessStatus, Error
 from .debug import Debug
-from .login import Login
-from .internal import InternalBulkUserUpload
+from .login import Login, AsyncLogin
+from .internal import InternalBulkUserUpload, InternalMetrics
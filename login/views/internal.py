@@ -1,8 +1,9 @@
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import HttpRequest, JsonResponse
+from django.http import HttpRequest, HttpResponse, JsonResponse
 from django.utils.decorators import method_decorator
 from django.views import View
 
+from interface.api import Token
 from login.forms import UserBulkImportForm
 
 
@@ -19,4 +20,12 @@ class InternalBulkUserUpload(View):
         return JsonResponse({
             'status': 'ok',
             'count': form.write_data(validated=True),
-        })
\ No newline at end of file
+        })
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class InternalMetrics(View):
+    """ClearPass client metrics of all workers, in the Prometheus text format"""
+
+    def get(self, request: HttpRequest, *args, **kwargs):
+        return HttpResponse(Token.get_metrics().render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,6 +1,7 @@
 import datetime
 from typing import Optional, TYPE_CHECKING
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.shortcuts import render, redirect
 from django.urls import reverse
@@ -9,21 +10,22 @@ from django.http import HttpRequest
 from django.utils import timezone
 from django.utils.decorators import method_decorator
 
+from login.context import UserContext
 from login.forms import UserLoginForm
-from login.models import LoginHistory
-from login.utils import MACAddress, restricted_network, check_mac_redirect
+from login.models import DeviceMutation, LoginHistory, User
+from login.utils import MACAddress, restricted_network, check_mac_redirect, clearpass_fallback
 import interface.api as api
 
 if TYPE_CHECKING:
     from login.models.permissions import WhenType
 
-# TODO: Show error if clearpass errors
 # TODO: Ability to select which device to replace if more than 1 device allowed.
 
 access = api.Token()
+async_access = api.AsyncToken()
 
 
-@method_decorator([restricted_network, check_mac_redirect], name='dispatch')
+@method_decorator([restricted_network, check_mac_redirect, clearpass_fallback], name='dispatch')
 class Login(View):
     template_name = 'login/login.html'
     help_template = {
@@ -37,54 +39,151 @@ class Login(View):
         if not settings.DEBUG and access.get_device(mac=request.session['mac_address']).status_code != 404:
             return redirect(f'{reverse("error")}?reason=alreadyRegistered')
 
-        return render(request, self.template_name, {
-            'usertype': usertype,
-            'help_template': self.help_template[usertype],
-            'form': UserLoginForm(user_type=usertype),
-        })
+        return self.render_form(request, usertype, UserLoginForm(user_type=usertype))
 
     def post(self, request: HttpRequest, usertype: str, *args, **kwargs):
         form = UserLoginForm(request=request, user_type=usertype, data=request.POST)
         mac_addr: MACAddress = request.session['mac_address']
 
         # Check whether the user has the correct password or is being rate limited
-        if not form.is_valid():
-            LoginHistory.log(request=request, user=form.cleaned_data.get('username'), mac_address=mac_addr,
-                             logged_in=form.password_correct)
-            return render(request, self.template_name, {
-                'usertype': usertype,
-                'help_template': self.help_template[usertype],
-                'form': form
-            })
+        if not self.check_login(request, form, mac_addr):
+            return self.render_form(request, usertype, form)
 
         # Grab Data
         user = form.user_cache
         device_name = form.cleaned_data.get('device_name')
 
-        # Save last login data
-        user.last_login = timezone.now()
-        user.save(update_fields=["last_login"])
+        device_limit, clearpass_name = self.device_policy(form.user_context)
 
-        # Check how many devices the user has. If it exceeds how many they should have, replace the earliest device.
-        if (device_limit := user.get_permission('deviceLimit')) == 0:
+        # If the user is at their device limit, their earliest device is replaced instead of adding one.
+        if device_limit == 0:
             return redirect(f'{reverse("error")}?reason=restricted')
 
+        if settings.CLEARPASS_API['WRITE_BEHIND']:
+            return self.queue_registration(request, form.user_context, mac_addr, device_name, device_limit,
+                                           clearpass_name)
+
         elif device_limit is not None:
-            clearpass_user = access.get_device(username=user.clearpass_name)
-            if clearpass_user is not None and len(clearpass_user.device) >= device_limit:
-                clearpass_user.device.sort(key=lambda x: x['start_time'])
-                access.update_device(device_id=clearpass_user.device[0]['id'], updated_fields={
-                    'mac': str(mac_addr),
-                    'notes': device_name,
-                })
-                LoginHistory.log(request=request, user=user, mac_address=mac_addr, logged_in=True, mac_updated=True)
-                return redirect(reverse('success'))
+            replaced = access.replace_oldest_device(clearpass_name, mac_addr, device_name, device_limit)
+            if replaced is not None:
+                # An error status raises ClearPassError, which clearpass_fallback sends to the error page
+                replaced.raise_for_status()
+                return self.device_registered(request, user, mac_addr)
 
         # If the user does not exist, or if limit not exceeded, create a new device, following the expireTime rules.
-        when: WhenType = user.get_permission('expireTime', default=None)
-        expire_time: Optional[datetime] = when.as_datetime(timezone.now()) if when is not None else None
+        access.add_device(mac=mac_addr, username=clearpass_name, device_name=device_name,
+                          time=self.expire_time(form.user_context)).raise_for_status()
+        return self.device_registered(request, user, mac_addr)
 
-        access.add_device(mac=mac_addr, username=user.clearpass_name, device_name=device_name, time=expire_time)
-        LoginHistory.log(request=request, user=user, mac_address=mac_addr, logged_in=True, mac_updated=True)
+    # Steps shared with AsyncLogin. These touch the database, so AsyncLogin runs them in a thread.
+
+    def render_form(self, request: HttpRequest, usertype: str, form: UserLoginForm):
+        return render(request, self.template_name, {
+            'usertype': usertype,
+            'help_template': self.help_template[usertype],
+            'form': form
+        })
+
+    @staticmethod
+    def check_login(request: HttpRequest, form: UserLoginForm, mac_addr: MACAddress) -> bool:
+        """Validates the form, logging failed attempts, and saves the last login time on success"""
+        if not form.is_valid():
+            LoginHistory.log(request=request, user=form.cleaned_data.get('username'), mac_address=mac_addr,
+                             logged_in=form.password_correct)
+            return False
+
+        # Save last login data
+        user = form.user_cache
+        user.last_login = timezone.now()
+        user.save(update_fields=["last_login"])
+        return True
+
+    @staticmethod
+    def device_policy(context: UserContext) -> tuple[Optional[int], str]:
+        return context.get_permission('deviceLimit'), context.user.clearpass_name
+
+    @staticmethod
+    def expire_time(context: UserContext) -> Optional[datetime.datetime]:
+        when: WhenType = context.get_permission('expireTime', default=None)
+        return when.as_datetime(timezone.now()) if when is not None else None
+
+    def queue_registration(self, request: HttpRequest, context: UserContext, mac_addr: MACAddress,
+                           device_name: Optional[str], device_limit: Optional[int], clearpass_name: str):
+        """
+        Leaves the ClearPass calls to `manage.py devicequeue`. The success page polls until they are done.
+        The login is logged without mac_updated, the job sets it once ClearPass has the device.
+        """
+        history = LoginHistory.log(request=request, user=context.user, mac_address=mac_addr, logged_in=True)
+        job = DeviceMutation.enqueue(str(mac_addr), context.user, clearpass_name, device_name, device_limit,
+                                     self.expire_time(context), history)
+        request.session['device_mutation'] = job.pk
+        return redirect(reverse('success'))
 
+    @staticmethod
+    def device_registered(request: HttpRequest, user: User, mac_addr: MACAddress):
+        LoginHistory.log(request=request, user=user, mac_address=mac_addr, logged_in=True, mac_updated=True)
+        request.session.pop('device_mutation', None)
         return redirect(reverse('success'))
+
+
+@method_decorator([restricted_network, check_mac_redirect, clearpass_fallback], name='dispatch')
+class AsyncLogin(Login):
+    """
+    Login, with ClearPass calls awaited on the event loop instead of blocking a worker.
+    Served instead of Login when running under ASGI (see settings.ASYNC_VIEWS).
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Django 4.0 only awaits views that are coroutine functions
+        view = super().as_view(**initkwargs)
+
+        async def async_view(request: HttpRequest, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        async_view.__dict__.update(view.__dict__)
+        return async_view
+
+    async def dispatch(self, request: HttpRequest, *args, **kwargs):
+        # Skip Login.dispatch, its decorators are the blocking variants
+        response = View.dispatch(self, request, *args, **kwargs)
+        if hasattr(response, '__await__'):
+            response = await response
+        return response
+
+    async def get(self, request: HttpRequest, usertype: str, *args, **kwargs):
+        if not settings.DEBUG and \
+                (await async_access.get_device(mac=request.session['mac_address'])).status_code != 404:
+            return redirect(f'{reverse("error")}?reason=alreadyRegistered')
+
+        return await sync_to_async(self.render_form)(request, usertype, UserLoginForm(user_type=usertype))
+
+    async def post(self, request: HttpRequest, usertype: str, *args, **kwargs):
+        form = UserLoginForm(request=request, user_type=usertype, data=request.POST)
+        mac_addr: MACAddress = request.session['mac_address']
+
+        if not await sync_to_async(self.check_login)(request, form, mac_addr):
+            return await sync_to_async(self.render_form)(request, usertype, form)
+
+        user = form.user_cache
+        device_name = form.cleaned_data.get('device_name')
+
+        device_limit, clearpass_name = await sync_to_async(self.device_policy)(form.user_context)
+
+        if device_limit == 0:
+            return redirect(f'{reverse("error")}?reason=restricted')
+
+        if settings.CLEARPASS_API['WRITE_BEHIND']:
+            return await sync_to_async(self.queue_registration)(request, form.user_context, mac_addr, device_name,
+                                                                device_limit, clearpass_name)
+
+        elif device_limit is not None:
+            replaced = await async_access.replace_oldest_device(clearpass_name, mac_addr, device_name, device_limit)
+            if replaced is not None:
+                replaced.raise_for_status()
+                return await sync_to_async(self.device_registered)(request, user, mac_addr)
+
+        added = await async_access.add_device(mac=mac_addr, username=clearpass_name, device_name=device_name,
+                                              time=await sync_to_async(self.expire_time)(form.user_context))
+        added.raise_for_status()
+        return await sync_to_async(self.device_registered)(request, user, mac_addr)
@@ -1,16 +1,38 @@
-from django.http import HttpRequest, HttpResponse
+from django.http import HttpRequest, HttpResponse, JsonResponse
 from django.shortcuts import redirect, render
 from django.urls import reverse
 from django.views import View
 
 from enum import Enum, auto
 
+from login.models import DeviceMutation
+
 
 class Success(View):
     template_name = 'login/success.html'
 
     def get(self, request: HttpRequest):
-        return render(request, self.template_name)
+        return render(request, self.template_name, {
+            'registration_pending': 'device_mutation' in request.session,
+        })
+
+
+class SuccessStatus(View):
+    """Polled by the success page while the device registration queued by the login is written to ClearPass"""
+
+    def get(self, request: HttpRequest):
+        if (pk := request.session.get('device_mutation')) is None:
+            return JsonResponse({'status': DeviceMutation.Status.DONE})
+
+        status = DeviceMutation.objects.filter(pk=pk).values_list('status', flat=True).first()
+        if status is None:
+            # The job was deleted, so it will never finish. Stop the page polling.
+            return JsonResponse({'status': 'unknown', 'error_url': f'{reverse("error")}?reason=unknown'}, status=404)
+
+        response = {'status': status}
+        if status == DeviceMutation.Status.FAILED:
+            response['error_url'] = f'{reverse("error")}?reason=clearpassAPI'
+        return JsonResponse(response)
 
 
 class Error(View):